@@ -0,0 +1,325 @@
+# Benchmark of the alignment engines: fill and traceback time, cells per second and peak memory for random and
+# repetitive DNA of growing length. The results are written as JSON and can be compared with a stored baseline.
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+import sequence_alignment as sa
+
+# Scores used by every mode, as (match, mismatch, gap, gap opening)
+SCORES = (1, -1, -2, -3)
+
+# Modes that can be measured, with the maximum number of cells of the matrix they are run on by default. The modes
+# that can store the whole matrices are limited like the dense ones: a random pair widens the band to the whole
+# matrices, X-drop prunes nothing on it in local alignment and the seeds skip no cell of a repetitive pair
+MODES = {
+    'global-vectorized': 10 ** 8,
+    'global-loop': 10 ** 5,
+    'local-vectorized': 10 ** 8,
+    'local-loop': 10 ** 5,
+    'global-score': 10 ** 10,
+    'global-linear': 10 ** 9,
+    'local-linear': 10 ** 9,
+    'global-banded': 10 ** 8,
+    'global-affine': 10 ** 8,
+    'local-banded': 10 ** 8,
+    'local-affine': 10 ** 8,
+    'local-xdrop': 10 ** 8,
+    'local-seed': 10 ** 8,
+    'global-out-of-core': 10 ** 9,
+    'global-threads': 10 ** 8,
+    'local-threads': 10 ** 8,
+}
+if sa.NUMBA:
+    MODES.update({'global-numba': 10 ** 8, 'local-numba': 10 ** 8})
+
+# Results of a run on the reference machine, compared with the new ones by default
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# X-drop of the 'local-xdrop' mode
+XDROP = 20
+
+# Kinds of generated sequences
+KINDS = ('random', 'repetitive')
+
+# Lengths of the sequences measured by default
+LENGTHS = (100, 300, 1000, 3000, 10000, 30000, 100000)
+
+# Fraction of the characters changed in the second sequence of a pair
+MUTATION_RATE = 0.1
+
+
+def mutate(sequence, rng, rate=MUTATION_RATE):
+    """
+    Change, delete or insert characters of a DNA sequence
+    :param sequence: sequence to mutate
+    :param rng: NumPy random generator
+    :param rate: fraction of the characters that are changed
+    """
+    result = []
+    for character in sequence:
+        event = rng.random()
+        if event < rate / 3:
+            result.append('ACGT'[rng.integers(4)])
+        elif event < 2 * rate / 3:
+            continue
+        elif event < rate:
+            result.append(character)
+            result.append('ACGT'[rng.integers(4)])
+        else:
+            result.append(character)
+    return ''.join(result)
+
+
+def generate_pair(kind, length, seed=0):
+    """
+    Generate a pair of DNA sequences, the same for the same arguments.
+    'random' gives two unrelated uniform sequences, 'repetitive' a tandem repeat of a short unit with some mutations
+    and a mutated copy of it
+    :param kind: 'random' or 'repetitive'
+    :param length: length of the first sequence
+    :param seed: seed of the random generator
+    """
+    rng = np.random.default_rng([seed, KINDS.index(kind), length])
+    if kind == 'random':
+        return ''.join(rng.choice(list('ACGT'), length)), ''.join(rng.choice(list('ACGT'), length))
+    unit = ''.join(rng.choice(list('ACGT'), int(rng.integers(2, 12))))
+    sequence = mutate((unit * (length // len(unit) + 1))[:length], rng, MUTATION_RATE / 4)
+    return sequence, mutate(sequence, rng)
+
+
+def run_mode(mode, sequence1, sequence2):
+    """
+    Align two sequences in a mode, returning the number of cells computed, the time of the fill and the time of the
+    traceback of one alignment (None for the modes that have no separate traceback)
+    :param mode: one of MODES
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    """
+    m, s, g, o = SCORES
+    len1 = len(sequence1)
+    len2 = len(sequence2)
+    cells = len1 * len2
+    traceback_seconds = None
+    start = time.perf_counter()
+    if mode in ('global-vectorized', 'global-loop', 'global-numba'):
+        matrix, traceback = sa.compute_needleman_wunsch(m, s, g, sequence1, sequence2, 0, mode.split('-')[1])
+        fill_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        next(sa.path(sequence1, sequence2, traceback, len1, len2, matrix[len1, len2]))
+        traceback_seconds = time.perf_counter() - start
+    elif mode in ('local-vectorized', 'local-loop', 'local-numba'):
+        matrix, traceback = sa.compute_smith_waterman(m, s, g, sequence1, sequence2, 0, mode.split('-')[1])
+        fill_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        list(sa.traceback_smith_waterman(sequence1, sequence2, matrix, traceback, 0))
+        traceback_seconds = time.perf_counter() - start
+    elif mode == 'global-score':
+        sa.score_needleman_wunsch(m, s, g, sequence1, sequence2)
+        fill_seconds = time.perf_counter() - start
+    elif mode == 'global-linear':
+        sa.hirschberg(m, s, g, sequence1, sequence2)
+        fill_seconds = time.perf_counter() - start
+    elif mode == 'local-linear':
+        next(sa.smith_waterman_linear(m, s, g, sequence1, sequence2))
+        fill_seconds = time.perf_counter() - start
+    elif mode == 'global-banded':
+        matrix, traceback = sa.compute_needleman_wunsch_banded(m, s, g, sequence1, sequence2, 0)
+        fill_seconds = time.perf_counter() - start
+        cells = matrix.data.size if isinstance(matrix, sa.BandedMatrix) else matrix.size
+        start = time.perf_counter()
+        next(sa.path(sequence1, sequence2, traceback, len1, len2, matrix[len1, len2]))
+        traceback_seconds = time.perf_counter() - start
+    elif mode == 'global-affine':
+        matrix, traceback = sa.compute_needleman_wunsch_affine(m, s, o, g, sequence1, sequence2, 0)
+        fill_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        next(sa.path_affine(sequence1, sequence2, traceback, len1, len2, matrix[len1, len2]))
+        traceback_seconds = time.perf_counter() - start
+    elif mode == 'local-banded':
+        matrix, traceback = sa.compute_smith_waterman_banded(m, s, g, sequence1, sequence2, 0)
+        fill_seconds = time.perf_counter() - start
+        cells = matrix.data.size if isinstance(matrix, sa.BandedMatrix) else matrix.size
+        start = time.perf_counter()
+        list(sa.traceback_smith_waterman(sequence1, sequence2, matrix, traceback, 0))
+        traceback_seconds = time.perf_counter() - start
+    elif mode == 'local-affine':
+        matrix, traceback = sa.compute_smith_waterman_affine(m, s, o, g, sequence1, sequence2, 0)
+        fill_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        list(sa.traceback_smith_waterman(sequence1, sequence2, matrix, traceback, 0, trace=sa.path_affine))
+        traceback_seconds = time.perf_counter() - start
+    elif mode == 'local-xdrop':
+        matrix, traceback, _, cells = sa.compute_smith_waterman_xdrop(m, s, g, sequence1, sequence2, 0, XDROP)
+        fill_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        list(sa.traceback_smith_waterman(sequence1, sequence2, matrix, traceback, 0))
+        traceback_seconds = time.perf_counter() - start
+    elif mode == 'local-seed':
+        _, skipped = sa.seed_and_extend(m, s, g, sequence1, sequence2, 'local')
+        fill_seconds = time.perf_counter() - start
+        cells = max(1, round(cells * (1 - skipped)))
+    elif mode == 'global-out-of-core':
+        with tempfile.TemporaryDirectory() as directory:
+            score, _, _, traceback = sa.compute_out_of_core(m, s, g, sequence1, sequence2, 0, directory)
+            fill_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            next(sa.path(sequence1, sequence2, traceback, len1, len2, score))
+            traceback_seconds = time.perf_counter() - start
+            del traceback
+    elif mode in ('global-threads', 'local-threads'):
+        local = mode == 'local-threads'
+        compute = sa.compute_smith_waterman if local else sa.compute_needleman_wunsch
+        matrix, traceback = compute(m, s, g, sequence1, sequence2, 0, threads=None)
+        fill_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        sa.traceback_alignments(sequence1, sequence2, matrix, traceback, 'local' if local else 'global', 0, 1)
+        traceback_seconds = time.perf_counter() - start
+    else:
+        raise ValueError(f"Unknown mode '{mode}', choose one of {', '.join(MODES)}")
+    return cells, fill_seconds, traceback_seconds
+
+
+def run_case(mode, kind, length, repeat=1, seed=0):
+    """
+    Measure a mode on a generated pair, keeping the fastest of the repetitions.
+    The peak resident memory is the one of the whole process, so every case should run in a new process
+    :param mode: one of MODES
+    :param kind: one of KINDS
+    :param length: length of the sequences
+    :param repeat: number of repetitions
+    :param seed: seed of the generated sequences
+    """
+    sequence1, sequence2 = generate_pair(kind, length, seed)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    runs = [run_mode(mode, sequence1, sequence2) for _ in range(repeat)]
+    cells = runs[0][0]
+    fill_seconds = min(run[1] for run in runs)
+    traceback_seconds = None if runs[0][2] is None else min(run[2] for run in runs)
+    return {
+        'mode': mode,
+        'kind': kind,
+        'length1': len(sequence1),
+        'length2': len(sequence2),
+        'cells': cells,
+        'fill_seconds': fill_seconds,
+        'traceback_seconds': traceback_seconds,
+        'cells_per_second': cells / fill_seconds if fill_seconds > 0 else None,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'start_rss_kb': rss_before,
+    }
+
+
+def run_isolated(mode, kind, length, repeat=1, seed=0):
+    """
+    Measure a case in a new process, so that its peak memory does not include the previous cases
+    :param mode: one of MODES
+    :param kind: one of KINDS
+    :param length: length of the sequences
+    :param repeat: number of repetitions
+    :param seed: seed of the generated sequences
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(run_case, mode, kind, length, repeat, seed).result()
+
+
+def run_benchmark(modes=tuple(MODES), kinds=KINDS, lengths=LENGTHS, max_cells=None, repeat=1, seed=0, isolate=True,
+                  log=None):
+    """
+    Measure every mode on every kind and length of sequences, skipping the cases with more cells than the maximum
+    of the mode
+    :param modes: modes to measure
+    :param kinds: kinds of sequences
+    :param lengths: lengths of the sequences
+    :param max_cells: maximum number of cells of every case, None to use the maximum of every mode in MODES
+    :param repeat: number of repetitions of every case
+    :param seed: seed of the generated sequences
+    :param isolate: True to run every case in a new process
+    :param log: file where a line is written for every case, None to write nothing
+    """
+    results = []
+    for mode in modes:
+        limit = MODES[mode] if max_cells is None else max_cells
+        for kind in kinds:
+            for length in lengths:
+                if length * length > limit:
+                    continue
+                result = (run_isolated if isolate else run_case)(mode, kind, length, repeat, seed)
+                results.append(result)
+                if log is not None:
+                    log.write(f"{mode:18} {kind:10} {length:>7} {result['fill_seconds']:10.4f} s "
+                              f"{result['cells_per_second'] or 0:14.0f} cells/s {result['peak_rss_kb']:>10} KB\n")
+                    log.flush()
+    return results
+
+
+def compare_results(results, baseline, tolerance=0.2):
+    """
+    Find the cases that are slower than the baseline by more than the tolerance, as (result, baseline result)
+    :param results: results of run_benchmark
+    :param baseline: results of a previous run_benchmark
+    :param tolerance: fraction of the baseline cells per second that can be lost
+    """
+    reference = {(result['mode'], result['kind'], result['length1']): result for result in baseline}
+    regressions = []
+    for result in results:
+        previous = reference.get((result['mode'], result['kind'], result['length1']))
+        if previous is None or not previous['cells_per_second'] or not result['cells_per_second']:
+            continue
+        if result['cells_per_second'] < (1 - tolerance) * previous['cells_per_second']:
+            regressions.append((result, previous))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", dest="modes", default=','.join(MODES),
+                        help="comma separated modes to measure, among " + ', '.join(MODES))
+    parser.add_argument("--kinds", dest="kinds", default=','.join(KINDS),
+                        help="comma separated kinds of sequences: 'random' and 'repetitive'")
+    parser.add_argument("--lengths", dest="lengths", default=','.join(map(str, LENGTHS)),
+                        help="comma separated lengths of the sequences")
+    parser.add_argument("--max-cells", type=int, dest="max_cells",
+                        help="skip the cases with more cells, by default every mode has its own maximum")
+    parser.add_argument("--repeat", type=int, dest="repeat", default=3,
+                        help="number of repetitions of every case, the fastest is kept")
+    parser.add_argument("--seed", type=int, dest="seed", default=0,
+                        help="seed of the generated sequences")
+    parser.add_argument("--output", dest="output",
+                        help="JSON file where the results are written")
+    parser.add_argument("--baseline", dest="baseline", default=BASELINE,
+                        help="JSON file of a previous run: the benchmark fails if a case is slower than the tolerance; "
+                             "by default the stored results of the reference machine, '' to compare with nothing")
+    parser.add_argument("--tolerance", type=float, dest="tolerance", default=0.2,
+                        help="fraction of the cells per second of the baseline that can be lost")
+
+    options = parser.parse_args()
+    benchmark_results = run_benchmark(options.modes.split(','), options.kinds.split(','),
+                                      [int(length) for length in options.lengths.split(',')], options.max_cells,
+                                      options.repeat, options.seed, log=sys.stderr)
+    report = {'scores': SCORES, 'numpy': np.__version__, 'results': benchmark_results}
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump(report, file, indent=1)
+    else:
+        print(json.dumps(report, indent=1))
+    if options.baseline:
+        with open(options.baseline) as file:
+            baseline_report = json.load(file)
+        # Baselines written by older versions to the standard output are a bare list of results
+        baseline_results = baseline_report if isinstance(baseline_report, list) else baseline_report['results']
+        benchmark_regressions = compare_results(benchmark_results, baseline_results, options.tolerance)
+        for current, previous in benchmark_regressions:
+            sys.stderr.write(f"Regression: {current['mode']} {current['kind']} {current['length1']}: "
+                             f"{current['cells_per_second']:.0f} cells/s, "
+                             f"baseline {previous['cells_per_second']:.0f}\n")
+        if benchmark_regressions:
+            sys.exit(1)
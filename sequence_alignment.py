@@ -16,9 +16,48 @@
 #           sequence, (c) the second nucleotide sequence. As result, returns one optimal alignment
 #           between the two input sequences (b) and (c).
 
-from optparse import OptionParser
-import numpy as np
-from enum import Enum
+import argparse
+import hashlib
+import importlib
+import importlib.util
+import os
+import sys
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache, partial
+from heapq import heappush, heapreplace
+from itertools import groupby, islice, zip_longest
+from enum import Enum, Flag
+
+
+class LazyModule:
+    """
+    Module imported the first time one of its attributes is read, so that the command line pays for the import of
+    NumPy only when it fills NumPy matrices. After the import the global name refers to the module itself
+    """
+
+    def __init__(self, name, alias):
+        """
+        :param name: name of the module
+        :param alias: global name of the module in this file
+        """
+        self.name = name
+        self.alias = alias
+
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self.name)
+        globals()[self.alias] = module
+        return getattr(module, attribute)
+
+
+np = LazyModule('numpy', 'np')
+futures = LazyModule('concurrent.futures', 'futures')
+gzip = LazyModule('gzip', 'gzip')
+json = LazyModule('json', 'json')
+pickle = LazyModule('pickle', 'pickle')
+
+# Optional: without Numba the NumPy engines are used. It is imported the first time the 'numba' engine is used
+NUMBA = importlib.util.find_spec('numba') is not None
 
 
 class Step(Enum):
@@ -35,6 +74,751 @@ class Step(Enum):
     DIAG_UP_LEFT = 7
 
 
+class Transition(Flag):
+    """
+    Flags of a cell of the affine gap traceback matrix, for the matrices M (diagonal step), X (up step) and Y (left
+    step). BEST_* tell which matrices have the best score of the cell, so they are also the states before M in the
+    next diagonal cell; X_FROM_* and Y_FROM_* tell which states come before X and Y; START marks the cells of M
+    where a local alignment starts
+    """
+    BEST_M = 1 << 0
+    BEST_X = 1 << 1
+    BEST_Y = 1 << 2
+    X_FROM_M = 1 << 3
+    X_FROM_X = 1 << 4
+    X_FROM_Y = 1 << 5
+    Y_FROM_M = 1 << 6
+    Y_FROM_X = 1 << 7
+    Y_FROM_Y = 1 << 8
+    START = 1 << 9
+
+
+# Maximum number of cells of the matrices of a batch of pairs aligned together
+BATCH_CELLS = 1 << 22
+
+# Initial number of diagonals on each side of the band, when it is widened automatically
+BAND_WIDTH = 16
+
+# Engines that can be used to fill the procedure and traceback matrices, 'auto' for the fastest available one
+ENGINES = ('auto', 'numba', 'vectorized', 'loop')
+
+# Engines chosen by 'auto', in order of preference
+ENGINE_PREFERENCE = ('numba', 'vectorized')
+
+# Rows and columns of the tiles filled in parallel by fill_wavefront
+TILE_SIZE = 1024
+
+# Rows filled between two checkpoints of compute_out_of_core
+CHECKPOINT_ROWS = 4096
+
+# Pairs with at most this number of cells are aligned by the command line in pure Python, without importing NumPy
+PYTHON_CELLS = 1 << 16
+
+# Blocks of the Hirschberg recursion with at most this number of cells are aligned keeping all their rows
+HIRSCHBERG_BLOCK_CELLS = 1 << 16
+
+# Length of the k-mers shared by the sequences that seed the alignments of seed_and_extend
+SEED_LENGTH = 11
+
+# Multiplier of the polynomial hash of the k-mers
+KMER_HASH = 0x100000001B3
+
+# Bases that every IUPAC nucleotide code stands for
+IUPAC_CODES = {'A': 'A', 'C': 'C', 'G': 'G', 'T': 'T', 'U': 'T', 'R': 'AG', 'Y': 'CT', 'S': 'CG', 'W': 'AT', 'K': 'GT',
+               'M': 'AC', 'B': 'CGT', 'D': 'AGT', 'H': 'ACT', 'V': 'ACG', 'N': 'ACGT'}
+
+# Substitution matrices that can be chosen by name, in the NCBI format
+SUBSTITUTION_MATRICES = {
+    'BLOSUM62': """
+   A  R  N  D  C  Q  E  G  H  I  L  K  M  F  P  S  T  W  Y  V  B  Z  X  *
+A  4 -1 -2 -2  0 -1 -1  0 -2 -1 -1 -1 -1 -2 -1  1  0 -3 -2  0 -2 -1  0 -4
+R -1  5  0 -2 -3  1  0 -2  0 -3 -2  2 -1 -3 -2 -1 -1 -3 -2 -3 -1  0 -1 -4
+N -2  0  6  1 -3  0  0  0  1 -3 -3  0 -2 -3 -2  1  0 -4 -2 -3  3  0 -1 -4
+D -2 -2  1  6 -3  0  2 -1 -1 -3 -4 -1 -3 -3 -1  0 -1 -4 -3 -3  4  1 -1 -4
+C  0 -3 -3 -3  9 -3 -4 -3 -3 -1 -1 -3 -1 -2 -3 -1 -1 -2 -2 -1 -3 -3 -2 -4
+Q -1  1  0  0 -3  5  2 -2  0 -3 -2  1  0 -3 -1  0 -1 -2 -1 -2  0  3 -1 -4
+E -1  0  0  2 -4  2  5 -2  0 -3 -3  1 -2 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+G  0 -2  0 -1 -3 -2 -2  6 -2 -4 -4 -2 -3 -3 -2  0 -2 -2 -3 -3 -1 -2 -1 -4
+H -2  0  1 -1 -3  0  0 -2  8 -3 -3 -1 -2 -1 -2 -1 -2 -2  2 -3  0  0 -1 -4
+I -1 -3 -3 -3 -1 -3 -3 -4 -3  4  2 -3  1  0 -3 -2 -1 -3 -1  3 -3 -3 -1 -4
+L -1 -2 -3 -4 -1 -2 -3 -4 -3  2  4 -2  2  0 -3 -2 -1 -2 -1  1 -4 -3 -1 -4
+K -1  2  0 -1 -3  1  1 -2 -1 -3 -2  5 -1 -3 -1  0 -1 -3 -2 -2  0  1 -1 -4
+M -1 -1 -2 -3 -1  0 -2 -3 -2  1  2 -1  5  0 -2 -1 -1 -1 -1  1 -3 -1 -1 -4
+F -2 -3 -3 -3 -2 -3 -3 -3 -1  0  0 -3  0  6 -4 -2 -2  1  3 -1 -3 -3 -1 -4
+P -1 -2 -2 -1 -3 -1 -1 -2 -2 -3 -3 -1 -2 -4  7 -1 -1 -4 -3 -2 -2 -1 -2 -4
+S  1 -1  1  0 -1  0  0  0 -1 -2 -2  0 -1 -2 -1  4  1 -3 -2 -2  0  0  0 -4
+T  0 -1  0 -1 -1 -1 -1 -2 -2 -1 -1 -1 -1 -2 -1  1  5 -2 -2  0 -1 -1  0 -4
+W -3 -3 -4 -4 -2 -2 -3 -2 -2 -3 -2 -3 -1  1 -4 -3 -2 11  2 -3 -4 -3 -2 -4
+Y -2 -2 -2 -3 -2 -1 -2 -3  2 -1 -1 -2 -1  3 -3 -2 -2  2  7 -1 -3 -2 -1 -4
+V  0 -3 -3 -3 -1 -2 -2 -3 -3  3  1 -2  1 -1 -2 -2  0 -3 -1  4 -3 -2 -1 -4
+B -2 -1  3  4 -3  0  1 -1  0 -3 -4  0 -3 -3 -2  0 -1 -4 -3 -3  4  1 -1 -4
+Z -1  0  0  1 -3  3  4 -2  0 -3 -3  1 -1 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+X  0 -1 -1 -1 -2 -1 -1 -1 -1 -1 -1 -1 -1 -1 -2  0  0 -2 -1 -1 -1 -1 -1 -4
+* -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4  1
+""",
+}
+
+
+class Alignment:
+    """
+    Alignment found by the traceback. Only the score, the start and the steps are stored: the gapped sequences, the
+    CIGAR and the counts of matches and gaps are computed only when they are requested
+    """
+    __slots__ = ('score', 'sequence1', 'sequence2', 'r', 'c', 'steps')
+
+    def __init__(self, score, sequence1, sequence2, r, c, steps):
+        """
+        :param score: score of the alignment
+        :param sequence1: first sequence
+        :param sequence2: second sequence
+        :param r: row position where the alignment start
+        :param c: column position where the alignment start
+        :param steps: steps from the start to the end of the alignment, 'D' for diagonal, 'U' for up, 'L' for left
+        """
+        self.score = score
+        self.sequence1 = sequence1
+        self.sequence2 = sequence2
+        self.r = r
+        self.c = c
+        self.steps = steps
+
+    @property
+    def aligned1(self):
+        """
+        First sequence with the gaps of the alignment
+        """
+        characters = iter(self.sequence1[self.r:])
+        return ''.join('-' if step == 'L' else next(characters) for step in self.steps)
+
+    @property
+    def aligned2(self):
+        """
+        Second sequence with the gaps of the alignment
+        """
+        characters = iter(self.sequence2[self.c:])
+        return ''.join('-' if step == 'U' else next(characters) for step in self.steps)
+
+    @property
+    def end1(self):
+        """
+        Position of the first sequence after the end of the alignment
+        """
+        return self.r + len(self.steps) - self.steps.count('L')
+
+    @property
+    def end2(self):
+        """
+        Position of the second sequence after the end of the alignment
+        """
+        return self.c + len(self.steps) - self.steps.count('U')
+
+    def runs(self):
+        """
+        Runs of equal steps, as (step, length)
+        """
+        return [(step, sum(1 for _ in group)) for step, group in groupby(self.steps)]
+
+    @property
+    def cigar(self):
+        """
+        Run-length encoding of the steps: 'M' for diagonal steps, 'I' for gaps in the second sequence and 'D' for
+        gaps in the first sequence
+        """
+        operations = {'D': 'M', 'U': 'I', 'L': 'D'}
+        return ''.join(f"{length}{operations[step]}" for step, length in self.runs())
+
+    @property
+    def matches(self):
+        """
+        Number of diagonal steps between equal characters
+        """
+        matches = 0
+        r, c = self.r, self.c
+        for step, length in self.runs():
+            if step == 'D':
+                matches += sum(a == b for a, b in zip(self.sequence1[r:r + length], self.sequence2[c:c + length]))
+            r += length if step != 'L' else 0
+            c += length if step != 'U' else 0
+        return matches
+
+    @property
+    def mismatches(self):
+        """
+        Number of diagonal steps between different characters
+        """
+        return self.steps.count('D') - self.matches
+
+    @property
+    def gaps(self):
+        """
+        Number of gap positions, in either sequence
+        """
+        return len(self.steps) - self.steps.count('D')
+
+    @property
+    def gap_opens(self):
+        """
+        Number of runs of gaps in either sequence
+        """
+        return sum(1 for step, _ in self.runs() if step != 'D')
+
+    @property
+    def identity(self):
+        """
+        Fraction of the positions of the alignment with equal characters, 0 for an empty alignment
+        """
+        return self.matches / len(self.steps) if self.steps else 0.0
+
+    def as_dict(self):
+        """
+        Score, coordinates, CIGAR and counts of the alignment as a dictionary, without the gapped sequences
+        """
+        matches = self.matches
+        return {'score': int(self.score), 'start1': int(self.r), 'end1': int(self.end1), 'start2': int(self.c),
+                'end2': int(self.end2), 'cigar': self.cigar, 'matches': matches,
+                'mismatches': self.steps.count('D') - matches, 'gaps': self.gaps, 'gap_opens': self.gap_opens}
+
+    def summary(self):
+        """
+        One line with the score, the coordinates, the CIGAR and the identity, shorter than the gapped sequences
+        """
+        return (f"Alignment with score {self.score}: {self.r}-{self.end1} {self.c}-{self.end2} {self.cigar or '*'} "
+                f"identity {self.identity:.1%}")
+
+    def __str__(self):
+        return f"Alignment with score {self.score}:\n{self.aligned1}\n{self.aligned2}"
+
+    def __repr__(self):
+        return f"Alignment(score={self.score}, r={self.r}, c={self.c}, steps={self.steps!r})"
+
+
+class BandedMatrix:
+    """
+    Matrix that stores only a band of diagonals: row i keeps the columns from i + lower to i + lower + width - 1.
+    It is read like a NumPy matrix with [r, c] and [r, start:stop], cells outside the band have the fill value
+    """
+
+    def __init__(self, data, lower, columns, fill):
+        """
+        :param data: cells of the band, one row of the matrix for each row
+        :param lower: offset of the first diagonal of the band, column minus row
+        :param columns: number of columns of the matrix
+        :param fill: value of the cells outside the band
+        """
+        self.data = data
+        self.lower = lower
+        self.shape = (data.shape[0], columns)
+        self.fill = data.dtype.type(fill)
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def __getitem__(self, index):
+        r, c = index
+        width = self.data.shape[1]
+        if isinstance(c, slice):
+            row = np.full(self.shape[1], self.fill, dtype=self.data.dtype)
+            start = max(0, r + self.lower)
+            stop = min(self.shape[1], r + self.lower + width)
+            if start < stop:
+                row[start:stop] = self.data[r, start - r - self.lower:stop - r - self.lower]
+            return row[c]
+        k = c - r - self.lower
+        if 0 <= k < width:
+            return self.data[r, k]
+        return self.fill
+
+    def max_cells(self):
+        """
+        Maximum value and row and column coordinates of the cells where it is, in row-major order
+        """
+        score = self.data.max()
+        rows, diagonals = np.where(self.data == score)
+        return score, rows, rows + diagonals + self.lower
+
+
+class RaggedMatrix:
+    """
+    Matrix that stores only a span of columns of every row: row r keeps the columns from starts[r] to
+    starts[r] + len(rows[r]) - 1. It is read like a NumPy matrix with [r, c] and [r, start:stop], cells outside the
+    spans have the fill value
+    """
+
+    def __init__(self, rows, starts, columns, fill, dtype):
+        """
+        :param rows: cells of the span of every row, as NumPy arrays
+        :param starts: column of the first cell of the span of every row
+        :param columns: number of columns of the matrix
+        :param fill: value of the cells outside the spans
+        :param dtype: type of the cells
+        """
+        self.rows = rows
+        self.starts = starts
+        self.shape = (len(rows), columns)
+        self.dtype = np.dtype(dtype)
+        self.fill = self.dtype.type(fill)
+
+    @property
+    def size(self):
+        return self.shape[0] * self.shape[1]
+
+    @property
+    def nbytes(self):
+        return sum(row.nbytes for row in self.rows)
+
+    def __getitem__(self, index):
+        r, c = index
+        row = self.rows[r]
+        if isinstance(c, slice):
+            positions = np.arange(*c.indices(self.shape[1])) - self.starts[r]
+            inside = (positions >= 0) & (positions < len(row))
+            result = np.full(len(positions), self.fill, dtype=self.dtype)
+            result[inside] = row[positions[inside]]
+            return result
+        k = c - self.starts[r]
+        if 0 <= k < len(row):
+            return row[k]
+        return self.fill
+
+    def max_cells(self):
+        """
+        Maximum value and row and column coordinates of the cells where it is, in row-major order
+        """
+        score = max(row.max() for row in self.rows if len(row))
+        rows, columns = [], []
+        for r, row in enumerate(self.rows):
+            if len(row) and row.max() == score:
+                cells = np.flatnonzero(row == score)
+                rows.extend([r] * len(cells))
+                columns.extend((cells + self.starts[r]).tolist())
+        return score, np.array(rows), np.array(columns)
+
+
+class TracebackFile:
+    """
+    Traceback matrix in a memory-mapped file, written by compute_out_of_core. The cells are read by path through a
+    block of rows kept in memory: the traceback goes up the rows, so the file is read one block at a time in
+    sequence instead of one page for every cell. Rows and other slices are read directly from the file
+    """
+
+    def __init__(self, filename, rows=None):
+        """
+        :param filename: .npy file of the traceback matrix
+        :param rows: number of rows of a block, None for BATCH_CELLS cells
+        """
+        self.filename = filename
+        self.matrix = np.load(filename, mmap_mode='r')
+        self.shape = self.matrix.shape
+        self.rows = rows or max(1, BATCH_CELLS // self.shape[1])
+        self.first = 0
+        self.block = self.matrix[:0]
+
+    @property
+    def dtype(self):
+        return self.matrix.dtype
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes
+
+    def __getitem__(self, index):
+        r, c = index
+        if isinstance(r, slice) or isinstance(c, slice):
+            return self.matrix[r, c]
+        if not self.first <= r < self.first + len(self.block):
+            self.first = max(0, r - self.rows + 1)
+            self.block = np.array(self.matrix[self.first:r + 1])
+        return self.block[r - self.first, c]
+
+
+class ListMatrix:
+    """
+    Matrix stored as Python lists, read and written with [r, c] like a NumPy matrix, so that fill_scalar, path and
+    traceback_cells can align short pairs without NumPy
+    """
+
+    def __init__(self, rows, columns, fill=0):
+        """
+        :param rows: number of rows
+        :param columns: number of columns
+        :param fill: initial value of the cells
+        """
+        self.rows = [[fill] * columns for _ in range(rows)]
+        self.shape = (rows, columns)
+
+    def __getitem__(self, index):
+        r, c = index
+        return self.rows[r][c]
+
+    def __setitem__(self, index, value):
+        r, c = index
+        self.rows[r][c] = value
+
+    def max_cells(self):
+        """
+        Maximum value and row and column coordinates of the cells where it is, in row-major order
+        """
+        score = max(max(row) for row in self.rows)
+        cells = [(r, c) for r, row in enumerate(self.rows) for c, value in enumerate(row) if value == score]
+        return score, [r for r, _ in cells], [c for _, c in cells]
+
+
+class SubstitutionMatrix:
+    """
+    Scores of the substitutions between the characters of an alphabet. Lowercase letters have the scores of the
+    uppercase ones, unless the alphabet has them
+    """
+
+    def __init__(self, alphabet, scores):
+        """
+        :param alphabet: characters of the matrix, at most 255 ASCII characters
+        :param scores: square matrix with the score of every two characters, in the order of the alphabet
+        """
+        self.alphabet = ''.join(alphabet)
+        self.scores = np.array(scores, dtype=np.int64)
+        if self.scores.shape != (len(self.alphabet), len(self.alphabet)):
+            raise ValueError("The substitution matrix must have a row and a column for every character")
+        if len(set(self.alphabet)) != len(self.alphabet) or len(self.alphabet) > 255 or not self.alphabet.isascii():
+            raise ValueError("The alphabet must have at most 255 distinct ASCII characters")
+        # Code of every byte, 255 for the characters that are not in the alphabet
+        self.lookup = np.full(256, 255, dtype=np.uint8)
+        for code, character in enumerate(self.alphabet):
+            if character.lower() not in self.alphabet:
+                self.lookup[ord(character.lower())] = code
+        for code, character in enumerate(self.alphabet):
+            self.lookup[ord(character)] = code
+
+    def encode(self, sequence):
+        """
+        Encode a sequence as the positions of its characters in the alphabet
+        :param sequence: sequence to encode
+        """
+        try:
+            codes = self.lookup[np.frombuffer(sequence.encode('ascii'), dtype=np.uint8)]
+        except UnicodeEncodeError:
+            codes = np.full(1, 255, dtype=np.uint8)
+        if (codes == 255).any():
+            unknown = sorted(set(sequence) - set(self.alphabet) - set(self.alphabet.lower()))
+            raise ValueError(f"Characters not in the substitution matrix: {''.join(unknown)}")
+        return codes
+
+    def __repr__(self):
+        return f"SubstitutionMatrix(alphabet={self.alphabet!r})"
+
+
+class SequenceDatabase:
+    """
+    Reference sequences stored in a directory by build_database: the characters of all the sequences, one byte each,
+    are concatenated in a NumPy file that is memory-mapped, so the references are read from disk only when they are
+    aligned and are never parsed again
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: directory written by build_database
+        """
+        self.directory = directory
+        self.sequences = np.load(os.path.join(directory, 'sequences.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(directory, 'offsets.npy'))
+        with open(os.path.join(directory, 'names.txt')) as file:
+            self.names = file.read().splitlines()
+        with open(os.path.join(directory, 'alphabet.txt')) as file:
+            self.alphabet = file.read()
+        if len(self.names) != len(self.offsets) - 1 or self.offsets[-1] != len(self.sequences):
+            raise ValueError(f"Inconsistent sequence database in {directory}")
+
+    @property
+    def lengths(self):
+        """
+        Lengths of the references
+        """
+        return np.diff(self.offsets)
+
+    def codes(self, k):
+        """
+        Characters of a reference as bytes
+        :param k: position of the reference
+        """
+        return self.sequences[self.offsets[k]:self.offsets[k + 1]]
+
+    def sequence(self, k):
+        """
+        Reference as a string
+        :param k: position of the reference
+        """
+        return self.codes(k).tobytes().decode('ascii')
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return f"SequenceDatabase(directory={self.directory!r}, references={len(self)})"
+
+
+class AlignmentCache:
+    """
+    Alignments memoized by the key of cache_key. The most recently used entries are kept in memory; with a directory
+    every entry is also written to a file, and when the files exceed max_bytes the least recently used ones are
+    removed. Only the score, the start and the steps of the alignments are stored, the sequences are the ones of the
+    lookup
+    """
+
+    def __init__(self, maxsize=1024, directory=None, max_bytes=None):
+        """
+        :param maxsize: maximum number of entries kept in memory
+        :param directory: directory where the entries are written, None to keep them only in memory
+        :param max_bytes: maximum size of the files of the directory, None for no maximum
+        """
+        self.maxsize = maxsize
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def filename(self, key):
+        """
+        File of an entry in the directory
+        :param key: key of the entry
+        """
+        return os.path.join(self.directory, key + '.pkl')
+
+    def get(self, key, sequence1, sequence2):
+        """
+        Find the alignments of a key, None if they are not in the cache
+        :param key: key of the alignments
+        :param sequence1: first sequence
+        :param sequence2: second sequence
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        elif self.directory is not None and os.path.exists(self.filename(key)):
+            try:
+                with open(self.filename(key), 'rb') as file:
+                    entry = pickle.load(file)
+                os.utime(self.filename(key))
+            except (OSError, EOFError, pickle.UnpicklingError):  # Removed or being written by another process
+                entry = None
+            if entry is not None:
+                self.disk_hits += 1
+                self.remember(key, entry)
+        if entry is None:
+            self.misses += 1
+            return None
+        return [Alignment(score, sequence1, sequence2, r, c, steps) for score, r, c, steps in entry]
+
+    def put(self, key, alignments):
+        """
+        Store the alignments of a key
+        :param key: key of the alignments
+        :param alignments: alignments
+        """
+        entry = tuple((int(alignment.score), int(alignment.r), int(alignment.c), alignment.steps)
+                      for alignment in alignments)
+        self.remember(key, entry)
+        if self.directory is not None:
+            temporary = f"{self.filename(key)}.{os.getpid()}.tmp"
+            with open(temporary, 'wb') as file:
+                pickle.dump(entry, file, pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self.filename(key))
+            if self.max_bytes is not None:
+                self.evict()
+
+    def remember(self, key, entry):
+        """
+        Keep an entry in memory, removing the least recently used one if there are more than maxsize
+        :param key: key of the entry
+        :param entry: stored alignments
+        """
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def evict(self):
+        """
+        Remove the least recently used files of the directory until their size is at most max_bytes
+        """
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pkl'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def statistics(self):
+        """
+        Number of hits in memory, hits in the directory and misses, and number of entries in memory
+        """
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'entries': len(self.entries)}
+
+    def clear(self):
+        """
+        Remove every entry from memory and from the directory, and reset the statistics
+        """
+        self.entries.clear()
+        if self.directory is not None:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.pkl'):
+                    os.remove(entry.path)
+        self.hits = self.disk_hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return f"AlignmentCache(maxsize={self.maxsize}, directory={self.directory!r}, max_bytes={self.max_bytes})"
+
+
+class AlignmentStatistics:
+    """
+    Instrumentation of align: seconds spent in every phase ('fill' of the matrices, 'maximum' search of the best cells
+    of local alignment, 'traceback' enumeration of the alignments, 'linear' alignment in linear memory and 'cache'
+    lookup), cells computed, alignments enumerated and bytes of the largest matrices. The same object can be passed to
+    many calls: the counters add up, and the callback is called with it at the end of every call.
+    Without a statistics object align only checks that it is None
+    """
+
+    def __init__(self, callback=None):
+        """
+        :param callback: function called with the statistics at the end of every call, None to call nothing
+        """
+        self.callback = callback
+        self.seconds = {}
+        self.cells = 0
+        self.alignments = 0
+        self.peak_bytes = 0
+        self.calls = 0
+
+    def record(self, phase, start):
+        """
+        Add the time since start to a phase, returning the current time to start the next phase
+        :param phase: name of the phase
+        :param start: time.perf_counter() at the start of the phase
+        """
+        now = time.perf_counter()
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + now - start
+        return now
+
+    def matrices(self, procedure_matrix, traceback_matrix):
+        """
+        Count the cells of the matrices of a call and keep the largest number of bytes they take
+        :param procedure_matrix: procedure matrix, a NumPy matrix or a BandedMatrix
+        :param traceback_matrix: traceback matrix, a NumPy matrix or a BandedMatrix
+        """
+        data = procedure_matrix.data if isinstance(procedure_matrix, BandedMatrix) else procedure_matrix
+        self.cells += data.size
+        self.peak_bytes = max(self.peak_bytes, procedure_matrix.nbytes + traceback_matrix.nbytes)
+
+    def finish(self):
+        """
+        End a call, calling the callback
+        """
+        self.calls += 1
+        if self.callback is not None:
+            self.callback(self)
+
+    def as_dict(self):
+        """
+        Statistics as a dictionary, for logging or JSON
+        """
+        return {'calls': self.calls, 'seconds': dict(self.seconds), 'cells': self.cells,
+                'alignments': self.alignments, 'peak_bytes': self.peak_bytes}
+
+    def __str__(self):
+        phases = ', '.join(f"{phase} {seconds:.6f} s" for phase, seconds in self.seconds.items())
+        return (f"{self.calls} calls: {phases or 'no phases'}; {self.cells} cells, {self.alignments} alignments, "
+                f"{self.peak_bytes} bytes of matrices")
+
+    def __repr__(self):
+        return f"AlignmentStatistics({self.as_dict()})"
+
+
+class KmerIndex:
+    """
+    Positions of the k-mers of a sequence sorted by their hash, so that the positions of a k-mer are found with a
+    binary search. It can be saved to a file and loaded again with load_kmer_index
+    """
+
+    def __init__(self, k, length, hashes, positions):
+        """
+        :param k: length of the k-mers
+        :param length: length of the indexed sequence
+        :param hashes: hashes of the k-mers, sorted
+        :param positions: position of the k-mer of every hash, increasing for the same hash
+        """
+        self.k = k
+        self.length = length
+        self.hashes = hashes
+        self.positions = positions
+
+    def lookup(self, hashes, max_occurrences=None):
+        """
+        Find the seeds of k-mers, as the positions of the k-mers and the positions where they are in the indexed
+        sequence. K-mers with more than max_occurrences positions are repeats and give no seeds
+        :param hashes: hashes of the k-mers, as returned by kmer_hashes
+        :param max_occurrences: maximum number of positions of a k-mer, None for no maximum
+        """
+        first = np.searchsorted(self.hashes, hashes, 'left')
+        counts = np.searchsorted(self.hashes, hashes, 'right') - first
+        if max_occurrences is not None:
+            counts[counts > max_occurrences] = 0
+        ends = np.cumsum(counts)
+        # Position in self.positions of every seed: the runs of counts positions starting at first
+        indices = np.arange(ends[-1] if len(ends) else 0) + np.repeat(first - ends + counts, counts)
+        return np.repeat(np.arange(len(hashes)), counts), self.positions[indices]
+
+    def save(self, filename):
+        """
+        Write the index to a NumPy file
+        :param filename: name of the file
+        """
+        with open(filename, 'wb') as file:
+            np.savez(file, k=self.k, length=self.length, hashes=self.hashes, positions=self.positions)
+
+    def __repr__(self):
+        return f"KmerIndex(k={self.k}, length={self.length})"
+
+
+# Flags of the affine gap traceback matrix grouped by matrix, in the order M, X, Y
+BEST_FLAGS = (Transition.BEST_M.value, Transition.BEST_X.value, Transition.BEST_Y.value)
+X_FLAGS = (Transition.X_FROM_M.value, Transition.X_FROM_X.value, Transition.X_FROM_Y.value)
+Y_FLAGS = (Transition.Y_FROM_M.value, Transition.Y_FROM_X.value, Transition.Y_FROM_Y.value)
+
+# Step of the affine gap traceback for the states M, X and Y, as (step, row offset, column offset)
+AFFINE_MOVES = (('D', 1, 1), ('U', 1, 0), ('L', 0, 1))
+
+# Moves of the traceback for every step code, as (step, row offset, column offset), in the order they are explored
+TRACEBACK_MOVES = {
+    Step.STOP.value: (),
+    Step.DIAG.value: (('D', 1, 1),),
+    Step.UP.value: (('U', 1, 0),),
+    Step.LEFT.value: (('L', 0, 1),),
+    Step.DIAG_UP.value: (('D', 1, 1), ('U', 1, 0)),
+    Step.DIAG_LEFT.value: (('D', 1, 1), ('L', 0, 1)),
+    Step.UP_LEFT.value: (('L', 0, 1), ('U', 1, 0)),
+    Step.DIAG_UP_LEFT.value: (('D', 1, 1), ('L', 0, 1), ('U', 1, 0)),
+}
+
+
 def determine_step(prev_value, diag, up, left):
     """
     Determine step for traceback
@@ -63,7 +847,400 @@ def determine_step(prev_value, diag, up, left):
         return Step.LEFT.value
 
 
-def compute_needleman_wunsch(m, s, g, sequence1, sequence2, al):
+def encode_sequence(sequence):
+    """
+    Encode a sequence as an array of character codes, so that it can be compared with vectorized operations
+    :param sequence: sequence to encode
+    """
+    return np.frombuffer(sequence.encode('utf-32-le'), dtype=np.uint32)
+
+
+def parse_substitution_matrix(lines):
+    """
+    Parse a substitution matrix in the NCBI format: a header line with the alphabet, then one line for every
+    character with the character and its scores. Empty lines and lines starting with '#' are skipped
+    :param lines: lines of the matrix
+    """
+    rows = [line.split() for line in lines if line.strip() and not line.lstrip().startswith('#')]
+    if not rows:
+        raise ValueError("Empty substitution matrix")
+    alphabet = rows[0]
+    if any(len(row) != len(alphabet) + 1 or row[0] != character for row, character in zip(rows[1:], alphabet)) \
+            or len(rows) != len(alphabet) + 1:
+        raise ValueError("Every character of the substitution matrix header must have a row of scores")
+    return SubstitutionMatrix(alphabet, [[int(score) for score in row[1:]] for row in rows[1:]])
+
+
+def read_substitution_matrix(filename):
+    """
+    Read a substitution matrix from a file in the NCBI format, like the BLOSUM and PAM files
+    :param filename: name of the file
+    """
+    with open(filename) as file:
+        return parse_substitution_matrix(file)
+
+
+def dna_matrix(m, s, transition=None):
+    """
+    Substitution matrix of the IUPAC nucleotide codes. Two bases score m if they are equal, transition if they are
+    both purines or both pyrimidines and s otherwise; two codes score the average of the bases they stand for,
+    rounded to the nearest integer. U is the same as T
+    :param m: match score
+    :param s: mismatch score, for the transversions when transition is given
+    :param transition: score of the transitions (A-G and C-T), None to score them as the other mismatches
+    """
+    transition = s if transition is None else transition
+    purines = set('AG')
+
+    def base_score(base1, base2):
+        if base1 == base2:
+            return m
+        return transition if (base1 in purines) == (base2 in purines) else s
+
+    alphabet = list(IUPAC_CODES)
+    scores = [[int(np.floor(np.mean([base_score(base1, base2) for base1 in IUPAC_CODES[code1]
+                                     for base2 in IUPAC_CODES[code2]]) + 0.5))
+               for code2 in alphabet] for code1 in alphabet]
+    return SubstitutionMatrix(alphabet, scores)
+
+
+def substitution_matrix(name, m=None, s=None):
+    """
+    Find a substitution matrix by name: 'dna' for the IUPAC nucleotide matrix of dna_matrix, one of
+    SUBSTITUTION_MATRICES or the name of a file in the NCBI format
+    :param name: name of the matrix or of the file
+    :param m: match score of the 'dna' matrix
+    :param s: mismatch score of the 'dna' matrix
+    """
+    if name.lower() == 'dna':
+        return dna_matrix(m, s)
+    if name.upper() in SUBSTITUTION_MATRICES:
+        return parse_substitution_matrix(SUBSTITUTION_MATRICES[name.upper()].splitlines())
+    return read_substitution_matrix(name)
+
+
+def encode_sequences(m, s, sequences, substitution=None):
+    """
+    Encode sequences as arrays of small integer codes, together with the table of the scores of every two codes.
+    Without a substitution matrix the codes are the distinct characters of the sequences, with score m on the
+    diagonal of the table and s elsewhere. The last code of the table is not the code of any character, it is used
+    to pad the sequences
+    :param m: match score
+    :param s: mismatch score
+    :param sequences: sequences to encode
+    :param substitution: substitution matrix, None to score the characters with m and s
+    """
+    if substitution is not None:
+        codes = [substitution.encode(sequence) for sequence in sequences]
+        scores = substitution.scores
+        padding = scores.min(initial=0)
+    else:
+        characters = [encode_sequence(sequence) for sequence in sequences]
+        alphabet = np.unique(np.concatenate(characters + [np.empty(0, dtype=np.uint32)]))
+        dtype = np.min_scalar_type(len(alphabet))
+        codes = [np.searchsorted(alphabet, sequence_characters).astype(dtype) for sequence_characters in characters]
+        scores = np.full((len(alphabet), len(alphabet)), s, dtype=np.int64)
+        np.fill_diagonal(scores, m)
+        padding = s
+    table = np.full((len(scores) + 1, len(scores) + 1), padding, dtype=np.int64)
+    table[:-1, :-1] = scores
+    return codes, table
+
+
+def score_profile(table, codes2):
+    """
+    Scores of every code against the characters of the second sequence: the scores of a row of the matrices are
+    the row of the profile of the character of the first sequence, so they are read without comparing characters
+    :param table: scores of every two codes
+    :param codes2: encoded second sequence, with optional leading batch dimensions
+    """
+    return table[:, codes2]
+
+
+def profile_row(profile, codes):
+    """
+    Scores of a row of the matrices
+    :param profile: score profile of the second sequence
+    :param codes: code of the character of the first sequence at that row, one for every pair of a batch
+    """
+    if np.ndim(codes) == 0:
+        return profile[codes]
+    return profile[codes, np.arange(len(codes))]
+
+
+def score_dtype(m, s, g, len1, len2):
+    """
+    Choose the smallest integer type that can hold the procedure matrix.
+    Every score is bounded by the number of steps of the alignment times the largest absolute cost, and the
+    prefix max of fill_row adds at most the same amount
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param len1: length of the first sequence
+    :param len2: length of the second sequence
+    """
+    bound = 2 * (len1 + len2 + 1) * max(abs(m), abs(s), abs(g))
+    for dtype in (np.int16, np.int32):
+        if bound <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def allocate_matrices(m, s, g, len1, len2):
+    """
+    Allocate the procedure matrix with the smallest safe integer type and the traceback matrix with one byte per cell
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param len1: length of the first sequence
+    :param len2: length of the second sequence
+    """
+    procedure_matrix = np.zeros((len1 + 1, len2 + 1), dtype=score_dtype(m, s, g, len1, len2))
+    traceback_matrix = np.zeros((len1 + 1, len2 + 1), dtype=np.uint8)
+    return procedure_matrix, traceback_matrix
+
+
+def fill_row(previous, first, sigma, g, local):
+    """
+    Compute a row of the procedure matrix from the previous one.
+    The left term of the recurrence is resolved with a prefix max: row[j] - j * g = max(best[k] - k * g) for k <= j
+    :param previous: previous row of the procedure matrix
+    :param first: value of the first cell of the row
+    :param sigma: match/mismatch scores of the row
+    :param g: gap score
+    :param local: True for the Smith-Waterman recurrence, False for the Needleman-Wunsch one
+    """
+    row = np.empty_like(previous)
+    row[..., 0] = first
+    np.maximum(previous[..., :-1] + sigma, previous[..., 1:] + g, out=row[..., 1:])
+    if local:
+        np.maximum(row[..., 1:], 0, out=row[..., 1:])
+    offsets = np.arange(row.shape[-1], dtype=row.dtype) * g
+    row -= offsets
+    np.maximum.accumulate(row, axis=-1, out=row)
+    row += offsets
+    return row
+
+
+@lru_cache(maxsize=None)
+def step_codes():
+    """
+    Codes of the steps as stored in the traceback matrix, one byte per cell
+    """
+    return {step: np.uint8(step.value) for step in Step}
+
+
+def step_row(diag, up, left, al, local):
+    """
+    Compute a row of the traceback matrix, with the same encoding of determine_step
+    :param diag: scores obtained from the diagonal cells
+    :param up: scores obtained from the up cells
+    :param left: scores obtained from the left cells
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param local: True for the Smith-Waterman recurrence, False for the Needleman-Wunsch one
+    """
+    codes = step_codes()
+    best = np.maximum(np.maximum(diag, up), left)
+    is_diag = diag == best
+    is_up = up == best
+    if al:
+        is_left = left == best
+        steps = np.where(is_diag,
+                         np.where(is_up & is_left, codes[Step.DIAG_UP_LEFT],
+                                  np.where(is_up, codes[Step.DIAG_UP],
+                                           np.where(is_left, codes[Step.DIAG_LEFT], codes[Step.DIAG]))),
+                         np.where(is_up, np.where(is_left, codes[Step.UP_LEFT], codes[Step.UP]),
+                                  codes[Step.LEFT]))
+    else:
+        steps = np.where(is_diag, codes[Step.DIAG], np.where(is_up, codes[Step.UP], codes[Step.LEFT]))
+    if local:
+        steps[best <= 0] = Step.STOP.value
+    return steps
+
+
+def fill_vectorized(procedure_matrix, traceback_matrix, table, g, codes1, codes2, al, local):
+    """
+    Fill an initialized procedure matrix and traceback matrix one row at a time with NumPy array operations.
+    The matrices can have leading batch dimensions, shared with the encoded sequences
+    :param procedure_matrix: procedure matrix, with the first row and column already initialized
+    :param traceback_matrix: traceback matrix, with the first row and column already initialized
+    :param table: scores of every two codes, as returned by encode_sequences
+    :param g: gap score
+    :param codes1: encoded first sequence
+    :param codes2: encoded second sequence
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param local: True for the Smith-Waterman recurrence, False for the Needleman-Wunsch one
+    """
+    profile = score_profile(table.astype(procedure_matrix.dtype), codes2)
+    for i in range(codes1.shape[-1]):
+        previous = procedure_matrix[..., i, :]
+        sigma = profile_row(profile, codes1[..., i])
+        row = fill_row(previous, procedure_matrix[..., i + 1, 0], sigma, g, local)
+        procedure_matrix[..., i + 1, :] = row
+        traceback_matrix[..., i + 1, 1:] = step_row(previous[..., :-1] + sigma, previous[..., 1:] + g,
+                                                    row[..., :-1] + g, al, local)
+
+
+def fill_scalar(procedure_matrix, traceback_matrix, table, g, codes1, codes2, al, local):
+    """
+    Fill an initialized procedure matrix and traceback matrix cell by cell, with the same steps of step_row.
+    It is the kernel of the 'numba' engine, compiled by Numba to machine code
+    :param procedure_matrix: procedure matrix, with the first row and column already initialized
+    :param traceback_matrix: traceback matrix, with the first row and column already initialized
+    :param table: scores of every two codes, as returned by encode_sequences
+    :param g: gap score
+    :param codes1: encoded first sequence
+    :param codes2: encoded second sequence
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param local: True for the Smith-Waterman recurrence, False for the Needleman-Wunsch one
+    """
+    for i in range(1, len(codes1) + 1):
+        scores = table[codes1[i - 1]]
+        left = procedure_matrix[i, 0] + g
+        for j in range(1, len(codes2) + 1):
+            diag = procedure_matrix[i - 1, j - 1] + scores[codes2[j - 1]]
+            up = procedure_matrix[i - 1, j] + g
+            best = max(diag, up, left)
+            if local and best <= 0:
+                best = 0
+                step = 0
+            elif diag == best:
+                step = 1
+                if al:
+                    if up == best and left == best:
+                        step = 7
+                    elif up == best:
+                        step = 4
+                    elif left == best:
+                        step = 5
+            elif up == best:
+                step = 6 if al and left == best else 2
+            else:
+                step = 3
+            procedure_matrix[i, j] = best
+            traceback_matrix[i, j] = step
+            left = best + g
+
+
+# Kernel compiled by Numba, None until the 'numba' engine is used
+fill_numba = None
+
+
+def compiled_kernel():
+    """
+    Import Numba and compile fill_scalar the first time it is needed. The machine code is cached on disk, so the
+    compilation happens only once
+    """
+    global fill_numba
+    if fill_numba is None:
+        import numba
+        fill_numba = numba.njit(cache=True, nogil=True)(fill_scalar)
+    return fill_numba
+
+
+def fill_wavefront(procedure_matrix, traceback_matrix, table, g, codes1, codes2, al, local, kernel, threads,
+                   tile=TILE_SIZE):
+    """
+    Fill an initialized procedure matrix and traceback matrix in square tiles with a pool of threads.
+    A tile needs only the last row of the tile above it and the last column of the tile on its left, so the tiles of
+    an anti-diagonal are independent: the anti-diagonals are filled in order and the tiles of each one in parallel.
+    Every tile is filled in place by the kernel on a view of the matrices whose first row and column are those
+    boundaries. The compiled kernel releases the GIL, the NumPy one only during the operations on long rows
+    :param procedure_matrix: procedure matrix, with the first row and column already initialized
+    :param traceback_matrix: traceback matrix, with the first row and column already initialized
+    :param table: scores of every two codes, as returned by encode_sequences
+    :param g: gap score
+    :param codes1: encoded first sequence
+    :param codes2: encoded second sequence
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param local: True for the Smith-Waterman recurrence, False for the Needleman-Wunsch one
+    :param kernel: function that fills a tile, fill_vectorized or fill_numba
+    :param threads: number of threads
+    :param tile: number of rows and columns of a tile
+    """
+    rows = range(0, len(codes1), tile)
+    columns = range(0, len(codes2), tile)
+
+    def fill_tile(corner):
+        r, c = corner
+        kernel(procedure_matrix[r:r + tile + 1, c:c + tile + 1], traceback_matrix[r:r + tile + 1, c:c + tile + 1],
+               table, g, codes1[r:r + tile], codes2[c:c + tile], al, local)
+
+    with futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        for diagonal in range(len(rows) + len(columns) - 1):
+            corners = [(rows[a], columns[diagonal - a])
+                       for a in range(max(0, diagonal - len(columns) + 1), min(diagonal + 1, len(rows)))]
+            list(executor.map(fill_tile, corners))
+
+
+def fill_engine(procedure_matrix, traceback_matrix, table, g, codes1, codes2, al, local, engine, threads):
+    """
+    Fill an initialized procedure matrix and traceback matrix with the 'vectorized' or the 'numba' engine, in tiles
+    with fill_wavefront when more than one thread is used
+    :param procedure_matrix: procedure matrix, with the first row and column already initialized
+    :param traceback_matrix: traceback matrix, with the first row and column already initialized
+    :param table: scores of every two codes, as returned by encode_sequences
+    :param g: gap score
+    :param codes1: encoded first sequence
+    :param codes2: encoded second sequence
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param local: True for the Smith-Waterman recurrence, False for the Needleman-Wunsch one
+    :param engine: 'vectorized' or 'numba'
+    :param threads: number of threads
+    """
+    kernel = compiled_kernel() if engine == 'numba' else fill_vectorized
+    if threads > 1:
+        fill_wavefront(procedure_matrix, traceback_matrix, table, g, codes1, codes2, bool(al), local, kernel, threads,
+                       TILE_SIZE)
+    else:
+        kernel(procedure_matrix, traceback_matrix, table, g, codes1, codes2, bool(al), local)
+
+
+def check_threads(threads, engine):
+    """
+    Check the number of threads of the fill, returning it with None replaced by the number of processors for the
+    'numba' engine and by 1 for the others. Only the compiled kernel releases the GIL: the tiles of the 'vectorized'
+    engine are filled one at a time and their Python overhead makes the fill slower than with one thread
+    :param threads: number of threads, None for one for every processor
+    :param engine: resolved engine used to fill the matrices
+    """
+    if not threads:
+        return (os.cpu_count() or 1) if engine == 'numba' else 1
+    if threads > 1 and engine != 'numba':
+        raise ValueError("The matrices are filled with many threads only by the 'numba' engine")
+    return threads
+
+
+def available_engines():
+    """
+    Engines that can be used in this environment, without 'auto'
+    """
+    return tuple(engine for engine in ENGINES[1:] if engine != 'numba' or NUMBA)
+
+
+def check_engine(engine):
+    """
+    Check that the engine used to fill the matrices exists
+    :param engine: name of the engine
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', choose one of {', '.join(ENGINES)}")
+    if engine not in available_engines() and engine != 'auto':
+        raise ValueError(f"The '{engine}' engine needs Numba, choose one of {', '.join(available_engines())}")
+
+
+def resolve_engine(engine):
+    """
+    Check the engine and replace 'auto' with the first available engine of ENGINE_PREFERENCE
+    :param engine: name of the engine
+    """
+    check_engine(engine)
+    if engine == 'auto':
+        return next(engine for engine in ENGINE_PREFERENCE if engine in available_engines())
+    return engine
+
+
+def compute_needleman_wunsch(m, s, g, sequence1, sequence2, al, engine='auto', substitution=None, threads=1):
     """
     Compute procedure matrix and traceback matrix for the Needleman-Wunsch algorithm
     :param m: match score
@@ -72,11 +1249,18 @@ def compute_needleman_wunsch(m, s, g, sequence1, sequence2, al):
     :param sequence1: first sequence
     :param sequence2: second sequence
     :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param engine: 'vectorized' to fill the matrices with NumPy row operations, 'loop' to fill them cell by cell,
+    'numba' to fill them with the compiled kernel and 'auto' for the fastest available one
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    :param threads: number of threads filling the matrices in tiles with fill_wavefront, only with the 'numba' engine;
+    None for one for every processor with it and 1 with the other engines
     """
+    engine = resolve_engine(engine)
+    threads = check_threads(threads, engine)
     len1 = len(sequence1)
     len2 = len(sequence2)
-    procedure_matrix = np.zeros((len1 + 1, len2 + 1), dtype=int)
-    traceback_matrix = np.zeros((len1 + 1, len2 + 1), dtype=int)
+    (codes1, codes2), table = encode_sequences(m, s, (sequence1, sequence2), substitution)
+    procedure_matrix, traceback_matrix = allocate_matrices(table.max(), table.min(), g, len1, len2)
 
     # Initialization
     for i in range(len1):
@@ -87,9 +1271,12 @@ def compute_needleman_wunsch(m, s, g, sequence1, sequence2, al):
         traceback_matrix[0, j + 1] = Step.LEFT.value
 
     # Compute the procedure and traceback matrices
+    if engine != 'loop':
+        fill_engine(procedure_matrix, traceback_matrix, table, g, codes1, codes2, al, False, engine, threads)
+        return procedure_matrix, traceback_matrix
     for i in range(len1):
         for j in range(len2):
-            sigma = m if sequence1[i] == sequence2[j] else s
+            sigma = table[codes1[i], codes2[j]]
             procedure_matrix[i + 1, j + 1] = np.max((procedure_matrix[i, j] + sigma, procedure_matrix[i, j + 1] + g,
                                                      procedure_matrix[i + 1, j] + g))
             traceback_matrix[i + 1, j + 1] = np.argmax((procedure_matrix[i, j] + sigma, procedure_matrix[i, j + 1] + g,
@@ -103,7 +1290,7 @@ def compute_needleman_wunsch(m, s, g, sequence1, sequence2, al):
     return procedure_matrix, traceback_matrix
 
 
-def compute_smith_waterman(m, s, g, sequence1, sequence2, al):
+def compute_smith_waterman(m, s, g, sequence1, sequence2, al, engine='auto', substitution=None, threads=1):
     """
     Compute procedure matrix and traceback matrix for the Smith-Waterman algorithm
     :param m: match score
@@ -112,15 +1299,25 @@ def compute_smith_waterman(m, s, g, sequence1, sequence2, al):
     :param sequence1: first sequence
     :param sequence2: second sequence
     :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param engine: 'vectorized' to fill the matrices with NumPy row operations, 'loop' to fill them cell by cell,
+    'numba' to fill them with the compiled kernel and 'auto' for the fastest available one
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    :param threads: number of threads filling the matrices in tiles with fill_wavefront, only with the 'numba' engine;
+    None for one for every processor with it and 1 with the other engines
     """
+    engine = resolve_engine(engine)
+    threads = check_threads(threads, engine)
     len1 = len(sequence1)
     len2 = len(sequence2)
-    procedure_matrix = np.zeros((len1 + 1, len2 + 1), dtype=int)
-    traceback_matrix = np.zeros((len1 + 1, len2 + 1), dtype=int)
+    (codes1, codes2), table = encode_sequences(m, s, (sequence1, sequence2), substitution)
+    procedure_matrix, traceback_matrix = allocate_matrices(table.max(), table.min(), g, len1, len2)
     # Compute the procedure and traceback matrices
+    if engine != 'loop':
+        fill_engine(procedure_matrix, traceback_matrix, table, g, codes1, codes2, al, True, engine, threads)
+        return procedure_matrix, traceback_matrix
     for i in range(len1):
         for j in range(len2):
-            sigma = m if sequence1[i] == sequence2[j] else s
+            sigma = table[codes1[i], codes2[j]]
             procedure_matrix[i + 1, j + 1] = np.max((0, procedure_matrix[i, j] + sigma, procedure_matrix[i, j + 1] + g,
                                                      procedure_matrix[i + 1, j] + g))
             traceback_matrix[i + 1, j + 1] = np.argmax((0, procedure_matrix[i, j] + sigma,
@@ -134,97 +1331,2205 @@ def compute_smith_waterman(m, s, g, sequence1, sequence2, al):
     return procedure_matrix, traceback_matrix
 
 
-def path(sequence1, sequence2, traceback_matrix, r, c, score):
+def compute_out_of_core(m, s, g, sequence1, sequence2, al, directory, local=False, engine='auto',
+                        checkpoint=CHECKPOINT_ROWS, substitution=None):
     """
-    Compute alignments from the traceback matrix
+    Compute the traceback matrix in a memory-mapped file, keeping in memory only a block of rows of the procedure
+    matrix, so that the matrices can be larger than the memory. Every checkpoint rows the file is flushed and the last
+    row of the procedure matrix is saved with the best cells: if the fill is interrupted, calling the function again
+    with the same arguments resumes it from the last checkpoint. Return the optimal score, the row and column
+    coordinates of the cells where the optimal alignments end (like max_cells) and the TracebackFile
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
     :param sequence1: first sequence
     :param sequence2: second sequence
-    :param traceback_matrix: traceback matrix
-    :param r: row position where the alignment start
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param directory: directory of the files traceback.npy and checkpoint.npz, created if it does not exist
+    :param local: True for the Smith-Waterman algorithm, False for the Needleman-Wunsch one
+    :param engine: 'vectorized', 'numba' or 'auto', the engine that fills the blocks of rows
+    :param checkpoint: number of rows filled between two checkpoints
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    engine = resolve_engine(engine)
+    if engine == 'loop':
+        raise ValueError("The traceback matrix is written to a file only by the 'vectorized' and 'numba' engines")
+    len1 = len(sequence1)
+    len2 = len(sequence2)
+    (codes1, codes2), table = encode_sequences(m, s, (sequence1, sequence2), substitution)
+    dtype = score_dtype(table.max(), table.min(), g, len1, len2)
+    os.makedirs(directory, exist_ok=True)
+    filename = os.path.join(directory, 'traceback.npy')
+    checkpoint_filename = os.path.join(directory, 'checkpoint.npz')
+    key = cache_key(m, s, g, sequence1, sequence2, substitution, al=bool(al), local=local)
+
+    state = None
+    if os.path.exists(checkpoint_filename) and os.path.exists(filename):
+        with np.load(checkpoint_filename) as saved:
+            if str(saved['key']) == key:
+                state = {name: saved[name] for name in saved.files}
+    if state is not None:
+        traceback_matrix = np.lib.format.open_memmap(filename, mode='r+')
+        start = int(state['row'])
+        previous = state['previous'].astype(dtype)
+        best, rows, columns = state['best'].item(), list(state['rows']), list(state['columns'])
+    else:
+        traceback_matrix = np.lib.format.open_memmap(filename, mode='w+', dtype=np.uint8, shape=(len1 + 1, len2 + 1))
+        start = 0
+        if local:
+            previous = np.zeros(len2 + 1, dtype=dtype)
+            # Like max_cells, the cells of the first row have the maximum score until a higher one is found
+            best, rows, columns = 0, [0] * (len2 + 1 if al else 1), list(range(len2 + 1 if al else 1))
+        else:
+            previous = np.arange(len2 + 1, dtype=dtype) * dtype(g)
+            traceback_matrix[0, 1:] = Step.LEFT.value
+            best, rows, columns = 0, [], []
+
+    # The blocks are small enough for memory and never cross a checkpoint
+    block_rows = max(1, min(checkpoint, BATCH_CELLS // (len2 + 1)))
+    saved_row = start
+    for r in range(start, len1, block_rows):
+        stop = min(r + block_rows, len1)
+        block = np.empty((stop - r + 1, len2 + 1), dtype=dtype)
+        block[0] = previous
+        if local:
+            block[1:, 0] = 0
+        else:
+            block[1:, 0] = np.arange(r + 1, stop + 1) * g
+            traceback_matrix[r + 1:stop + 1, 0] = Step.UP.value
+        fill_engine(block, traceback_matrix[r:stop + 1], table, g, codes1[r:stop], codes2, al, local, engine, 1)
+        if local:
+            block_best = block[1:].max()
+            if block_best > best or (block_best == best and al):
+                block_rows_found, block_columns_found = np.where(block[1:] == block_best)
+                found = 1 if not al else len(block_rows_found)
+                if block_best > best:
+                    best, rows, columns = int(block_best), [], []
+                rows.extend((block_rows_found[:found] + r + 1).tolist())
+                columns.extend(block_columns_found[:found].tolist())
+        previous = block[-1].copy()
+        if stop - saved_row >= checkpoint or stop == len1:
+            traceback_matrix.flush()
+            temporary = f"{checkpoint_filename}.{os.getpid()}.tmp"
+            with open(temporary, 'wb') as file:
+                np.savez(file, key=key, row=stop, previous=previous, best=best, rows=np.array(rows, dtype=np.int64),
+                         columns=np.array(columns, dtype=np.int64))
+            os.replace(temporary, checkpoint_filename)
+            saved_row = stop
+    traceback_matrix.flush()
+    del traceback_matrix
+
+    if not local:
+        best, rows, columns = int(previous[-1]), [len1], [len2]
+    return best, np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64), TracebackFile(filename)
+
+
+def compute_batch(m, s, g, pairs, al, local, substitution=None):
+    """
+    Compute procedure matrices and traceback matrices of many pairs at once, stacking them in 3-D arrays.
+    Every sequence is padded to the longest one: the padding cells come after the cells of the pair, so they never
+    change them and are cut away from the returned matrices
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param pairs: pairs of sequences
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param local: True for the Smith-Waterman algorithm, False for the Needleman-Wunsch one
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    len1 = max((len(sequence1) for sequence1, _ in pairs), default=0)
+    len2 = max((len(sequence2) for _, sequence2 in pairs), default=0)
+    codes, table = encode_sequences(m, s, [sequence for pair in pairs for sequence in pair], substitution)
+    padding = len(table) - 1
+    codes1 = np.full((len(pairs), len1), padding, dtype=np.min_scalar_type(padding))
+    codes2 = np.full((len(pairs), len2), padding, dtype=np.min_scalar_type(padding))
+    for k in range(len(pairs)):
+        codes1[k, :len(codes[2 * k])] = codes[2 * k]
+        codes2[k, :len(codes[2 * k + 1])] = codes[2 * k + 1]
+    procedure_matrix = np.zeros((len(pairs), len1 + 1, len2 + 1),
+                                dtype=score_dtype(table.max(), table.min(), g, len1, len2))
+    traceback_matrix = np.zeros((len(pairs), len1 + 1, len2 + 1), dtype=np.uint8)
+
+    # Initialization
+    if not local:
+        procedure_matrix[:, :, 0] = np.arange(len1 + 1) * g
+        procedure_matrix[:, 0, :] = np.arange(len2 + 1) * g
+        traceback_matrix[:, 1:, 0] = Step.UP.value
+        traceback_matrix[:, 0, 1:] = Step.LEFT.value
+
+    fill_vectorized(procedure_matrix, traceback_matrix, table, g, codes1, codes2, al, local)
+    return [(procedure_matrix[k, :len(sequence1) + 1, :len(sequence2) + 1],
+             traceback_matrix[k, :len(sequence1) + 1, :len(sequence2) + 1])
+            for k, (sequence1, sequence2) in enumerate(pairs)]
+
+
+def compute_needleman_wunsch_batch(m, s, g, pairs, al, substitution=None):
+    """
+    Compute procedure matrices and traceback matrices of many pairs at once for the Needleman-Wunsch algorithm
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param pairs: pairs of sequences
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    return compute_batch(m, s, g, pairs, al, False, substitution)
+
+
+def compute_smith_waterman_batch(m, s, g, pairs, al, substitution=None):
+    """
+    Compute procedure matrices and traceback matrices of many pairs at once for the Smith-Waterman algorithm
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param pairs: pairs of sequences
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    return compute_batch(m, s, g, pairs, al, True, substitution)
+
+
+def fill_banded(m, s, g, sequence1, sequence2, al, lower, upper, local, substitution=None):
+    """
+    Compute procedure matrix and traceback matrix keeping only the diagonals from lower to upper (column minus row).
+    Inside the band the cell (i, j) is at position j - i - lower of row i: the diagonal cell is at the same position of
+    the previous row, the up cell at the next position of the previous row and the left cell at the previous position
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param lower: first diagonal of the band
+    :param upper: last diagonal of the band
+    :param local: True for the Smith-Waterman algorithm, False for the Needleman-Wunsch one
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    (codes1, codes2), table = encode_sequences(m, s, (sequence1, sequence2), substitution)
+    len1 = len(sequence1)
+    len2 = len(sequence2)
+    width = upper - lower + 1
+    # Room for cells outside the band, far below every score
+    dtype = score_dtype(table.max(), table.min(), g, 2 * len1, 2 * len2)
+    outside = dtype(-(np.iinfo(dtype).max // 2))
+    profile = score_profile(table.astype(dtype), np.append(codes2, len(table) - 1))
+    positions = np.arange(width)
+    offsets = positions.astype(dtype) * g
+    procedure_matrix = np.full((len1 + 1, width), outside, dtype=dtype)
+    traceback_matrix = np.zeros((len1 + 1, width), dtype=np.uint8)
+
+    # Initialization
+    columns = lower + positions
+    valid = (columns >= 0) & (columns <= len2)
+    procedure_matrix[0, valid] = 0 if local else columns[valid] * g
+    if not local:
+        traceback_matrix[0, valid & (columns > 0)] = Step.LEFT.value
+
+    # Compute the procedure and traceback matrices
+    up = np.full(width, outside + g, dtype=dtype)
+    left = np.full(width, outside + g, dtype=dtype)
+    for i in range(1, len1 + 1):
+        start = i + lower  # Column of the first cell of the band
+        previous = procedure_matrix[i - 1]
+        if 1 <= start and start + width <= len2 + 1:  # All the cells of the band are inside the matrix
+            sigma = profile[codes1[i - 1], start - 1:start - 1 + width]
+            edge = False
+        else:
+            columns = start + positions
+            sigma = profile[codes1[i - 1], np.clip(columns - 1, 0, len2)]
+            edge = True
+        diag = previous + sigma
+        np.add(previous[1:], g, out=up[:-1])
+        best = np.maximum(diag, up)
+        if local:
+            np.maximum(best, 0, out=best)
+        if edge:
+            valid = (columns >= 0) & (columns <= len2)
+            best[~(valid & (columns > 0))] = outside
+            if 0 <= -start < width:  # Cell (i, 0)
+                best[-start] = 0 if local else i * g
+        best -= offsets
+        row = np.maximum.accumulate(best, out=best)
+        row += offsets
+        if edge:
+            row[~valid] = outside
+        procedure_matrix[i] = row
+        np.add(row[:-1], g, out=left[1:])
+        steps = step_row(diag, up, left, al, local)
+        if edge:
+            steps[~(valid & (columns > 0))] = Step.STOP.value
+            if 0 <= -start < width and not local:
+                steps[-start] = Step.UP.value
+        traceback_matrix[i] = steps
+
+    return (BandedMatrix(procedure_matrix, lower, len2 + 1, outside),
+            BandedMatrix(traceback_matrix, lower, len2 + 1, Step.STOP.value))
+
+
+def band_bound(m, s, g, len1, len2, lower, upper, local):
+    """
+    Upper bound of the score of the alignments that leave the band, None if the band covers the whole matrix.
+    A global alignment that reaches the diagonal upper + 1 has at least 2 * (upper + 1) - (len2 - len1) gaps, one
+    that reaches lower - 1 at least 2 * (1 - lower) + (len2 - len1). A local alignment with G gaps that reaches the
+    diagonal d has at most min(len1, len2, len2 - d + G) diagonal steps (min(len1, len2, len1 + d + G) for d < 0),
+    and when every substitution scores less than 0 it can have none
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param len1: length of the first sequence
+    :param len2: length of the second sequence
+    :param lower: first diagonal of the band
+    :param upper: last diagonal of the band
+    :param local: True for the Smith-Waterman algorithm, False for the Needleman-Wunsch one
+    """
+    best = max(m, s)
+    bounds = []
+    if local:
+        outside = []
+        if upper + 1 <= len2 - 1:
+            outside.append(len2 - upper - 1)
+        if lower - 1 >= 1 - len1:
+            outside.append(len1 + lower - 1)
+        for length in outside:  # Cells of the first diagonal outside the band
+            for gaps in (0, max(0, min(len1, len2) - length), len1 + len2):
+                bounds.append(max(best, 0) * min(len1, len2, length + gaps) + g * gaps)
+    else:
+        gaps = []
+        if upper < len2:
+            gaps.append(2 * (upper + 1) - (len2 - len1))
+        if lower > -len1:
+            gaps.append(2 * (1 - lower) + (len2 - len1))
+        if gaps:
+            for total in (min(gaps), len1 + len2):
+                bounds.append(best * (len1 + len2 - total) / 2 + g * total)
+    return max(bounds) if bounds else None
+
+
+def compute_banded(m, s, g, sequence1, sequence2, al, band, local, substitution=None):
+    """
+    Compute banded procedure matrix and traceback matrix, doubling the band until its score is provably optimal.
+    When the band would be as wide as a row of the matrices, the whole matrices are computed instead
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param band: number of diagonals on each side of the band, 'auto' to widen it until the score is optimal
+    :param local: True for the Smith-Waterman algorithm, False for the Needleman-Wunsch one
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    len1 = len(sequence1)
+    len2 = len(sequence2)
+    # The bound of the band needs only the best and the worst substitution scores
+    best, worst = (m, s) if substitution is None else (substitution.scores.max(), substitution.scores.min())
+    width = BAND_WIDTH if band == 'auto' else int(band)
+    while True:
+        if local:
+            lower, upper = -width, width
+        else:
+            lower, upper = min(0, len2 - len1) - width, max(0, len2 - len1) + width
+        lower = max(lower, -len1)
+        upper = min(upper, len2)
+        # A band as wide as a row of the matrices stores more cells than the matrices, and the whole matrices are exact
+        if upper - lower >= len2 and (band == 'auto' or (lower == -len1 and upper == len2)):
+            compute = compute_smith_waterman if local else compute_needleman_wunsch
+            return compute(m, s, g, sequence1, sequence2, al, substitution=substitution)
+        procedure_matrix, traceback_matrix = fill_banded(m, s, g, sequence1, sequence2, al, lower, upper, local,
+                                                         substitution)
+        if band != 'auto':
+            return procedure_matrix, traceback_matrix
+        score = procedure_matrix.max_cells()[0] if local else procedure_matrix[len1, len2]
+        bound = band_bound(best, worst, g, len1, len2, lower, upper, local)
+        if bound is None or score >= bound:
+            return procedure_matrix, traceback_matrix
+        width *= 2
+
+
+def compute_needleman_wunsch_banded(m, s, g, sequence1, sequence2, al, band='auto', substitution=None):
+    """
+    Compute procedure matrix and traceback matrix for the Needleman-Wunsch algorithm inside a band of diagonals
+    around the ones of the first and last cell. Time and memory are proportional to the cells of the band
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param band: number of diagonals added on each side, 'auto' to widen the band until the score is optimal
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    return compute_banded(m, s, g, sequence1, sequence2, al, band, False, substitution)
+
+
+def compute_smith_waterman_banded(m, s, g, sequence1, sequence2, al, band='auto', substitution=None):
+    """
+    Compute procedure matrix and traceback matrix for the Smith-Waterman algorithm inside a band of diagonals around
+    the main one. Time and memory are proportional to the cells of the band. The bound of the score of the local
+    alignments that leave the band is loose, so 'auto' proves the score optimal early only for very similar sequences
+    and otherwise widens the band until the whole matrices are computed
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param band: number of diagonals on each side of the main one, 'auto' to widen the band until the score is optimal
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    return compute_banded(m, s, g, sequence1, sequence2, al, band, True, substitution)
+
+
+def fill_xdrop(m, s, g, sequence1, sequence2, al, xdrop, zdrop, local, substitution=None):
+    """
+    Compute procedure matrix and traceback matrix pruning the cells whose score is more than xdrop below the best
+    score of the previous rows (X-drop). Every row is filled only from the first to one past the last cell kept in
+    the previous row, then to the right for as long as gaps keep the score above the limit, so the cells filled
+    follow the alignment. The fill stops when no cell of a row is kept or, with zdrop, when the best score of a row
+    is more than zdrop plus the cost of the gaps between the best cells below the best score (Z-drop).
+    Only the cells kept in every row are stored, in a RaggedMatrix; pruned and unfilled cells are far below every
+    score and stop the traceback. Returns the matrices, True if the fill stopped before the last row, and the number
+    of cells filled. In local alignment no cell is pruned while the best score is at most xdrop, because the
+    alignments can restart from zero anywhere
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param xdrop: maximum drop of the score of a cell below the best score, None to keep every cell
+    :param zdrop: maximum drop of the best score of a row below the best score, None to never stop for it
+    :param local: True for the Smith-Waterman algorithm, False for alignments that start at the first characters of
+    both sequences and end anywhere
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    if (xdrop is not None and xdrop < 0) or (zdrop is not None and zdrop < 0):
+        raise ValueError("The X-drop and the Z-drop must be at least 0")
+    (codes1, codes2), table = encode_sequences(m, s, (sequence1, sequence2), substitution)
+    len1 = len(sequence1)
+    len2 = len(sequence2)
+    # Room for cells outside the filled ones, far below every score
+    dtype = score_dtype(table.max(), table.min(), g, 2 * len1, 2 * len2)
+    outside = dtype(-(np.iinfo(dtype).max // 2))
+    profile = score_profile(table.astype(dtype), codes2)
+    starts = np.zeros(len1 + 1, dtype=np.int64)
+    procedure_matrix = RaggedMatrix([np.empty(0, dtype=dtype)] * (len1 + 1), starts, len2 + 1, outside, dtype)
+    traceback_matrix = RaggedMatrix([np.empty(0, dtype=np.uint8)] * (len1 + 1), starts, len2 + 1, Step.STOP.value,
+                                    np.uint8)
+
+    # Initialization
+    row = np.zeros(len2 + 1, dtype=dtype) if local else np.arange(len2 + 1, dtype=dtype) * g
+    steps = np.zeros(len2 + 1, dtype=np.uint8)
+    if not local:
+        steps[1:] = Step.LEFT.value
+    if xdrop is not None:
+        steps[row < -xdrop] = Step.STOP.value
+        row[row < -xdrop] = outside
+    kept = np.flatnonzero(row > outside)
+    lo, hi = int(kept[0]), int(kept[-1])
+    procedure_matrix.rows[0] = row[:hi + 1]
+    traceback_matrix.rows[0] = steps[:hi + 1]
+    filled = hi + 1
+    best, best_r, best_c = 0, 0, 0
+
+    # Compute the procedure and traceback matrices
+    for i in range(1, len1 + 1):
+        limit = None if xdrop is None else best - xdrop
+        stop = min(hi + 1, len2)
+        start = max(lo - 1, 0)  # Column of the first cell given to fill_row, outside the row if lo > 0
+        previous = procedure_matrix[i - 1, start:stop + 1]
+        sigma = profile[codes1[i - 1], start:stop]
+        row = fill_row(previous, (0 if local else i * g) if lo == 0 else outside, sigma, g, local)
+        steps = step_row(previous[:-1] + sigma, previous[1:] + g, row[:-1] + g, al, local)
+        end = stop
+        if stop < len2:  # Cells after the last one kept in the previous row are reached only with gaps
+            if limit is None or g >= 0:
+                count = len2 - stop
+            else:
+                count = min(len2 - stop, max(0, (int(row[-1]) - limit) // -g))
+            tail = row[-1] + np.arange(1, count + 1, dtype=dtype) * g
+            if local:
+                np.maximum(tail, 0, out=tail)
+            row = np.concatenate((row, tail))
+            left = np.full(count, step_codes()[Step.LEFT])
+            if local:
+                left[tail <= 0] = Step.STOP.value
+            steps = np.concatenate((steps, left))
+            end = stop + count
+        if lo > 0:
+            row[0] = outside
+        if limit is not None:
+            pruned = row < limit
+            row[pruned] = outside
+            steps[pruned[1:]] = Step.STOP.value
+        filled += end - lo + 1
+        kept = np.flatnonzero(row > outside)
+        if not len(kept):
+            return procedure_matrix, traceback_matrix, i < len1, filled
+        first = Step.UP.value if lo == 0 and not local and row[0] > outside else Step.STOP.value
+        steps = np.concatenate((np.array([first], dtype=np.uint8), steps))
+        # Keep only the span from the first to the last cell kept
+        starts[i] = start + int(kept[0])
+        procedure_matrix.rows[i] = row[kept[0]:kept[-1] + 1].copy()
+        traceback_matrix.rows[i] = steps[kept[0]:kept[-1] + 1].copy()
+        lo, hi = start + int(kept[0]), start + int(kept[-1])
+        k = int(np.argmax(row))
+        if row[k] > best:
+            best, best_r, best_c = int(row[k]), i, start + k
+        if zdrop is not None and best - row[k] > zdrop + abs(g) * abs((i - best_r) - (start + k - best_c)):
+            return procedure_matrix, traceback_matrix, i < len1, filled
+    return procedure_matrix, traceback_matrix, False, filled
+
+
+def compute_smith_waterman_xdrop(m, s, g, sequence1, sequence2, al, xdrop, zdrop=None, substitution=None):
+    """
+    Compute procedure matrix and traceback matrix for the Smith-Waterman algorithm with the X-drop and Z-drop
+    cutoffs of fill_xdrop. Once the best score is above xdrop the alignments can no longer restart from zero, so the
+    fill follows the best alignment and stops soon after it leaves the similar region
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param xdrop: maximum drop of the score of a cell below the best score, None to keep every cell
+    :param zdrop: maximum drop of the best score of a row below the best score, None to never stop for it
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    return fill_xdrop(m, s, g, sequence1, sequence2, al, xdrop, zdrop, True, substitution)
+
+
+def compute_extension_xdrop(m, s, g, sequence1, sequence2, al, xdrop, zdrop=None, substitution=None):
+    """
+    Compute procedure matrix and traceback matrix of the alignments that start at the first characters of both
+    sequences and end anywhere, like the extension of a seed, with the X-drop and Z-drop cutoffs of fill_xdrop.
+    The alignments are traced back from the cells with the best score, as with traceback_smith_waterman
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param xdrop: maximum drop of the score of a cell below the best score, None to keep every cell
+    :param zdrop: maximum drop of the best score of a row below the best score, None to never stop for it
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    return fill_xdrop(m, s, g, sequence1, sequence2, al, xdrop, zdrop, False, substitution)
+
+
+def transition_flags(candidates, best, flags, al):
+    """
+    Compute the flags of the candidates equal to the best score. With al equal to 0 only the first one is kept
+    :param candidates: scores of the candidates, in order of priority
+    :param best: best scores
+    :param flags: flag of every candidate, increasing
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    """
+    result = np.zeros(best.shape, dtype=np.uint16)
+    for candidate, flag in zip(candidates, flags):
+        result |= (candidate == best) * np.uint16(flag)
+    if not al:  # The flags grow with the priority, keep the lowest bit
+        result &= ~result + np.uint16(1)
+    return result
+
+
+def fill_affine(m, s, o, e, sequence1, sequence2, al, local, substitution=None):
+    """
+    Compute procedure matrix and traceback matrix with the affine gap score of Gotoh: a gap of length k scores
+    o + k * e. Three rows are kept, M for the alignments ending with a diagonal step, X with an up step and Y with a
+    left step; the procedure matrix stores the best of them. The left gaps are resolved with a prefix max like in
+    fill_row: Y[j] = max(max(M[k], X[k]) + o + (j - k) * e) for k < j
+    :param m: match score
+    :param s: mismatch score
+    :param o: gap opening score
+    :param e: gap extension score
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param local: True for the Smith-Waterman algorithm, False for the Needleman-Wunsch one
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    (codes1, codes2), table = encode_sequences(m, s, (sequence1, sequence2), substitution)
+    len1 = len(sequence1)
+    len2 = len(sequence2)
+    # Room for the cells that cannot be reached, far below every score
+    dtype = score_dtype(table.max(), table.min(), abs(o) + abs(e), 2 * len1, 2 * len2)
+    outside = dtype(-(np.iinfo(dtype).max // 2))
+    profile = score_profile(table.astype(dtype), codes2)
+    gap_open = dtype(o)
+    opening = dtype(o + e)
+    extension = dtype(e)
+    offsets = np.arange(len2 + 1, dtype=dtype) * extension
+    procedure_matrix = np.zeros((len1 + 1, len2 + 1), dtype=dtype)
+    traceback_matrix = np.zeros((len1 + 1, len2 + 1), dtype=np.uint16)
+
+    # Initialization: M only in the first cell, Y along the first row and X along the first column
+    best_m = np.full(len2 + 1, outside, dtype=dtype)
+    best_x = np.full(len2 + 1, outside, dtype=dtype)
+    best_y = np.full(len2 + 1, outside, dtype=dtype)
+    if not local:
+        best_m[0] = 0
+        best_y[1:] = opening + offsets[:-1]
+        procedure_matrix[0, 1:] = best_y[1:]
+        procedure_matrix[1:, 0] = opening + np.arange(len1, dtype=dtype) * extension
+        traceback_matrix[0, 1:] = Transition.BEST_Y.value
+        traceback_matrix[0, 2:] |= Transition.Y_FROM_Y.value
+        traceback_matrix[1:, 0] = Transition.BEST_X.value
+        traceback_matrix[2:, 0] |= Transition.X_FROM_X.value
+
+    # Compute the procedure and traceback matrices
+    row_m = np.empty(len2 + 1, dtype=dtype)
+    row_y = np.empty(len2 + 1, dtype=dtype)
+    for i in range(len1):
+        previous = procedure_matrix[i]
+        sigma = profile[codes1[i]]
+        row_m[0] = outside
+        np.add(previous[:-1], sigma, out=row_m[1:])
+        up_m = best_m + opening
+        up_x = best_x + extension
+        up_y = best_y + opening
+        row_x = np.maximum(np.maximum(up_m, up_x), up_y)
+        row_x[0] = procedure_matrix[i + 1, 0] if not local else outside
+        row_d = np.maximum(row_m, row_x)
+        prefix = np.maximum.accumulate(row_d - offsets)
+        row_y[0] = outside
+        np.add(prefix[:-1] + gap_open, offsets[1:], out=row_y[1:])
+        row = np.maximum(row_d, row_y)
+        if local:
+            np.maximum(row, 0, out=row)
+
+        flags = transition_flags((row_m, row_x, row_y), row, BEST_FLAGS, al)
+        flags[1:] |= transition_flags((up_m[1:], up_x[1:], up_y[1:]), row_x[1:], X_FLAGS, al)
+        flags[1:] |= transition_flags((row_m[:-1] + opening, row_x[:-1] + opening, row_y[:-1] + extension),
+                                      row_y[1:], Y_FLAGS, al)
+        if local:
+            flags &= ~((row <= 0) * np.uint16(sum(BEST_FLAGS)))
+            flags[1:] |= (previous[:-1] <= 0) * np.uint16(Transition.START.value)
+            flags[0] = 0
+        else:
+            flags[0] = traceback_matrix[i + 1, 0]
+        procedure_matrix[i + 1] = row
+        traceback_matrix[i + 1] = flags
+        best_m, best_x, best_y = row_m.copy(), row_x, row_y.copy()
+
+    return procedure_matrix, traceback_matrix
+
+
+def compute_needleman_wunsch_affine(m, s, o, e, sequence1, sequence2, al, substitution=None):
+    """
+    Compute procedure matrix and traceback matrix for the Needleman-Wunsch algorithm with affine gap score.
+    With o equal to 0 the scores are the same of compute_needleman_wunsch with g equal to e
+    :param m: match score
+    :param s: mismatch score
+    :param o: gap opening score
+    :param e: gap extension score
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    return fill_affine(m, s, o, e, sequence1, sequence2, al, False, substitution)
+
+
+def compute_smith_waterman_affine(m, s, o, e, sequence1, sequence2, al, substitution=None):
+    """
+    Compute procedure matrix and traceback matrix for the Smith-Waterman algorithm with affine gap score.
+    With o equal to 0 and e at most 0 the scores are the same of compute_smith_waterman with g equal to e; with a
+    positive e a linear local alignment can start with a gap, an affine one cannot
+    :param m: match score
+    :param s: mismatch score
+    :param o: gap opening score
+    :param e: gap extension score
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    return fill_affine(m, s, o, e, sequence1, sequence2, al, True, substitution)
+
+
+def score_needleman_wunsch(m, s, g, sequence1, sequence2, substitution=None):
+    """
+    Compute the score of the optimal global alignment keeping only two rows of the procedure matrix
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    (codes1, codes2), table = encode_sequences(m, s, (sequence1, sequence2), substitution)
+    dtype = score_dtype(table.max(), table.min(), g, len(codes1), len(codes2))
+    profile = score_profile(table.astype(dtype), codes2)
+    row = np.arange(len(codes2) + 1, dtype=dtype) * g
+    for i in range(len(codes1)):
+        row = fill_row(row, (i + 1) * g, profile[codes1[i]], g, False)
+    return int(row[-1])
+
+
+def hirschberg_block(profile, g, codes1, top, left, steps):
+    """
+    Align a block of the procedure matrix keeping all its rows, given its first row and first column
+    :param profile: score profile of the second sequence, restricted to the columns of the block
+    :param g: gap score
+    :param codes1: encoded first sequence, restricted to the rows of the block
+    :param top: first row of the block
+    :param left: first column of the block
+    :param steps: list where the steps from the last cell to the first one are appended
+    """
+    rows = [top]
+    traceback_rows = []
+    for i in range(len(codes1)):
+        previous = rows[-1]
+        sigma = profile[codes1[i]]
+        row = fill_row(previous, left[i + 1], sigma, g, False)
+        traceback_rows.append(step_row(previous[:-1] + sigma, previous[1:] + g, row[:-1] + g, 0, False))
+        rows.append(row)
+
+    r = len(codes1)
+    c = profile.shape[1]
+    while r > 0 and c > 0:
+        step = traceback_rows[r - 1][c - 1]
+        steps.append(step)
+        if step == Step.DIAG.value:
+            r -= 1
+            c -= 1
+        elif step == Step.UP.value:
+            r -= 1
+        else:
+            c -= 1
+    # On the first row and column of the block the alignment can only move towards the first cell
+    steps.extend([Step.UP.value] * r + [Step.LEFT.value] * c)
+    return rows[-1][-1]
+
+
+def hirschberg_split(profile, g, codes1, top, left, steps):
+    """
+    Divide and conquer step of the Hirschberg algorithm.
+    The block is split at its middle row: a forward pass propagates, for every cell below that row, the column where
+    the traceback from the cell crosses the middle row. The two sub-blocks touching the crossing cell are then aligned
+    recursively, so the steps are the same that the full traceback matrix would give.
+    :param profile: score profile of the second sequence, restricted to the columns of the block
+    :param g: gap score
+    :param codes1: encoded first sequence, restricted to the rows of the block
+    :param top: first row of the block
+    :param left: first column of the block
+    :param steps: list where the steps from the last cell to the first one are appended
+    """
+    height = len(codes1)
+    width = profile.shape[1]
+    if height <= 1 or (height + 1) * (width + 1) <= HIRSCHBERG_BLOCK_CELLS:
+        return hirschberg_block(profile, g, codes1, top, left, steps)
+
+    middle = height // 2
+    columns = np.arange(width + 1)
+    row = top
+    middle_row = None
+    crossing = columns
+    for i in range(height):
+        previous = row
+        sigma = profile[codes1[i]]
+        row = fill_row(previous, left[i + 1], sigma, g, False)
+        if i + 1 == middle:
+            middle_row = row
+        elif i + 1 > middle:
+            step = step_row(previous[:-1] + sigma, previous[1:] + g, row[:-1] + g, 0, False)
+            from_previous = np.empty_like(crossing)
+            from_previous[0] = crossing[0]
+            from_previous[1:] = np.where(step == Step.DIAG.value, crossing[:-1], crossing[1:])
+            # Cells reached with a left step take the crossing of the closest cell on their left that is not
+            not_left = np.ones(width + 1, dtype=bool)
+            not_left[1:] = step != Step.LEFT.value
+            crossing = from_previous[np.maximum.accumulate(np.where(not_left, columns, 0))]
+    score = row[-1]
+    c = int(crossing[-1])
+
+    # First column of the lower block
+    lower_left = np.empty(height - middle + 1, dtype=middle_row.dtype)
+    lower_left[0] = middle_row[c]
+    row = middle_row[:c + 1]
+    for i in range(middle, height):
+        row = fill_row(row, left[i + 1], profile[codes1[i], :c], g, False)
+        lower_left[i - middle + 1] = row[-1]
+
+    hirschberg_split(profile[:, c:], g, codes1[middle:], middle_row[c:], lower_left, steps)
+    hirschberg_split(profile[:, :c], g, codes1[:middle], top[:c + 1], left[:middle + 1], steps)
+    return score
+
+
+def hirschberg(m, s, g, sequence1, sequence2, substitution=None):
+    """
+    Compute one optimal global alignment in linear memory with the Hirschberg algorithm.
+    The alignment is the same returned by the Needleman-Wunsch traceback when only one alignment is requested
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    (codes1, codes2), table = encode_sequences(m, s, (sequence1, sequence2), substitution)
+    dtype = score_dtype(table.max(), table.min(), g, len(codes1), len(codes2))
+    steps = []
+    score = hirschberg_split(score_profile(table.astype(dtype), codes2), g, codes1,
+                             np.arange(len(codes2) + 1, dtype=dtype) * g, np.arange(len(codes1) + 1, dtype=dtype) * g,
+                             steps)
+
+    letters = {Step.DIAG.value: 'D', Step.UP.value: 'U', Step.LEFT.value: 'L'}
+    return Alignment(int(score), sequence1, sequence2, 0, 0, ''.join(letters[step] for step in reversed(steps)))
+
+
+def score_smith_waterman(m, s, g, sequence1, sequence2, cells=1, substitution=None):
+    """
+    Compute the score of the optimal local alignments and the cells where they end keeping only two rows of the
+    procedure matrix: the maximum and its cells are updated after every row
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param cells: maximum number of end cells to return, in row-major order, None to return all of them
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    (codes1, codes2), table = encode_sequences(m, s, (sequence1, sequence2), substitution)
+    dtype = score_dtype(table.max(), table.min(), g, len(codes1), len(codes2))
+    profile = score_profile(table.astype(dtype), codes2)
+    row = np.zeros(len(codes2) + 1, dtype=dtype)
+    best = row.max()
+    ends = [(0, np.flatnonzero(row == best)[:cells])]
+    found = len(ends[0][1])
+    for i in range(len(codes1)):
+        row = fill_row(row, 0, profile[codes1[i]], g, True)
+        score = row.max()
+        if score > best:
+            best = score
+            ends = []
+            found = 0
+        if score == best and (cells is None or found < cells):
+            columns = np.flatnonzero(row == best)[:None if cells is None else cells - found]
+            ends.append((i + 1, columns))
+            found += len(columns)
+    rows = np.concatenate([np.full(len(columns), i) for i, columns in ends])
+    return int(best), rows, np.concatenate([columns for _, columns in ends])
+
+
+def local_start(profile, g, codes1, r, c, score, best_substitution):
+    """
+    Find the first row and column of the rectangle that holds every optimal local alignment ending at a cell.
+    The prefixes before the cell are aligned backwards from it, with the global recurrence: an alignment with the
+    optimal score can start only where the backward score is equal to it. With a negative gap score the backward
+    rows and columns are bounded, as an alignment with D diagonal steps and the optimal score has at most
+    (best_substitution * D - score) / -g gaps
+    :param profile: score profile of the second sequence
+    :param g: gap score
+    :param codes1: encoded first sequence
+    :param r: row of the last cell of the alignments
+    :param c: column of the last cell of the alignments
+    :param score: score of the alignments
+    :param best_substitution: highest score of the profile
+    """
+    height = r
+    width = c
+    if g < 0:
+        diagonal = min(r, c)
+        gaps = max(0, (int(best_substitution) * diagonal - int(score)) // -int(g))
+        height = min(r, diagonal + gaps)
+        width = min(c, diagonal + gaps)
+    reversed_profile = profile[:, c - width:c][:, ::-1]
+    row = np.arange(width + 1, dtype=profile.dtype) * g
+    start_r = 0
+    start_c = int(np.flatnonzero(row == score).max(initial=0))
+    for i in range(height):
+        row = fill_row(row, (i + 1) * g, reversed_profile[codes1[r - 1 - i]], g, False)
+        columns = np.flatnonzero(row == score)
+        if len(columns):
+            start_r = i + 1
+            start_c = max(start_c, int(columns[-1]))
+    return r - start_r, c - start_c
+
+
+def smith_waterman_linear(m, s, g, sequence1, sequence2, al=0, limit=None, substitution=None):
+    """
+    Compute the optimal local alignments without keeping the whole matrices.
+    A first pass with score_smith_waterman finds the score and the end cells; for every end cell local_start bounds
+    the rectangle of its alignments, and only that rectangle is filled and traced back. The alignments are the same,
+    in the same order, as the ones of traceback_smith_waterman, and memory is proportional to the rectangles instead
+    of the whole matrix
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param limit: maximum number of alignments to return, None to return all of them
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    # Every end cell gives at least one alignment, so no more than limit of them are needed
+    cells = 1 if al == 0 else limit
+    score, rows, columns = score_smith_waterman(m, s, g, sequence1, sequence2, cells, substitution)
+    (codes1, codes2), table = encode_sequences(m, s, (sequence1, sequence2), substitution)
+    profile = score_profile(table.astype(score_dtype(table.max(), table.min(), g, len(codes1), len(codes2))), codes2)
+    found = 0
+    for r, c in zip(rows.tolist(), columns.tolist()):
+        if score <= 0:  # The traceback stops at once on cells without a positive score
+            alignments = [Alignment(score, sequence1, sequence2, r, c, '')][:None if limit is None else limit - found]
+        else:
+            r0, c0 = local_start(profile, g, codes1, r, c, score, table.max())
+            matrix, traceback = compute_smith_waterman(m, s, g, sequence1[r0:r], sequence2[c0:c], al,
+                                                       substitution=substitution)
+            alignments = (Alignment(alignment.score, sequence1, sequence2, alignment.r + r0, alignment.c + c0,
+                                    alignment.steps)
+                          for alignment in path(sequence1[r0:r], sequence2[c0:c], traceback, r - r0, c - c0,
+                                                matrix[r - r0, c - c0], None if limit is None else limit - found))
+        for alignment in alignments:
+            found += 1
+            yield alignment
+        if al == 0 or found == limit:
+            return
+
+
+def path(sequence1, sequence2, traceback_matrix, r, c, score, limit=None):
+    """
+    Compute alignments from the traceback matrix, yielding them one at a time.
+    Every partial alignment is a linked list (step, suffix), so the alignments that branch from the same cell share
+    their suffix instead of copying it
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param traceback_matrix: traceback matrix
+    :param r: row position where the alignment start
     :param c: column position where the alignment start
+    :param score: score of the alignments
+    :param limit: maximum number of alignments to return, None to return all of them
     """
     # Initializing the first alignment
-    alignments = [['', '', r, c]]
-
-    while len(alignments) != 0:  # As long as there are alignments
-        flag = 0
-        alignment = alignments[0]
-        s = alignment[0]
-        t = alignment[1]
-        r = alignment[2]
-        c = alignment[3]
-        if traceback_matrix[r, c] == Step.STOP.value:  # End of alignment
-            print(f"Alignment with score {score}:")
-            print(alignment[0])
-            print(alignment[1])
-            alignments.remove(alignment)
-        else:  # Traceback step
-            if traceback_matrix[r, c] in [Step.DIAG.value, Step.DIAG_UP.value, Step.DIAG_LEFT.value,
-                                          Step.DIAG_UP_LEFT.value]:  # Traceback step is diagonal
-                alignments[0] = [sequence1[r - 1] + s, sequence2[c - 1] + t, r - 1, c - 1]
-                flag = 1
-            if traceback_matrix[r, c] in [Step.LEFT.value, Step.DIAG_LEFT.value, Step.UP_LEFT.value,
-                                          Step.DIAG_UP_LEFT.value]:  # Traceback step is left
-                if flag:
-                    alignments.append(['-' + s, sequence2[c - 1] + t, r, c - 1])
-                else:
-                    alignments[0] = ['-' + s, sequence2[c - 1] + t, r, c - 1]
-                    flag = 1
-            if traceback_matrix[r, c] in [Step.UP.value, Step.DIAG_UP.value, Step.UP_LEFT.value,
-                                          Step.DIAG_UP_LEFT.value]:  # Traceback step is up
-                if flag:
-                    alignments.append([sequence1[r - 1] + s, '-' + t, r - 1, c])
-                else:
-                    alignments[0] = [sequence1[r - 1] + s, '-' + t, r - 1, c]
-
-
-def traceback_smith_waterman(sequence1, sequence2, procedure_matrix, traceback_matrix, al):
-    """
-    Find the row and column coordinates of the cells with the maximum score
+    alignments = deque([(r, c, None)])
+    found = 0
+
+    while alignments and (limit is None or found < limit):  # As long as there are alignments
+        r, c, suffix = alignments.popleft()
+        moves = TRACEBACK_MOVES[int(traceback_matrix[r, c])]
+        while moves:  # Traceback step, the other branches are explored later
+            for step, up, left in moves[1:]:
+                alignments.append((r - up, c - left, (step, suffix)))
+            step, up, left = moves[0]
+            r -= up
+            c -= left
+            suffix = (step, suffix)
+            moves = TRACEBACK_MOVES[int(traceback_matrix[r, c])]
+
+        # End of alignment
+        steps = []
+        while suffix is not None:
+            step, suffix = suffix
+            steps.append(step)
+        found += 1
+        yield Alignment(score, sequence1, sequence2, r, c, ''.join(steps))
+
+
+def affine_states(code, flags):
+    """
+    States whose flag is set in a cell of the affine gap traceback matrix, [None] if there are none
+    :param code: cell of the traceback matrix
+    :param flags: flags of the states M, X and Y
+    """
+    return [state for state, flag in enumerate(flags) if code & flag] or [None]
+
+
+def path_affine(sequence1, sequence2, traceback_matrix, r, c, score, limit=None):
+    """
+    Compute alignments from the affine gap traceback matrix, yielding them one at a time.
+    Every branch follows a state (0 for M, 1 for X, 2 for Y) besides the cell, so alignments that differ only in the
+    matrices they go through are not repeated
     :param sequence1: first sequence
     :param sequence2: second sequence
-    :param procedure_matrix: procedure matrix
+    :param traceback_matrix: traceback matrix of fill_affine
+    :param r: row position where the alignment start
+    :param c: column position where the alignment start
+    :param score: score of the alignments
+    :param limit: maximum number of alignments to return, None to return all of them
+    """
+    alignments = deque((r, c, state, None) for state in affine_states(int(traceback_matrix[r, c]), BEST_FLAGS))
+    found = 0
+
+    while alignments and (limit is None or found < limit):  # As long as there are alignments
+        r, c, state, suffix = alignments.popleft()
+        while state is not None:  # Traceback step, the other branches are explored later
+            step, up, left = AFFINE_MOVES[state]
+            code = int(traceback_matrix[r, c])
+            if state == 0:
+                states = [None] if code & Transition.START.value else \
+                    affine_states(int(traceback_matrix[r - 1, c - 1]), BEST_FLAGS)
+            else:
+                states = affine_states(code, X_FLAGS if state == 1 else Y_FLAGS)
+            for other in states[1:]:
+                alignments.append((r - up, c - left, other, (step, suffix)))
+            r -= up
+            c -= left
+            suffix = (step, suffix)
+            state = states[0]
+
+        # End of alignment
+        steps = []
+        while suffix is not None:
+            step, suffix = suffix
+            steps.append(step)
+        found += 1
+        yield Alignment(score, sequence1, sequence2, r, c, ''.join(steps))
+
+
+def count_alignments(traceback_matrix, r, c):
+    """
+    Count the alignments that the traceback from a cell would return, without computing them.
+    The count of a cell is the sum of the counts of the cells its step points to, and 1 for the cells that stop
     :param traceback_matrix: traceback matrix
-    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param r: row position where the alignment start
+    :param c: column position where the alignment start
+    """
+    diag = np.array([any(step == 'D' for step, _, _ in TRACEBACK_MOVES[code]) for code in range(len(Step))])
+    up = np.array([any(step == 'U' for step, _, _ in TRACEBACK_MOVES[code]) for code in range(len(Step))])
+    left = np.array([any(step == 'L' for step, _, _ in TRACEBACK_MOVES[code]) for code in range(len(Step))])
+    columns = np.arange(c + 1)
+    counts = np.zeros(c + 1, dtype=np.int64)
+    for i in range(r + 1):
+        codes = traceback_matrix[i, :c + 1]
+        # Switch to Python integers before the counts of the row can overflow
+        if counts.dtype != object and 3 * (c + 1) * int(counts.max(initial=1)) >= np.iinfo(np.int64).max:
+            counts = counts.astype(object)
+        row = np.where(up[codes], counts, 0)
+        row[1:] += np.where(diag[codes[1:]], counts[:-1], 0)
+        row[codes == Step.STOP.value] = 1
+        # A run of cells with a left step adds up the counts from the first cell of the run
+        starts = np.maximum.accumulate(np.where(left[codes], 0, columns))
+        cumulative = np.cumsum(row)
+        counts = cumulative - cumulative[starts] + row[starts]
+    return int(counts[c])
+
+
+def max_cells(procedure_matrix):
     """
+    Find the maximum score and the row and column coordinates of the cells with that score
+    :param procedure_matrix: procedure matrix
+    """
+    if isinstance(procedure_matrix, (BandedMatrix, RaggedMatrix)):
+        return procedure_matrix.max_cells()
     score = np.max(procedure_matrix)
     max_xy = np.where(procedure_matrix == score)
-    x = max_xy[0]
-    y = max_xy[1]
+    return score, max_xy[0], max_xy[1]
+
+
+def traceback_cells(sequence1, sequence2, traceback_matrix, score, x, y, al, limit=None, trace=path):
+    """
+    Yield the alignments ending in the cells with the maximum score, found by max_cells
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param traceback_matrix: traceback matrix
+    :param score: maximum score
+    :param x: row coordinates of the cells with the maximum score
+    :param y: column coordinates of the cells with the maximum score
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param limit: maximum number of alignments to return, None to return all of them
+    :param trace: function that yields the alignments from a cell, path or path_affine
+    """
+    found = 0
     for i in range(len(x)):
-        path(sequence1, sequence2, traceback_matrix, x[i], y[i], score)
-        if al == 0:
+        for alignment in trace(sequence1, sequence2, traceback_matrix, x[i], y[i], score,
+                               None if limit is None else limit - found):
+            found += 1
+            yield alignment
+        if al == 0 or found == limit:
             return
 
 
-if __name__ == '__main__':
-    parser = OptionParser()
+def traceback_smith_waterman(sequence1, sequence2, procedure_matrix, traceback_matrix, al, limit=None, trace=path):
+    """
+    Find the row and column coordinates of the cells with the maximum score and yield the alignments ending there
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param procedure_matrix: procedure matrix
+    :param traceback_matrix: traceback matrix
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param limit: maximum number of alignments to return, None to return all of them
+    :param trace: function that yields the alignments from a cell, path or path_affine
+    """
+    score, x, y = max_cells(procedure_matrix)
+    yield from traceback_cells(sequence1, sequence2, traceback_matrix, score, x, y, al, limit, trace)
+
+
+def count_smith_waterman(procedure_matrix, traceback_matrix, al):
+    """
+    Count the alignments that traceback_smith_waterman would return, without computing them
+    :param procedure_matrix: procedure matrix
+    :param traceback_matrix: traceback matrix
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    """
+    _, x, y = max_cells(procedure_matrix)
+    cells = len(x) if al else 1
+    return sum(count_alignments(traceback_matrix, x[i], y[i]) for i in range(cells))
+
+
+def traceback_alignments(sequence1, sequence2, procedure_matrix, traceback_matrix, algorithm, al, limit, trace=path,
+                         statistics=None):
+    """
+    Compute the optimal alignments from the procedure matrix and the traceback matrix
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param procedure_matrix: procedure matrix
+    :param traceback_matrix: traceback matrix
+    :param algorithm: 'global' for the Needleman-Wunsch algorithm, 'local' for the Smith-Waterman algorithm
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param limit: maximum number of alignments to return, None to return all of them
+    :param trace: function that yields the alignments from a cell, path or path_affine
+    :param statistics: AlignmentStatistics where the 'maximum' and 'traceback' phases are recorded, None to record
+    nothing
+    """
+    start = time.perf_counter() if statistics is not None else None
+    if algorithm == 'local':
+        score, x, y = max_cells(procedure_matrix)
+        if statistics is not None:
+            start = statistics.record('maximum', start)
+        alignments = list(traceback_cells(sequence1, sequence2, traceback_matrix, score, x, y, al, limit, trace))
+    else:
+        alignments = list(trace(sequence1, sequence2, traceback_matrix, len(sequence1), len(sequence2),
+                                procedure_matrix[len(sequence1), len(sequence2)], limit))
+    if statistics is not None:
+        statistics.record('traceback', start)
+        statistics.alignments += len(alignments)
+    return alignments
+
+
+def check_algorithm(algorithm):
+    """
+    Check that the alignment algorithm exists
+    :param algorithm: name of the algorithm
+    """
+    if algorithm not in ('global', 'local'):
+        raise ValueError(f"Unknown algorithm '{algorithm}', choose 'local' or 'global'")
+
+
+def cache_key(m, s, g, sequence1, sequence2, substitution=None, **options):
+    """
+    Hash of everything that changes the alignments of two sequences, the key of AlignmentCache
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    :param options: other arguments of align that change the alignments
+    """
+    digest = hashlib.sha256()
+    digest.update(repr((m, s, g, sorted(options.items()))).encode())
+    if substitution is not None:
+        digest.update(substitution.alphabet.encode())
+        digest.update(substitution.scores.tobytes())
+    for sequence in (sequence1, sequence2):
+        data = sequence.encode()
+        digest.update(len(data).to_bytes(8, 'little'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def align(m, s, g, sequence1, sequence2, algorithm='global', al=0, limit=None, engine='auto', band=None,
+          gap_open=None, substitution=None, linear=False, cache=None, statistics=None, threads=1):
+    """
+    Compute the optimal alignments of two sequences
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param algorithm: 'global' for the Needleman-Wunsch algorithm, 'local' for the Smith-Waterman algorithm
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param limit: maximum number of alignments to return, None to return all of them
+    :param engine: engine used to fill the matrices
+    :param band: None to fill the whole matrices, otherwise the band of compute_needleman_wunsch_banded and
+    compute_smith_waterman_banded
+    :param gap_open: None for the linear gap score, otherwise the gap opening score of the affine gap score, with g as
+    gap extension score
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    :param linear: True to align in linear memory, with hirschberg (only one alignment) for the global algorithm and
+    smith_waterman_linear for the local one
+    :param cache: AlignmentCache where the alignments are looked up before computing them, None to always compute them
+    :param statistics: AlignmentStatistics where the phases of the call are recorded, None to record nothing
+    :param threads: number of threads filling the whole matrices, only with the 'numba' engine; None for one for every
+    processor with it and 1 with the other engines
+    """
+    check_algorithm(algorithm)
+    start = time.perf_counter() if statistics is not None else None
+    if cache is not None:
+        key = cache_key(m, s, g, sequence1, sequence2, substitution, algorithm=algorithm, al=al, limit=limit, band=band,
+                        gap_open=gap_open, linear=linear)
+        alignments = cache.get(key, sequence1, sequence2)
+        if alignments is None:
+            alignments = align(m, s, g, sequence1, sequence2, algorithm, al, limit, engine, band, gap_open,
+                               substitution, linear, statistics=statistics, threads=threads)
+            cache.put(key, alignments)
+        elif statistics is not None:
+            statistics.record('cache', start)
+            statistics.alignments += len(alignments)
+            statistics.finish()
+        return alignments
+    if linear:
+        if band is not None or gap_open is not None:
+            raise ValueError("The linear memory alignment is available only without band and with the linear gap score")
+        if algorithm == 'local':
+            alignments = list(smith_waterman_linear(m, s, g, sequence1, sequence2, al, limit, substitution))
+        else:
+            alignments = [hirschberg(m, s, g, sequence1, sequence2, substitution)][:limit]
+        if statistics is not None:
+            statistics.record('linear', start)
+            statistics.alignments += len(alignments)
+            statistics.finish()
+        return alignments
+    trace = path
+    if gap_open is not None:
+        if band is not None:
+            raise ValueError("The band is available only with the linear gap score")
+        compute = compute_smith_waterman_affine if algorithm == 'local' else compute_needleman_wunsch_affine
+        matrix, traceback = compute(m, s, gap_open, g, sequence1, sequence2, al, substitution)
+        trace = path_affine
+    elif band is not None:
+        compute = compute_smith_waterman_banded if algorithm == 'local' else compute_needleman_wunsch_banded
+        matrix, traceback = compute(m, s, g, sequence1, sequence2, al, band, substitution)
+    else:
+        compute = compute_smith_waterman if algorithm == 'local' else compute_needleman_wunsch
+        matrix, traceback = compute(m, s, g, sequence1, sequence2, al, engine, substitution, threads)
+    if statistics is None:
+        return traceback_alignments(sequence1, sequence2, matrix, traceback, algorithm, al, limit, trace)
+    statistics.record('fill', start)
+    statistics.matrices(matrix, traceback)
+    alignments = traceback_alignments(sequence1, sequence2, matrix, traceback, algorithm, al, limit, trace, statistics)
+    statistics.finish()
+    return alignments
+
+
+def align_python(m, s, g, sequence1, sequence2, algorithm='global', al=0, limit=None):
+    """
+    Compute the optimal alignments of two short sequences in pure Python, with the same results of align: the matrices
+    are ListMatrix filled by fill_scalar, so NumPy is not imported. For pairs of a few thousand cells it is faster
+    than importing NumPy
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param sequence1: first sequence
+    :param sequence2: second sequence
+    :param algorithm: 'global' for the Needleman-Wunsch algorithm, 'local' for the Smith-Waterman algorithm
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param limit: maximum number of alignments to return, None to return all of them
+    """
+    check_algorithm(algorithm)
+    local = algorithm == 'local'
+    len1 = len(sequence1)
+    len2 = len(sequence2)
+    alphabet = {character: code for code, character in enumerate(sorted(set(sequence1 + sequence2)))}
+    table = [[m if a == b else s for b in range(len(alphabet))] for a in range(len(alphabet))]
+    procedure_matrix = ListMatrix(len1 + 1, len2 + 1)
+    traceback_matrix = ListMatrix(len1 + 1, len2 + 1)
+    if not local:
+        for i in range(1, len1 + 1):
+            procedure_matrix[i, 0] = i * g
+            traceback_matrix[i, 0] = Step.UP.value
+        for j in range(1, len2 + 1):
+            procedure_matrix[0, j] = j * g
+            traceback_matrix[0, j] = Step.LEFT.value
+    fill_scalar(procedure_matrix, traceback_matrix, table, g, [alphabet[character] for character in sequence1],
+                [alphabet[character] for character in sequence2], al, local)
+    if local:
+        score, x, y = procedure_matrix.max_cells()
+        return list(traceback_cells(sequence1, sequence2, traceback_matrix, score, x, y, al, limit))
+    return list(path(sequence1, sequence2, traceback_matrix, len1, len2, procedure_matrix[len1, len2], limit))
+
+
+class IncrementalAligner:
+    """
+    Alignment of two sequences that grow. The procedure and traceback matrices are kept, with room for more rows and
+    columns, and appending characters to a sequence fills only the new rows or columns: the cost of an update is the
+    number of new characters times the length of the other sequence. A new column is filled with the recurrence of
+    fill_row along the column, where the prefix max resolves the up term instead of the left one
+    """
+
+    def __init__(self, m, s, g, algorithm='global', al=0, sequence1='', sequence2='', substitution=None):
+        """
+        :param m: match score
+        :param s: mismatch score
+        :param g: gap score
+        :param algorithm: 'global' for the Needleman-Wunsch algorithm, 'local' for the Smith-Waterman algorithm
+        :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+        :param sequence1: initial first sequence
+        :param sequence2: initial second sequence
+        :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+        """
+        check_algorithm(algorithm)
+        self.m = m
+        self.s = s
+        self.g = g
+        self.local = algorithm == 'local'
+        self.al = al
+        self.substitution = substitution
+        self.parts1 = []
+        self.parts2 = []
+        self.len1 = 0
+        self.len2 = 0
+        self.best = 0
+        self.procedure_matrix = np.zeros((1, 1), dtype=np.int16)
+        self.traceback_matrix = np.zeros((1, 1), dtype=np.uint8)
+        dtype = np.uint32 if substitution is None else np.uint8
+        self.codes1 = np.zeros(0, dtype=dtype)
+        self.codes2 = np.zeros(0, dtype=dtype)
+        self.extend1(sequence1)
+        self.extend2(sequence2)
+
+    @property
+    def sequence1(self):
+        """
+        First sequence, joining the appended characters only when it is requested
+        """
+        self.parts1[:] = [''.join(self.parts1)]
+        return self.parts1[0]
+
+    @property
+    def sequence2(self):
+        """
+        Second sequence, joining the appended characters only when it is requested
+        """
+        self.parts2[:] = [''.join(self.parts2)]
+        return self.parts2[0]
+
+    @property
+    def matrices(self):
+        """
+        Procedure matrix and traceback matrix of the current sequences
+        """
+        return (self.procedure_matrix[:self.len1 + 1, :self.len2 + 1],
+                self.traceback_matrix[:self.len1 + 1, :self.len2 + 1])
+
+    @property
+    def score(self):
+        """
+        Score of the optimal alignments of the current sequences
+        """
+        return int(self.best if self.local else self.procedure_matrix[self.len1, self.len2])
+
+    def encode(self, sequence):
+        """
+        Encode characters as the codes used by substitution_scores
+        :param sequence: characters to encode
+        """
+        if self.substitution is None:
+            return encode_sequence(sequence)
+        return self.substitution.encode(sequence)
+
+    def substitution_scores(self, code, codes):
+        """
+        Scores of a character against many characters, as encoded by encode
+        :param code: code of the character
+        :param codes: codes of the other characters
+        """
+        dtype = self.procedure_matrix.dtype
+        if self.substitution is None:
+            return np.where(codes == code, dtype.type(self.m), dtype.type(self.s))
+        return self.substitution.scores[code, codes].astype(dtype)
+
+    def reserve(self, len1, len2):
+        """
+        Make room for the matrices of sequences of the given lengths, doubling the room that is missing so that the
+        copies cost a constant time per cell, and use a larger integer type when the scores could overflow
+        :param len1: length of the first sequence
+        :param len2: length of the second sequence
+        """
+        rows, columns = self.procedure_matrix.shape
+        if len1 < rows and len2 < columns:
+            return
+        if len1 >= rows:
+            rows = max(2 * rows, len1 + 1)
+        if len2 >= columns:
+            columns = max(2 * columns, len2 + 1)
+        best, worst = (self.m, self.s) if self.substitution is None else (self.substitution.scores.max(),
+                                                                          self.substitution.scores.min())
+        procedure_matrix = np.zeros((rows, columns), dtype=score_dtype(best, worst, self.g, rows, columns))
+        traceback_matrix = np.zeros((rows, columns), dtype=np.uint8)
+        procedure_matrix[:self.len1 + 1, :self.len2 + 1] = self.procedure_matrix[:self.len1 + 1, :self.len2 + 1]
+        traceback_matrix[:self.len1 + 1, :self.len2 + 1] = self.traceback_matrix[:self.len1 + 1, :self.len2 + 1]
+        self.procedure_matrix = procedure_matrix
+        self.traceback_matrix = traceback_matrix
+        for name, size in (('codes1', rows - 1), ('codes2', columns - 1)):
+            codes = getattr(self, name)
+            grown = np.zeros(size, dtype=codes.dtype)
+            grown[:len(codes)] = codes
+            setattr(self, name, grown)
+
+    def extend1(self, characters):
+        """
+        Append characters to the first sequence, filling the new rows of the matrices
+        :param characters: characters to append
+        """
+        codes = self.encode(characters)
+        self.reserve(self.len1 + len(codes), self.len2)
+        self.codes1[self.len1:self.len1 + len(codes)] = codes
+        self.parts1.append(characters)
+        procedure_matrix, traceback_matrix, g = self.procedure_matrix, self.traceback_matrix, self.g
+        codes2 = self.codes2[:self.len2]
+        for i in range(self.len1 + 1, self.len1 + len(codes) + 1):
+            previous = procedure_matrix[i - 1, :self.len2 + 1]
+            sigma = self.substitution_scores(self.codes1[i - 1], codes2)
+            row = fill_row(previous, 0 if self.local else i * g, sigma, g, self.local)
+            procedure_matrix[i, :self.len2 + 1] = row
+            traceback_matrix[i, 0] = Step.STOP.value if self.local else Step.UP.value
+            traceback_matrix[i, 1:self.len2 + 1] = step_row(previous[:-1] + sigma, previous[1:] + g, row[:-1] + g,
+                                                            self.al, self.local)
+            self.best = max(self.best, row.max())
+        self.len1 += len(codes)
+
+    def extend2(self, characters):
+        """
+        Append characters to the second sequence, filling the new columns of the matrices
+        :param characters: characters to append
+        """
+        codes = self.encode(characters)
+        self.reserve(self.len1, self.len2 + len(codes))
+        self.codes2[self.len2:self.len2 + len(codes)] = codes
+        self.parts2.append(characters)
+        procedure_matrix, traceback_matrix, g = self.procedure_matrix, self.traceback_matrix, self.g
+        codes1 = self.codes1[:self.len1]
+        for j in range(self.len2 + 1, self.len2 + len(codes) + 1):
+            previous = procedure_matrix[:self.len1 + 1, j - 1]
+            sigma = self.substitution_scores(self.codes2[j - 1], codes1)
+            column = fill_row(previous, 0 if self.local else j * g, sigma, g, self.local)
+            procedure_matrix[:self.len1 + 1, j] = column
+            traceback_matrix[0, j] = Step.STOP.value if self.local else Step.LEFT.value
+            traceback_matrix[1:self.len1 + 1, j] = step_row(previous[:-1] + sigma, column[:-1] + g, previous[1:] + g,
+                                                            self.al, self.local)
+            self.best = max(self.best, column.max())
+        self.len2 += len(codes)
+
+    def alignments(self, limit=None):
+        """
+        Compute the optimal alignments of the current sequences
+        :param limit: maximum number of alignments to return, None to return all of them
+        """
+        procedure_matrix, traceback_matrix = self.matrices
+        return traceback_alignments(self.sequence1, self.sequence2, procedure_matrix, traceback_matrix,
+                                    'local' if self.local else 'global', self.al, limit)
+
+    def __repr__(self):
+        return f"IncrementalAligner(len1={self.len1}, len2={self.len2}, score={self.score})"
+
+
+def kmer_hashes(sequence, k):
+    """
+    Hash of every k-mer of a sequence, in order of position: the polynomial of the codes of its characters with
+    KMER_HASH as variable, modulo 2^64
+    :param sequence: sequence
+    :param k: length of the k-mers
+    """
+    characters = encode_sequence(sequence).astype(np.uint64)
+    count = len(characters) - k + 1
+    hashes = np.zeros(max(count, 0), dtype=np.uint64)
+    for j in range(k if count > 0 else 0):
+        hashes *= np.uint64(KMER_HASH)
+        hashes += characters[j:j + count]
+    return hashes
+
+
+def build_kmer_index(sequence, k=SEED_LENGTH):
+    """
+    Index the k-mers of a sequence
+    :param sequence: sequence to index
+    :param k: length of the k-mers
+    """
+    hashes = kmer_hashes(sequence, k)
+    positions = np.argsort(hashes, kind='stable')
+    return KmerIndex(k, len(sequence), hashes[positions], positions)
+
+
+def load_kmer_index(filename):
+    """
+    Read an index written by KmerIndex.save
+    :param filename: name of the file
+    """
+    with np.load(filename) as data:
+        return KmerIndex(int(data['k']), int(data['length']), data['hashes'], data['positions'])
+
+
+def chain_seeds(rows, columns, margin, min_seeds=1):
+    """
+    Chain the seeds whose diagonals (column minus row) are at most margin apart, returning the first diagonal, the
+    last diagonal and the number of seeds of every chain with at least min_seeds seeds, sorted by diagonal
+    :param rows: positions of the seeds in the first sequence
+    :param columns: positions of the seeds in the second sequence
+    :param margin: maximum distance between the diagonals of two consecutive seeds of a chain
+    :param min_seeds: minimum number of seeds of a chain
+    """
+    diagonals = np.sort(columns - rows)
+    starts = np.flatnonzero(np.diff(diagonals, prepend=diagonals[:1] - margin - 1) > margin)
+    ends = np.append(starts[1:], len(diagonals))
+    keep = ends - starts >= min_seeds
+    return diagonals[starts[keep]], diagonals[ends[keep] - 1], (ends - starts)[keep]
+
+
+def seed_and_extend(m, s, g, sequence1, sequence2, algorithm='local', al=0, limit=None, k=SEED_LENGTH, index=None,
+                    margin=BAND_WIDTH, min_seeds=1, max_occurrences=None, substitution=None):
+    """
+    Compute the alignments of a query with a long sequence filling the matrices only around the k-mers they share,
+    returning the alignments and the fraction of the cells of the whole matrices that are not filled.
+    The k-mers of the query are looked up in an index of the second sequence and the seeds are chained by diagonal
+    with chain_seeds. For local alignment compute_smith_waterman fills the columns where the query lies along every
+    chain, with margin more columns on each side; for global alignment fill_banded fills the diagonals of the chain
+    with most seeds and of the first and last cell, with margin more diagonals on each side. Regions without seeds
+    are never aligned, so the alignments are optimal only inside the filled cells
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param sequence1: first sequence, the query
+    :param sequence2: second sequence
+    :param algorithm: 'global' for the Needleman-Wunsch algorithm, 'local' for the Smith-Waterman algorithm
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param limit: maximum number of alignments to return, None to return all of them
+    :param k: length of the k-mers, when the index is built here
+    :param index: KmerIndex of the second sequence, None to build it
+    :param margin: number of columns or diagonals filled around the chains, also the maximum distance between the
+    diagonals of the seeds of a chain
+    :param min_seeds: minimum number of seeds of a chain
+    :param max_occurrences: k-mers found more times in the second sequence are ignored, None to use all of them
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    check_algorithm(algorithm)
+    if index is None:
+        index = build_kmer_index(sequence2, k)
+    elif index.length != len(sequence2):
+        raise ValueError("The k-mer index is not an index of the second sequence")
+    len1 = len(sequence1)
+    len2 = len(sequence2)
+    rows, columns = index.lookup(kmer_hashes(sequence1, index.k), max_occurrences)
+    first, last, seeds = chain_seeds(rows, columns, margin, min_seeds)
+
+    if algorithm == 'global':
+        lower, upper = min(0, len2 - len1), max(0, len2 - len1)
+        if len(seeds):
+            best = np.argmax(seeds)
+            lower, upper = min(lower, int(first[best])), max(upper, int(last[best]))
+        matrix, traceback = fill_banded(m, s, g, sequence1, sequence2, al, max(lower - margin, -len1),
+                                        min(upper + margin, len2), False, substitution)
+        alignments = traceback_alignments(sequence1, sequence2, matrix, traceback, algorithm, al, limit)
+        return alignments, max(0.0, 1 - matrix.data.size / ((len1 + 1) * (len2 + 1)))
+
+    # Windows of columns around the chains, merged when they overlap
+    windows = []
+    for start, stop in zip((first - margin).tolist(), (last + len1 + margin).tolist()):
+        start, stop = max(start, 0), min(stop, len2)
+        if windows and start <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], stop)
+        elif start < stop:
+            windows.append([start, stop])
+    filled = 0
+    best = []
+    for start, stop in windows:
+        matrix, traceback = compute_smith_waterman(m, s, g, sequence1, sequence2[start:stop], al,
+                                                   substitution=substitution)
+        filled += matrix.size
+        if not best or matrix.max() > best[0][1].max():
+            best = []
+        if not best or matrix.max() == best[0][1].max():
+            best.append((start, matrix, traceback))
+    alignments = []
+    for start, matrix, traceback in best:
+        window = sequence2[start:start + matrix.shape[1] - 1]
+        for alignment in traceback_smith_waterman(sequence1, window, matrix, traceback, al,
+                                                  None if limit is None else limit - len(alignments)):
+            alignments.append(Alignment(alignment.score, sequence1, sequence2, alignment.r, alignment.c + start,
+                                        alignment.steps))
+        if al == 0 or len(alignments) == limit:
+            break
+    return alignments, max(0.0, 1 - filled / ((len1 + 1) * (len2 + 1)))
+
+
+def align_batch(m, s, g, pairs, algorithm='global', al=0, limit=None, engine='auto', gap_open=None,
+                substitution=None):
+    """
+    Compute the optimal alignments of many pairs of sequences, filling the matrices of pairs with similar lengths
+    together with compute_batch
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param pairs: pairs of sequences
+    :param algorithm: 'global' for the Needleman-Wunsch algorithm, 'local' for the Smith-Waterman algorithm
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param limit: maximum number of alignments to return for each pair, None to return all of them
+    :param engine: engine used to fill the matrices, only the vectorized one fills many pairs together. 'auto' does
+    so only without Numba: the compiled kernel fills the pairs one at a time faster than the batches
+    :param gap_open: None for the linear gap score, otherwise the gap opening score of the affine gap score, whose
+    pairs are aligned one at a time
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    check_algorithm(algorithm)
+    engine = resolve_engine(engine)
+    if engine != 'vectorized' or gap_open is not None:
+        return [align(m, s, g, sequence1, sequence2, algorithm, al, limit, engine, gap_open=gap_open,
+                      substitution=substitution) for sequence1, sequence2 in pairs]
+
+    results = [None] * len(pairs)
+    order = sorted(range(len(pairs)), key=lambda k: (len(pairs[k][0]), len(pairs[k][1])))
+    start = 0
+    while start < len(order):
+        # Add pairs to the batch as long as the padded matrices fit in BATCH_CELLS
+        end = start + 1
+        len1 = len(pairs[order[start]][0])
+        len2 = len(pairs[order[start]][1])
+        while end < len(order):
+            len1 = max(len1, len(pairs[order[end]][0]))
+            len2 = max(len2, len(pairs[order[end]][1]))
+            if (end - start + 1) * (len1 + 1) * (len2 + 1) > BATCH_CELLS:
+                break
+            end += 1
+        batch = [pairs[k] for k in order[start:end]]
+        matrices = compute_batch(m, s, g, batch, al, algorithm == 'local', substitution)
+        for k, (sequence1, sequence2), (matrix, traceback) in zip(order[start:end], batch, matrices):
+            results[k] = traceback_alignments(sequence1, sequence2, matrix, traceback, algorithm, al, limit)
+        start = end
+    return results
+
+
+def align_many(pairs, m, s, g, algorithm='global', al=0, limit=None, engine='auto', workers=None,
+               chunksize=None, executor=None, gap_open=None, substitution=None, cache=None):
+    """
+    Compute the optimal alignments of many pairs of sequences with a pool of processes.
+    The pairs are sent to the workers in chunks, aligned with align_batch, and the alignments are returned in the
+    order of the pairs
+    :param pairs: pairs of sequences
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param algorithm: 'global' for the Needleman-Wunsch algorithm, 'local' for the Smith-Waterman algorithm
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param limit: maximum number of alignments to return for each pair, None to return all of them
+    :param engine: engine used to fill the matrices
+    :param workers: number of processes, None to use all the CPUs and 1 to align in the current process
+    :param chunksize: number of pairs sent to a worker at a time, None to split the pairs in 4 chunks for each worker
+    :param executor: pool of processes to use instead of starting a new one
+    :param gap_open: None for the linear gap score, otherwise the gap opening score of the affine gap score
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    :param cache: AlignmentCache where the pairs are looked up before sending the missing ones to the workers, None
+    to align all of them
+    """
+    pairs = list(pairs)
+    check_algorithm(algorithm)
+    check_engine(engine)
+    if cache is not None:
+        keys = [cache_key(m, s, g, sequence1, sequence2, substitution, algorithm=algorithm, al=al, limit=limit,
+                          band=None, gap_open=gap_open, linear=False) for sequence1, sequence2 in pairs]
+        results = [cache.get(key, sequence1, sequence2) for key, (sequence1, sequence2) in zip(keys, pairs)]
+        missing = [k for k, alignments in enumerate(results) if alignments is None]
+        computed = align_many([pairs[k] for k in missing], m, s, g, algorithm, al, limit, engine, workers, chunksize,
+                              executor, gap_open, substitution)
+        for k, alignments in zip(missing, computed):
+            cache.put(keys[k], alignments)
+            results[k] = alignments
+        return results
+    function = partial(align_batch, m, s, g, algorithm=algorithm, al=al, limit=limit, engine=engine,
+                       gap_open=gap_open, substitution=substitution)
+    workers = workers or os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, -(-len(pairs) // (4 * workers)))
+    chunks = [pairs[start:start + chunksize] for start in range(0, len(pairs), chunksize)]
+    if executor is not None:
+        results = executor.map(function, chunks)
+    elif workers == 1 or len(chunks) <= 1:
+        results = map(function, chunks)
+    else:
+        with futures.ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            results = list(executor.map(function, chunks))
+    return [alignments for chunk in results for alignments in chunk]
+
+
+def open_sequences(filename):
+    """
+    Open a FASTA or FASTQ file as text, decompressing it if it is compressed with gzip
+    :param filename: name of the file
+    """
+    with open(filename, 'rb') as file:
+        compressed = file.read(2) == b'\x1f\x8b'
+    return gzip.open(filename, 'rt') if compressed else open(filename)
+
+
+def read_sequences(filename):
+    """
+    Read the records of a FASTA or FASTQ file one at a time, as (name, sequence, quality).
+    The quality is None for FASTA records
+    :param filename: name of the file
+    """
+    with open_sequences(filename) as file:
+        lines = (line.strip() for line in file)
+        lines = (line for line in lines if line)
+        line = next(lines, None)
+        while line is not None:
+            if line[0] not in '>@':
+                raise ValueError(f"Invalid record header in {filename}: {line[:50]}")
+            name = line[1:].split(maxsplit=1)[0] if line[1:].strip() else ''
+            sequence = []
+            line = next(lines, None)
+            while line is not None and line[0] not in '>+':
+                sequence.append(line)
+                line = next(lines, None)
+            sequence = ''.join(sequence)
+            quality = None
+            if line is not None and line[0] == '+':  # FASTQ record
+                quality = []
+                length = 0
+                while length < len(sequence):
+                    line = next(lines, None)
+                    if line is None:
+                        raise ValueError(f"Truncated quality of the record {name} in {filename}")
+                    quality.append(line)
+                    length += len(line)
+                quality = ''.join(quality)
+                line = next(lines, None)
+            yield name, sequence, quality
+
+
+def pair_sequences(query, reference=None, pairing='query'):
+    """
+    Pair the records of FASTA or FASTQ files, reading them one at a time.
+    The reference file is read again for every query, so memory does not depend on the size of the files
+    :param query: name of the file of the queries
+    :param reference: name of the file of the references
+    :param pairing: 'query' to pair every query with every reference, 'all' to pair every two records of the query
+    file and 'paired' to pair the records of the two files in order
+    """
+    if pairing == 'all':
+        for i, record in enumerate(read_sequences(query)):
+            for other in islice(read_sequences(query), i + 1, None):
+                yield record, other
+    elif reference is None:
+        raise ValueError(f"The '{pairing}' pairing needs a reference file")
+    elif pairing == 'query':
+        for record in read_sequences(query):
+            for other in read_sequences(reference):
+                yield record, other
+    elif pairing == 'paired':
+        for record, other in zip_longest(read_sequences(query), read_sequences(reference)):
+            if record is None or other is None:
+                raise ValueError("The paired files have a different number of records")
+            yield record, other
+    else:
+        raise ValueError(f"Unknown pairing '{pairing}', choose 'query', 'all' or 'paired'")
+
+
+def format_alignment(record1, record2, alignment, output_format, secondary=False):
+    """
+    Format an alignment as a line of the output
+    :param record1: record of the first sequence, as (name, sequence, quality)
+    :param record2: record of the second sequence, as (name, sequence, quality)
+    :param alignment: alignment of the two sequences
+    :param output_format: 'tsv' for tab separated values, 'sam' for SAM records, 'text' for the gapped sequences
+    :param secondary: True if it is not the first alignment of the pair
+    """
+    name1, sequence1, quality1 = record1
+    name2 = record2[0]
+    if output_format == 'text':
+        return f"{name1}\t{name2}\n{alignment}"
+    elif output_format == 'tsv':
+        return (f"{name1}\t{name2}\t{alignment.score}\t{alignment.r}\t{alignment.end1}\t{alignment.c}\t"
+                f"{alignment.end2}\t{alignment.cigar or '*'}")
+    # The first sequence is the read, the second one the reference; unaligned ends of the read are soft clipped
+    if not alignment.steps:
+        return f"{name1}\t4\t*\t0\t0\t*\t*\t0\t0\t{sequence1 or '*'}\t{quality1 or '*'}\tAS:i:{alignment.score}"
+    cigar = alignment.cigar
+    if alignment.r:
+        cigar = f"{alignment.r}S{cigar}"
+    if alignment.end1 < len(sequence1):
+        cigar = f"{cigar}{len(sequence1) - alignment.end1}S"
+    return (f"{name1}\t{256 if secondary else 0}\t{name2}\t{alignment.c + 1}\t255\t{cigar}\t*\t0\t0\t"
+            f"{sequence1}\t{quality1 or '*'}\tAS:i:{alignment.score}")
+
+
+def format_header(query, reference, pairing, output_format):
+    """
+    Lines written before the alignments
+    :param query: name of the file of the queries
+    :param reference: name of the file of the references
+    :param pairing: pairing of the records, as in pair_sequences
+    :param output_format: 'tsv', 'sam' or 'text', as in format_alignment
+    """
+    if output_format == 'tsv':
+        yield "query\treference\tscore\tquery_start\tquery_end\treference_start\treference_end\tcigar"
+    elif output_format == 'sam':
+        yield "@HD\tVN:1.6"
+        references = query if pairing == 'all' else reference
+        for name, sequence, _ in read_sequences(references):
+            yield f"@SQ\tSN:{name}\tLN:{len(sequence)}"
+
+
+def align_files(query, reference, output, m, s, g, algorithm='global', al=0, limit=None, engine='auto',
+                pairing='query', output_format='tsv', workers=1, chunksize=1024, gap_open=None, substitution=None,
+                cache=None):
+    """
+    Align the records of FASTA or FASTQ files, writing every chunk of alignments as soon as it is computed
+    :param query: name of the file of the queries
+    :param reference: name of the file of the references
+    :param output: file where the alignments are written
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param algorithm: 'global' for the Needleman-Wunsch algorithm, 'local' for the Smith-Waterman algorithm
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param limit: maximum number of alignments to return for each pair, None to return all of them
+    :param engine: engine used to fill the matrices
+    :param pairing: pairing of the records, as in pair_sequences
+    :param output_format: 'tsv', 'sam' or 'text', as in format_alignment
+    :param workers: number of processes
+    :param chunksize: number of pairs read before aligning them
+    :param gap_open: None for the linear gap score, otherwise the gap opening score of the affine gap score
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    :param cache: AlignmentCache of the alignments, None to align every pair
+    """
+    for line in format_header(query, reference, pairing, output_format):
+        output.write(line + '\n')
+    pairs = pair_sequences(query, reference, pairing)
+    executor = futures.ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        while True:
+            chunk = list(islice(pairs, chunksize))
+            if not chunk:
+                break
+            results = align_many([(record1[1], record2[1]) for record1, record2 in chunk], m, s, g, algorithm, al,
+                                 limit, engine, workers, executor=executor, gap_open=gap_open,
+                                 substitution=substitution, cache=cache)
+            for (record1, record2), alignments in zip(chunk, results):
+                for i, alignment in enumerate(alignments):
+                    output.write(format_alignment(record1, record2, alignment, output_format, i > 0) + '\n')
+            output.flush()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def build_database(reference, directory):
+    """
+    Encode the records of a FASTA or FASTQ file in a directory that is read by SequenceDatabase.
+    The file is read twice, the first time to size the memory-mapped file and the second time to fill it, so memory
+    does not depend on the size of the references
+    :param reference: name of the file of the references
+    :param directory: directory where the database is written, created if it does not exist
+    """
+    os.makedirs(directory, exist_ok=True)
+    lengths = []
+    with open(os.path.join(directory, 'names.txt'), 'w') as file:
+        for name, sequence, _ in read_sequences(reference):
+            if not sequence.isascii():
+                raise ValueError(f"The reference {name} has characters that are not ASCII")
+            file.write(name + '\n')
+            lengths.append(len(sequence))
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    np.save(os.path.join(directory, 'offsets.npy'), offsets)
+    sequences = np.lib.format.open_memmap(os.path.join(directory, 'sequences.npy'), mode='w+', dtype=np.uint8,
+                                          shape=(int(offsets[-1]),))
+    present = np.zeros(256, dtype=bool)
+    for k, (_, sequence, _) in enumerate(read_sequences(reference)):
+        codes = np.frombuffer(sequence.encode('ascii'), dtype=np.uint8)
+        sequences[offsets[k]:offsets[k + 1]] = codes
+        present[codes] = True
+    sequences.flush()
+    del sequences
+    with open(os.path.join(directory, 'alphabet.txt'), 'w') as file:
+        file.write(bytes(np.flatnonzero(present).tolist()).decode('ascii'))
+    return SequenceDatabase(directory)
+
+
+def score_database(m, s, g, query, database, substitution=None):
+    """
+    Compute the score of the optimal local alignments of a query with every reference of a database, keeping two
+    rows of the procedure matrix. The references are sorted by length and the ones with similar lengths are scored
+    together, as in compute_batch; the query is on the rows, so the rows of the long references are long vectors
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param query: query sequence
+    :param database: SequenceDatabase of the references
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    (codes1, alphabet_codes), table = encode_sequences(m, s, (query, database.alphabet), substitution)
+    padding = len(table) - 1
+    # Code of every byte of the references
+    lookup = np.full(256, padding, dtype=np.min_scalar_type(padding))
+    lookup[np.frombuffer(database.alphabet.encode('ascii'), dtype=np.uint8)] = alphabet_codes
+    lengths = database.lengths
+    dtype = score_dtype(table.max(), table.min(), g, len(codes1), int(lengths.max(initial=0)))
+    table = table.astype(dtype)
+    scores = np.zeros(len(database), dtype=np.int64)
+    order = np.argsort(lengths, kind='stable')
+    start = 0
+    while start < len(order):
+        # Add references to the batch as long as the padded rows fit in BATCH_CELLS
+        end = start + 1
+        while end < len(order) and (end - start + 1) * (lengths[order[end]] + 1) <= BATCH_CELLS:
+            end += 1
+        batch = order[start:end]
+        len2 = int(lengths[batch[-1]])
+        codes2 = np.full((len(batch), len2), padding, dtype=lookup.dtype)
+        for row, k in enumerate(batch):
+            codes2[row, :lengths[k]] = lookup[database.codes(k)]
+        profile = score_profile(table, codes2)
+        row = np.zeros((len(batch), len2 + 1), dtype=dtype)
+        best = row.copy()
+        for code in codes1:
+            row = fill_row(row, 0, profile[code], g, True)
+            np.maximum(best, row, out=best)
+        # The padding columns come after the columns of every reference, so they are only cut away
+        best[np.arange(len2 + 1) > lengths[batch][:, None]] = 0
+        scores[batch] = best.max(axis=1)
+        start = end
+    return scores
+
+
+def search_database(m, s, g, query, database, top=10, threshold=None, al=0, limit=None, substitution=None):
+    """
+    Find the references of a database with the best local alignments with a query.
+    Every reference is scored with score_database, a heap keeps the top ones with at least the threshold score and
+    the matrices are filled and traced back with path only for them
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param query: query sequence
+    :param database: SequenceDatabase of the references
+    :param top: maximum number of references to return, None to return all the ones with at least the threshold score
+    :param threshold: minimum score of the references, None to return the best ones whatever their score
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param limit: maximum number of alignments to return for each reference, None to return all of them
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    scores = score_database(m, s, g, query, database, substitution)
+    hits = []
+    for k, score in enumerate(scores.tolist()):
+        if threshold is not None and score < threshold:
+            continue
+        # The heap keeps the lowest score on top; with the same score the earlier reference wins
+        if top is None or len(hits) < top:
+            heappush(hits, (score, -k))
+        elif (score, -k) > hits[0]:
+            heapreplace(hits, (score, -k))
+    results = []
+    for _, k in sorted(hits, reverse=True):
+        reference = database.sequence(-k)
+        matrix, traceback = compute_smith_waterman(m, s, g, query, reference, al, substitution=substitution)
+        results.append((-k, list(traceback_smith_waterman(query, reference, matrix, traceback, al, limit))))
+    return results
+
+
+def search_files(query, database, output, m, s, g, al=0, limit=None, top=10, threshold=None, output_format='tsv',
+                 substitution=None):
+    """
+    Search every record of a FASTA or FASTQ file in a database with search_database, writing the alignments of the
+    hits of a query as soon as they are computed
+    :param query: name of the file of the queries
+    :param database: SequenceDatabase of the references
+    :param output: file where the alignments are written
+    :param m: match score
+    :param s: mismatch score
+    :param g: gap score
+    :param al: 0 if only one optimal alignment need to be returned, 1 otherwise
+    :param limit: maximum number of alignments to return for each hit, None to return all of them
+    :param top: maximum number of hits of every query, None for all of them
+    :param threshold: minimum score of the hits, None for no minimum
+    :param output_format: 'tsv', 'sam' or 'text', as in format_alignment
+    :param substitution: substitution matrix whose scores replace m and s, None to use m and s
+    """
+    if output_format == 'sam':
+        output.write("@HD\tVN:1.6\n")
+        for name, length in zip(database.names, database.lengths.tolist()):
+            output.write(f"@SQ\tSN:{name}\tLN:{length}\n")
+    else:
+        for line in format_header(query, None, 'query', output_format):
+            output.write(line + '\n')
+    for record in read_sequences(query):
+        hits = search_database(m, s, g, record[1], database, top, threshold, al, limit, substitution)
+        # Only the first alignment of the best hit is the primary one
+        for i, (k, alignment) in enumerate((k, alignment) for k, alignments in hits for alignment in alignments):
+            output.write(format_alignment(record, (database.names[k], alignment.sequence2, None), alignment,
+                                          output_format, i > 0) + '\n')
+        output.flush()
+
+
+def serve(requests, output):
+    """
+    Align the pairs of a line protocol in one process, so that the start of the interpreter and the imports are paid
+    only once. Every line of the requests is a JSON object with the arguments of align: m, s, g, sequence1 and
+    sequence2, and optionally algorithm, al, limit, engine, band, gap_open and linear; "gapped": true adds the gapped
+    sequences to the answer. For every line a JSON object is written, {"alignments": [...]} with the as_dict of the
+    alignments or {"error": message}
+    :param requests: file of the requests, one per line
+    :param output: file where the answers are written, one per line
+    """
+    options = ('algorithm', 'al', 'limit', 'engine', 'band', 'gap_open', 'linear')
+    for line in requests:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            alignments = align(request['m'], request['s'], request['g'], request['sequence1'], request['sequence2'],
+                               **{option: request[option] for option in options if option in request})
+            records = [alignment.as_dict() for alignment in alignments]
+            if request.get('gapped'):
+                for record, alignment in zip(records, alignments):
+                    record.update(aligned1=alignment.aligned1, aligned2=alignment.aligned2)
+            answer = {'alignments': records}
+        except Exception as error:  # A bad request must not stop the server
+            answer = {'error': f"{type(error).__name__}: {error}"}
+        output.write(json.dumps(answer) + '\n')
+        output.flush()
+
+
+def non_negative(value):
+    """
+    Integer of the command line that must be at least 0
+    :param value: text of the option
+    """
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"{value} is less than 0")
+    return number
+
+
+def main(arguments=None):
+    """
+    Command line of the module
+    :param arguments: arguments of the command line, None to read them from sys.argv
+    """
+    parser = argparse.ArgumentParser()
     """ Adding all the options that can be given as parameters """
-    parser.add_option("-m", action="store", type="int", dest="match", help="cost of a match")
-    parser.add_option("-s", action="store", type="int", dest="mismatch", help="cost of the mismatch")
-    parser.add_option("-i", action="store", type="int", dest="indel", help="cost of the gap/indel")
-    parser.add_option("-b", action="store", type="string", dest="seq1", help="first sequence")
-    parser.add_option("-c", action="store", type="string", dest="seq2", help="second sequence")
-    parser.add_option("-a", action="store", type="string", dest="algorithm", help="Type 'local' for local alignment "
-                                                                                  "and 'global' for global alignment")
-    parser.add_option("-t", action="store", type="int", dest="alignment", help="Type '0' for only one alignment "
-                                                                               "and '1' for all possible alignments")
+    parser.add_argument("-m", type=int, dest="match", help="cost of a match")
+    parser.add_argument("-s", type=int, dest="mismatch", help="cost of the mismatch")
+    parser.add_argument("-i", type=int, dest="indel", help="cost of the gap/indel")
+    parser.add_argument("-o", "--gap-open", type=int, dest="gap_open",
+                        help="cost of opening a gap, a gap of length k costs the opening plus k times the extension")
+    parser.add_argument("-e", "--gap-extend", type=int, dest="gap_extend",
+                        help="cost of extending a gap, the cost of the gap/indel by default")
+    parser.add_argument("-x", "--matrix", dest="matrix",
+                        help="substitution matrix replacing the costs of match and mismatch: 'dna' for the IUPAC "
+                             "nucleotide codes scored with -m and -s, 'BLOSUM62' or a file in the NCBI format")
+    parser.add_argument("-b", dest="seq1", help="first sequence")
+    parser.add_argument("-c", dest="seq2", help="second sequence")
+    parser.add_argument("-a", dest="algorithm", help="Type 'local' for local alignment and 'global' for global "
+                                                     "alignment")
+    parser.add_argument("-t", type=int, dest="alignment", help="Type '0' for only one alignment and '1' for all "
+                                                               "possible alignments")
+    parser.add_argument("--engine", dest="engine", choices=ENGINES, default="auto",
+                        help="Type 'vectorized' to fill the matrices with NumPy row operations, 'loop' to fill them "
+                             "cell by cell, 'numba' to fill them with the kernel compiled by Numba and 'auto' for the "
+                             "fastest available one")
+    parser.add_argument("--threads", type=int, dest="threads", default=1,
+                        help="number of threads filling the matrices of the two sequences in tiles with the 'numba' "
+                             "engine, 0 for one for every processor")
+    parser.add_argument("--mode", dest="mode", choices=("full", "score", "linear"), default="full",
+                        help="Type 'full' to keep the whole matrices, 'score' to compute only the score and 'linear' "
+                             "to align in linear memory (one alignment for global alignment)")
+    parser.add_argument("-w", "--band", dest="band",
+                        help="number of diagonals on each side of the band, or 'auto' to widen it until the score is "
+                             "optimal (for local alignment often up to the whole matrices); without it the whole "
+                             "matrices are filled")
+    parser.add_argument("--seed", type=int, dest="seed",
+                        help="length of the k-mers shared by the sequences: the matrices are filled only around them")
+    parser.add_argument("--seed-index", dest="seed_index",
+                        help="file of the k-mer index of the second sequence used with --seed, written if it does not "
+                             "exist")
+    parser.add_argument("--xdrop", type=non_negative, dest="xdrop",
+                        help="prune the cells whose score is more than XDROP below the best one and stop when a whole "
+                             "row is pruned; nothing is pruned until the best score is above XDROP")
+    parser.add_argument("--zdrop", type=non_negative, dest="zdrop",
+                        help="stop when the best score of a row is more than ZDROP, plus the cost of the gaps, below "
+                             "the best one")
+    parser.add_argument("--out-of-core", dest="out_of_core",
+                        help="directory where the traceback matrix is written while it is filled, with checkpoints to "
+                             "resume an interrupted fill")
+    parser.add_argument("--limit", type=int, dest="limit", help="maximum number of alignments")
+    parser.add_argument("--profile", action="store_true", dest="profile", default=False,
+                        help="write the seconds spent in every phase, the cells computed and the bytes of the matrices "
+                             "to the standard error")
+    parser.add_argument("--cigar", action="store_true", dest="cigar", default=False,
+                        help="print the coordinates, the CIGAR and the identity of the alignments instead of the "
+                             "gapped sequences")
+    parser.add_argument("--count", action="store_true", dest="count", default=False,
+                        help="print the number of optimal alignments instead of the alignments")
+    parser.add_argument("-q", "--query", dest="query",
+                        help="FASTA or FASTQ file (optionally gzip compressed) with the first sequences")
+    parser.add_argument("-r", "--reference", dest="reference",
+                        help="FASTA or FASTQ file (optionally gzip compressed) with the second sequences")
+    parser.add_argument("-p", "--pairing", dest="pairing", choices=("query", "all", "paired"),
+                        help="Type 'query' to align every query with every reference, 'all' to align every two "
+                             "queries and 'paired' to align the records of the two files in order")
+    parser.add_argument("-f", "--format", dest="format", choices=("tsv", "sam", "text"),
+                        default="tsv", help="format of the alignments of the sequence files: 'tsv', 'sam' or 'text'")
+    parser.add_argument("--output", dest="output",
+                        help="file where the alignments of the sequence files are written, standard output by default")
+    parser.add_argument("--workers", type=int, dest="workers", default=1,
+                        help="number of processes used to align the sequence files")
+    parser.add_argument("--cache", dest="cache",
+                        help="directory where the alignments of the sequence files are cached for the next runs")
+    parser.add_argument("--cache-bytes", type=int, dest="cache_bytes",
+                        help="maximum size of the cache directory, the least recently used alignments are removed "
+                             "first")
+    parser.add_argument("--serve", action="store_true", dest="serve", default=False,
+                        help="read alignment requests as JSON lines from the standard input and write the answers as "
+                             "JSON lines, in one process")
+    parser.add_argument("--build-database", dest="build_database",
+                        help="directory where the references of -r are encoded to be searched with --database")
+    parser.add_argument("-d", "--database", dest="database",
+                        help="directory written by --build-database: every query of -q is searched in it with local "
+                             "alignment")
+    parser.add_argument("--top", type=int, dest="top", default=10,
+                        help="maximum number of references found for every query in the database")
+    parser.add_argument("--min-score", type=int, dest="min_score",
+                        help="minimum score of the references found in the database")
 
     """ Reading parameters """
-    (options, args) = parser.parse_args()
+    options = parser.parse_args(arguments)
     match = options.match
     mismatch = options.mismatch
-    gap = options.indel
+    gap = options.indel if options.gap_extend is None else options.gap_extend
+    gap_open = options.gap_open
     seq1 = options.seq1
     seq2 = options.seq2
     algorithm = options.algorithm
-    align = options.alignment
+    al = options.alignment
+    engine = options.engine
+    mode = options.mode
+    limit = options.limit
+    substitution = substitution_matrix(options.matrix, match, mismatch) if options.matrix else None
+    show = Alignment.summary if options.cigar else str
 
-    if algorithm == 'local':
-        matrix, traceback = compute_smith_waterman(match, mismatch, gap, seq1, seq2, align)
-        traceback_smith_waterman(seq1, seq2, matrix, traceback, align)
+    # Options that change how the two sequences of -b and -c are aligned, only one of them can be used
+    drops = options.xdrop is not None or options.zdrop is not None
+    methods = [name for name, used in (("--xdrop/--zdrop", drops), ("--seed", options.seed),
+                                       ("--out-of-core", options.out_of_core), ("--band", options.band),
+                                       (f"--mode {mode}", mode != 'full')) if used]
+    if options.threads != 1 and (methods or gap_open is not None or options.query or options.database):
+        parser.error("--threads is available only to fill the whole matrices of the sequences of -b and -c")
+    if options.threads > 1 and engine != 'numba' and (engine != 'auto' or not NUMBA):
+        parser.error("--threads is available only with the 'numba' engine, which needs Numba")
+    if not (options.serve or options.build_database or options.database or options.query):
+        if len(methods) > 1:
+            parser.error(f"{' and '.join(methods)} cannot be used together")
+        if gap_open is not None and (methods or options.count):
+            parser.error("The 'score' and 'linear' modes, the band, the seeds, the drops, the traceback file and the "
+                         "count are available only with the gap/indel cost")
+        if drops and algorithm != 'local':
+            parser.error("The X-drop and Z-drop are available only for local alignment")
+        if engine != 'auto' and (gap_open is not None or (methods and not options.out_of_core)):
+            parser.error("--engine is available only to fill the whole matrices, also with --out-of-core")
+        if options.count and (options.profile or (methods and not options.out_of_core)):
+            parser.error("--count is available only to fill the whole matrices, also with --out-of-core")
+        if options.profile and (drops or options.seed or options.out_of_core or mode == 'score'):
+            parser.error("--profile is not available with the drops, the seeds, the traceback file and the 'score' "
+                         "mode")
+
+    if options.serve:
+        serve(sys.stdin, sys.stdout)
+    elif options.build_database:
+        if not options.reference:
+            print("Insert the file of the references to encode with -r")
+        else:
+            build_database(options.reference, options.build_database)
+    elif options.database:
+        output = open(options.output, 'w') if options.output else sys.stdout
+        try:
+            search_files(options.query, SequenceDatabase(options.database), output, match, mismatch, gap, al or 0,
+                         limit, options.top, options.min_score, options.format, substitution)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+    elif options.query:
+        pairing = options.pairing or ('query' if options.reference else 'all')
+        output = open(options.output, 'w') if options.output else sys.stdout
+        try:
+            cache = AlignmentCache(directory=options.cache, max_bytes=options.cache_bytes) if options.cache else None
+            align_files(options.query, options.reference, output, match, mismatch, gap, algorithm, al or 0, limit,
+                        engine, pairing, options.format, options.workers, gap_open=gap_open,
+                        substitution=substitution, cache=cache)
+            if cache is not None:
+                statistics = cache.statistics()
+                sys.stderr.write(f"Cache: {statistics['hits'] + statistics['disk_hits']} hits, "
+                                 f"{statistics['misses']} misses\n")
+        finally:
+            if output is not sys.stdout:
+                output.close()
+    elif mode != 'full' and algorithm not in ('local', 'global'):
+        print("Insert 'local' for local alignment and 'global' for global alignment")
+    elif drops:
+        matrix, traceback, stopped, filled = compute_smith_waterman_xdrop(match, mismatch, gap, seq1, seq2, al,
+                                                                          options.xdrop, options.zdrop, substitution)
+        for alignment in traceback_smith_waterman(seq1, seq2, matrix, traceback, al, limit):
+            print(show(alignment))
+        print(f"Cells filled: {filled / matrix.size:.1%}{', stopped early' if stopped else ''}")
+    elif options.seed and algorithm in ('local', 'global'):
+        if options.seed_index and os.path.exists(options.seed_index):
+            index = load_kmer_index(options.seed_index)
+        else:
+            index = build_kmer_index(seq2, options.seed)
+            if options.seed_index:
+                index.save(options.seed_index)
+        alignments, skipped = seed_and_extend(match, mismatch, gap, seq1, seq2, algorithm, al, limit, index=index,
+                                              substitution=substitution)
+        for alignment in alignments:
+            print(show(alignment))
+        print(f"Cells skipped: {skipped:.1%}")
+    elif options.out_of_core and algorithm in ('local', 'global'):
+        score, rows, columns, traceback = compute_out_of_core(match, mismatch, gap, seq1, seq2, al,
+                                                              options.out_of_core, algorithm == 'local', engine,
+                                                              substitution=substitution)
+        if options.count:
+            print(f"Optimal alignments: {sum(count_alignments(traceback, r, c) for r, c in zip(rows, columns))}")
+        else:
+            for alignment in traceback_cells(seq1, seq2, traceback, score, rows, columns, al, limit):
+                print(show(alignment))
+    elif options.profile and algorithm in ('local', 'global'):
+        profile = AlignmentStatistics()
+        alignments = align(match, mismatch, gap, seq1, seq2, algorithm, al, limit, engine, options.band, gap_open,
+                           substitution, mode == 'linear', statistics=profile, threads=options.threads)
+        output_start = time.perf_counter()
+        for alignment in alignments:
+            print(show(alignment))
+        profile.record('output', output_start)
+        sys.stderr.write(f"Profile: {profile}\n")
+    elif gap_open is not None and algorithm in ('local', 'global'):
+        for alignment in align(match, mismatch, gap, seq1, seq2, algorithm, al, limit, gap_open=gap_open,
+                               substitution=substitution):
+            print(show(alignment))
+    elif mode == 'score' and algorithm == 'local':
+        print(f"Score: {score_smith_waterman(match, mismatch, gap, seq1, seq2, substitution=substitution)[0]}")
+    elif mode == 'score':
+        print(f"Score: {score_needleman_wunsch(match, mismatch, gap, seq1, seq2, substitution)}")
+    elif mode == 'linear':
+        for alignment in align(match, mismatch, gap, seq1, seq2, algorithm, al, limit, substitution=substitution,
+                               linear=True):
+            print(show(alignment))
+    elif options.band and algorithm in ('local', 'global'):
+        compute = compute_smith_waterman_banded if algorithm == 'local' else compute_needleman_wunsch_banded
+        matrix, traceback = compute(match, mismatch, gap, seq1, seq2, al, options.band, substitution)
+        for alignment in traceback_alignments(seq1, seq2, matrix, traceback, algorithm, al, limit):
+            print(show(alignment))
+    elif (algorithm in ('local', 'global') and engine == 'auto' and options.threads == 1 and substitution is None and
+          not options.count and len(seq1) * len(seq2) <= PYTHON_CELLS):
+        for alignment in align_python(match, mismatch, gap, seq1, seq2, algorithm, al, limit):
+            print(show(alignment))
+    elif algorithm == 'local':
+        matrix, traceback = compute_smith_waterman(match, mismatch, gap, seq1, seq2, al, engine, substitution,
+                                                   options.threads)
+        if options.count:
+            print(f"Optimal alignments: {count_smith_waterman(matrix, traceback, al)}")
+        else:
+            for alignment in traceback_smith_waterman(seq1, seq2, matrix, traceback, al, limit):
+                print(show(alignment))
     elif algorithm == 'global':
-        matrix, traceback = compute_needleman_wunsch(match, mismatch, gap, seq1, seq2, align)
-        path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)])
+        matrix, traceback = compute_needleman_wunsch(match, mismatch, gap, seq1, seq2, al, engine, substitution,
+                                                     options.threads)
+        if options.count:
+            print(f"Optimal alignments: {count_alignments(traceback, len(seq1), len(seq2))}")
+        else:
+            for alignment in path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)], limit):
+                print(show(alignment))
     else:
         print("Insert 'local' for local alignment and 'global' for global alignment")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,37 @@
+import gzip
 import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
+from math import comb
 import numpy as np
 from unittest.mock import patch
 
+from benchmark import generate_pair, run_case, compare_results
+import sequence_alignment
 from sequence_alignment import compute_smith_waterman, determine_step, traceback_smith_waterman, \
-    compute_needleman_wunsch, path
+    compute_needleman_wunsch, path, score_needleman_wunsch, hirschberg, score_dtype, count_alignments, \
+    count_smith_waterman, align, align_many, align_batch, compute_needleman_wunsch_batch, \
+    compute_smith_waterman_batch, read_sequences, pair_sequences, align_files, compute_needleman_wunsch_banded, \
+    compute_smith_waterman_banded, \
+    compute_needleman_wunsch_affine, compute_smith_waterman_affine, path_affine, SubstitutionMatrix, dna_matrix, \
+    substitution_matrix, parse_substitution_matrix, score_smith_waterman, smith_waterman_linear, build_database, \
+    SequenceDatabase, score_database, search_database, search_files, build_kmer_index, load_kmer_index, kmer_hashes, \
+    seed_and_extend, AlignmentCache, cache_key, IncrementalAligner, compute_smith_waterman_xdrop, \
+    compute_extension_xdrop, fill_scalar, resolve_engine, available_engines, AlignmentStatistics, \
+    fill_wavefront, fill_vectorized, compute_out_of_core, traceback_cells, fill_engine, traceback_alignments, \
+    align_python, ListMatrix, max_cells, serve, main
+
+SEQUENCES = [("AATCG", "AACG"), ("CIAO", "CIAOCI"), ("ACACACC", "ACA"), ("TGCT", "ATTCA"), ("ATTCA", "TGCT"),
+             ("GATTACA", "GCATGCT"), ("AAAA", "AA"), ("", "ACG"), ("ACG", "")]
+SCORES = [(1, -1, -2), (2, -1, -2), (3, -1, -1), (3, -1, -3), (1, 0, 0), (-1, 2, 1)]
+
+
+def render(alignments):
+    return ''.join(f"{alignment}\n" for alignment in alignments)
 
 
 class PairwiseAlignments(unittest.TestCase):
@@ -245,119 +272,893 @@ class PairwiseAlignments(unittest.TestCase):
                                                            [2, 1, 1, 1, 1, 3],
                                                            [2, 1, 1, 1, 2, 1]]))
 
-    @patch('sys.stdout', new_callable=io.StringIO)
-    def test_traceback_smith_waterman_1(self, mock_stdout):
+    def test_traceback_smith_waterman_1(self):
         seq1 = "AATCG"
         seq2 = "AACG"
         matrix, traceback = compute_smith_waterman(1, -1, -2, seq1, seq2, 1)
-        traceback_smith_waterman(seq1, seq2, matrix, traceback, 1)
-        self.assertEqual(mock_stdout.getvalue(), "Alignment with score 2:\nAA\nAA\nAlignment with score 2:\nCG\nCG\n")
+        alignments = traceback_smith_waterman(seq1, seq2, matrix, traceback, 1)
+        self.assertEqual(render(alignments), "Alignment with score 2:\nAA\nAA\nAlignment with score 2:\nCG\nCG\n")
 
-    @patch('sys.stdout', new_callable=io.StringIO)
-    def test_traceback_smith_waterman_2(self, mock_stdout):
+    def test_traceback_smith_waterman_2(self):
         seq1 = "CIAO"
         seq2 = "CIAOCI"
         matrix, traceback = compute_smith_waterman(2, -1, -2, seq1, seq2, 1)
-        traceback_smith_waterman(seq1, seq2, matrix, traceback, 1)
-        self.assertEqual(mock_stdout.getvalue(), "Alignment with score 8:\nCIAO\nCIAO\n")
+        alignments = traceback_smith_waterman(seq1, seq2, matrix, traceback, 1)
+        self.assertEqual(render(alignments), "Alignment with score 8:\nCIAO\nCIAO\n")
 
-    @patch('sys.stdout', new_callable=io.StringIO)
-    def test_traceback_smith_waterman_3(self, mock_stdout):
+    def test_traceback_smith_waterman_3(self):
         seq1 = "ACACACC"
         seq2 = "ACA"
         matrix, traceback = compute_smith_waterman(3, -1, -1, seq1, seq2, 1)
-        traceback_smith_waterman(seq1, seq2, matrix, traceback, 1)
-        self.assertEqual(mock_stdout.getvalue(), "Alignment with score 9:\nACA\nACA\nAlignment with score 9:\nACA\nACA\n")
+        alignments = traceback_smith_waterman(seq1, seq2, matrix, traceback, 1)
+        self.assertEqual(render(alignments), "Alignment with score 9:\nACA\nACA\nAlignment with score 9:\nACA\nACA\n")
 
-    @patch('sys.stdout', new_callable=io.StringIO)
-    def test_traceback_smith_waterman_4(self, mock_stdout):
+    def test_traceback_smith_waterman_4(self):
         seq1 = "AATCG"
         seq2 = "AACG"
         matrix, traceback = compute_smith_waterman(1, -1, -2, seq1, seq2, 0)
-        traceback_smith_waterman(seq1, seq2, matrix, traceback, 0)
-        self.assertEqual(mock_stdout.getvalue(), "Alignment with score 2:\nAA\nAA\n")
+        alignments = traceback_smith_waterman(seq1, seq2, matrix, traceback, 0)
+        self.assertEqual(render(alignments), "Alignment with score 2:\nAA\nAA\n")
 
-    @patch('sys.stdout', new_callable=io.StringIO)
-    def test_traceback_smith_waterman_5(self, mock_stdout):
+    def test_traceback_smith_waterman_5(self):
         seq1 = "TGCT"
         seq2 = "ATTCA"
         matrix, traceback = compute_smith_waterman(3, -1, -3, seq1, seq2, 0)
-        traceback_smith_waterman(seq1, seq2, matrix, traceback, 1)
-        self.assertEqual(mock_stdout.getvalue(), "Alignment with score 5:\nTGC\nTTC\n")
+        alignments = traceback_smith_waterman(seq1, seq2, matrix, traceback, 1)
+        self.assertEqual(render(alignments), "Alignment with score 5:\nTGC\nTTC\n")
 
-    @patch('sys.stdout', new_callable=io.StringIO)
-    def test_traceback_smith_waterman_6(self, mock_stdout):
+    def test_traceback_smith_waterman_6(self):
         seq1 = "TGCT"
         seq2 = "ATTCA"
         matrix, traceback = compute_smith_waterman(3, -1, -3, seq1, seq2, 1)
-        traceback_smith_waterman(seq1, seq2, matrix, traceback, 1)
-        self.assertEqual(mock_stdout.getvalue(), "Alignment with score 5:\nTGC\nTTC\n")
+        alignments = traceback_smith_waterman(seq1, seq2, matrix, traceback, 1)
+        self.assertEqual(render(alignments), "Alignment with score 5:\nTGC\nTTC\n")
 
-    @patch('sys.stdout', new_callable=io.StringIO)
-    def test_traceback_needleman_wunsch_1(self, mock_stdout):
+    def test_traceback_needleman_wunsch_1(self):
         seq1 = "AATCG"
         seq2 = "AACG"
         matrix, traceback = compute_needleman_wunsch(1, -1, -2, seq1, seq2, 1)
-        path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)])
-        self.assertEqual(mock_stdout.getvalue(), "Alignment with score 2:\nAATCG\nAA-CG\n")
+        alignments = path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)])
+        self.assertEqual(render(alignments), "Alignment with score 2:\nAATCG\nAA-CG\n")
 
-    @patch('sys.stdout', new_callable=io.StringIO)
-    def test_traceback_needleman_wunsch_2(self, mock_stdout):
+    def test_traceback_needleman_wunsch_2(self):
         seq1 = "CIAO"
         seq2 = "CIAOCI"
         matrix, traceback = compute_needleman_wunsch(2, -1, -2, seq1, seq2, 1)
-        path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)])
-        self.assertEqual(mock_stdout.getvalue(), "Alignment with score 4:\nCIAO--\nCIAOCI\n")
+        alignments = path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)])
+        self.assertEqual(render(alignments), "Alignment with score 4:\nCIAO--\nCIAOCI\n")
 
-    @patch('sys.stdout', new_callable=io.StringIO)
-    def test_traceback_needleman_wunsch_3(self, mock_stdout):
+    def test_traceback_needleman_wunsch_3(self):
         seq1 = "ACACACC"
         seq2 = "ACA"
         matrix, traceback = compute_needleman_wunsch(3, -1, -1, seq1, seq2, 1)
-        path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)])
-        self.assertEqual(mock_stdout.getvalue(),
+        alignments = path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)])
+        self.assertEqual(render(alignments),
                          "Alignment with score 5:\nACACACC\n--ACA--\n"
                          "Alignment with score 5:\nACACACC\nACA----\n"
                          "Alignment with score 5:\nACACACC\nAC--A--\n"
                          "Alignment with score 5:\nACACACC\nA--CA--\n")
 
-    @patch('sys.stdout', new_callable=io.StringIO)
-    def test_traceback_needleman_wunsch_4(self, mock_stdout):
+    def test_traceback_needleman_wunsch_4(self):
         seq1 = "ACACACC"
         seq2 = "ACA"
         matrix, traceback = compute_needleman_wunsch(3, -1, -1, seq1, seq2, 0)
-        path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)])
-        self.assertEqual(mock_stdout.getvalue(),
+        alignments = path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)])
+        self.assertEqual(render(alignments),
                          "Alignment with score 5:\nACACACC\n--ACA--\n")
 
-    @patch('sys.stdout', new_callable=io.StringIO)
-    def test_traceback_needleman_wunsch_5(self, mock_stdout):
+    def test_traceback_needleman_wunsch_5(self):
         seq1 = "ATTAAAGGTTTATACCTTCCCAGGTAACAAACCAACCAACTTTCGATCTCTTGTAGATCTGTTCTCTAAACGAACTTTAAAATCTGTGTGGCTGTCACTCGGCTGCATGCTTAGTGCACTCACGCAGTATAATTAATAACTAATTACTGTCGTTGACAGGACACGAGTAACTCGTCTATCTTCTGCAGGCTGCTTACGGTTTCGTCCGTGTTGCAGCCGATCATCAGCACATCTAGGTTTCGTCCGGGTGTGACCGAAAGGTAAGATGGAGAGCCTTGTCCCTGGTTTCAACGAGAAAACACACGTCCAACTCAGTTTGCCTGTTTTACAGGTTCGCGACGTGCTCGTACGTGGCTTTGGAGACTCCGTGGAGGAGGTCTTATCAGAGGCACGTCAACATCTTAAAGATGGCACTTGTGGCTTAGTAGAAGTTGAAAAAGGCGTTTTGCCTCAACTTGAACAGCCCTATGTGTTCATCAAACGTTCGGATGCTCGAACTGCACCTCATGGTCATGT"
         seq2 = "TATGGTTGAGCTGGTAGCAGAACTCGAAGGCATTCAGTACGGTCGTAGTGGTGAGACACTTGGTGTCCTTGTCCCTCATGTGGGCGTAATACCAGTGGCTTACCGCAAGGTTCTTCTTCGTAAGAACGGTAATAAAGGAGCTGGTGGCCATAGTTACGGCGCCGATCTAAAGTCATTTGACTTAGGCGACGAGCTTGGCACTGATCCTTATGAAGATTTTCAAGAAAACTGGAACACTAAACATAGCAGTGGTGTTACCCGTGAACTCATGCGTGAGCTTAACGGAGGGGCATACACTCGCTATGTCGATAACAACTTCTGTGGCCCTGATGGCTACCCTCTTGAGTGCATTAAAGACCTTCTAGCACGTGCTGGTAAAGCTTCATGCACTTTGTCCGAACAACTGGACTTTATTGACACTAAGAGGGGTGTATACTGCTGCCGTGAACATGAGCATGAAATTG"
         matrix, traceback = compute_needleman_wunsch(3, -1, -1, seq1, seq2, 0)
-        path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)])
-        self.assertEqual(mock_stdout.getvalue(), "Alignment with score 679:\n"
+        alignments = path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)])
+        self.assertEqual(render(alignments), "Alignment with score 679:\n"
                                                  "ATTAAAGGTTTATACCTTCCCAGGTAACA-AAC-C-AA-CCAACTTTC-G-ATC--TCTTGTAGATCTGTTCTCTAAACGAACTTTAAAATCTGTGTGGC-TGTCACTCGGCTGCATGCTTAGTGC--ACTCACGCAGTATAATTAATAACTAA--TTACTGTCGTT-G-ACAGGACACGAGTAACTCGTCTATCTTCTGCAGGCTGCTTACGGTTTCGTCCGT-GTT---GCAGCCGATCATCAGCACA-TCTAGGTTTCGTCCGGGTGTGACCGAAAGGTAAGATGG-A--GAGCCTTGTCCCTG--G--TTTCAACGAGAAA----ACACACGTCCAAC-T--CAGTTTGCCTGTTTTACAGGTTCGCGACGTGC-TCGTACGTG-GCTTTGGAGACTCCGTGGAGGAGGTCTTATCAGAGGC-A---CG-T--CAACATCT-T---AAAGATGGC-A----CTTGTG-GC-TT--AG------TAG-AAGT--TGAAAAAGGCGTT-TTGC-C----T-C-AACTTGAAC-AG-CCCTATGTGTTCA-TCAA-ACGTTCGGATGCTCGA-ACTGC-ACC-T---CATG-GTCATG----T-\n"
                                                  "--T-ATGG-TT-GAGC-T----GGTAGCAGAACTCGAAGGC-A--TTCAGTA-CGGTC--GTAG---TG--GT-GAGAC--AC--T----T-GGTGT-CCTTGT--C-C--CT-CATG--T-GGGCGTAAT-AC-CAGT-GGCTT-ACCGC-AAGGTT-CT-TC-TTCGTA-A-GA-ACG-GTAA------TA-------AAGG-AGC-T--GG--T-GGCCATAGTTACGGC-GCCGATC-T-A--A-AGTC-A--TTT-GACTTAG-GCGA-CG--AGCT----TGGCACTGATCC-T-T--ATGAAGATTTTCAA-GA-AAACTGGA-ACAC-T-AAACATAGCAG--TG---GTGTTACCCG-T-G-AAC-T-CAT-G--CGTGAGC-TT--A-A---C--GGAGG-GG-CATA-CACTCGCTATGTCGATAACAACTTCTGTGGCCCTGATGGCTACCCTCTTGAGTGCATTAAAGACCTTCTAGCACGTGCTGGTAAA-GC-TTCATGCACTTTGTCCGAAC---AACTGGACTTTAT-TG-ACACT-AAGA-G---GGGTG-T--ATACTGCTGCCGTGAACATGAG-CATGAAATTG\n")
 
-    @patch('sys.stdout', new_callable=io.StringIO)
-    def test_traceback_needleman_wunsch_6(self, mock_stdout):
+    def test_traceback_needleman_wunsch_6(self):
         seq1 = "ATTCA"
         seq2 = "TGCT"
         matrix, traceback = compute_needleman_wunsch(3, -1, -3, seq1, seq2, 1)
-        path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)])
-        self.assertEqual(mock_stdout.getvalue(),
+        alignments = path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)])
+        self.assertEqual(render(alignments),
                          "Alignment with score 1:\nATTCA\n-TGCT\n")
 
-    @patch('sys.stdout', new_callable=io.StringIO)
-    def test_traceback_needleman_wunsch_7(self, mock_stdout):
+    def test_traceback_needleman_wunsch_7(self):
         seq1 = "ATTCA"
         seq2 = "TGCT"
         matrix, traceback = compute_needleman_wunsch(3, -1, -3, seq1, seq2, 0)
-        path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)])
-        self.assertEqual(mock_stdout.getvalue(),
+        alignments = path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)])
+        self.assertEqual(render(alignments),
                          "Alignment with score 1:\nATTCA\n-TGCT\n")
 
+    def test_engines_needleman_wunsch(self):
+        for seq1, seq2 in SEQUENCES:
+            for m, s, g in SCORES:
+                for al in (0, 1):
+                    matrix, traceback = compute_needleman_wunsch(m, s, g, seq1, seq2, al, 'loop')
+                    matrix2, traceback2 = compute_needleman_wunsch(m, s, g, seq1, seq2, al, 'vectorized')
+                    np.testing.assert_array_equal(matrix, matrix2)
+                    np.testing.assert_array_equal(traceback, traceback2)
+
+    def test_engines_smith_waterman(self):
+        for seq1, seq2 in SEQUENCES:
+            for m, s, g in SCORES:
+                for al in (0, 1):
+                    matrix, traceback = compute_smith_waterman(m, s, g, seq1, seq2, al, 'loop')
+                    matrix2, traceback2 = compute_smith_waterman(m, s, g, seq1, seq2, al, 'vectorized')
+                    np.testing.assert_array_equal(matrix, matrix2)
+                    np.testing.assert_array_equal(traceback, traceback2)
+
+    @patch('sequence_alignment.NUMBA', True)
+    @patch('sequence_alignment.fill_numba', fill_scalar)
+    def test_engine_scalar_kernel(self):
+        for seq1, seq2 in SEQUENCES:
+            for m, s, g in SCORES:
+                for al in (0, 1):
+                    for compute in (compute_needleman_wunsch, compute_smith_waterman):
+                        matrix, traceback = compute(m, s, g, seq1, seq2, al, 'vectorized')
+                        matrix2, traceback2 = compute(m, s, g, seq1, seq2, al, 'numba')
+                        np.testing.assert_array_equal(matrix, matrix2)
+                        np.testing.assert_array_equal(traceback, traceback2)
+
+    @unittest.skipUnless(sequence_alignment.NUMBA, "Numba is not installed")
+    def test_engine_numba(self):
+        self.assertEqual('numba', resolve_engine('auto'))
+        for seq1, seq2 in SEQUENCES + [generate_pair('random', 300)]:
+            for al in (0, 1):
+                for compute in (compute_needleman_wunsch, compute_smith_waterman):
+                    matrix, traceback = compute(2, -1, -2, seq1, seq2, al, 'vectorized')
+                    matrix2, traceback2 = compute(2, -1, -2, seq1, seq2, al, 'numba')
+                    np.testing.assert_array_equal(matrix, matrix2)
+                    np.testing.assert_array_equal(traceback, traceback2)
+
+    @patch('sequence_alignment.NUMBA', False)
+    def test_engine_without_numba(self):
+        self.assertEqual(('vectorized', 'loop'), available_engines())
+        self.assertEqual('vectorized', resolve_engine('auto'))
+        with self.assertRaises(ValueError):
+            compute_smith_waterman(1, -1, -2, "AATCG", "AACG", 0, 'numba')
+
+    @patch('sequence_alignment.TILE_SIZE', 3)
+    def test_engine_wavefront(self):
+        pairs = SEQUENCES + [generate_pair('random', 40), generate_pair('repetitive', 40)]
+        engines = [engine for engine in available_engines() if engine == 'numba']
+        for seq1, seq2 in pairs:
+            for al in (0, 1):
+                for compute in (compute_needleman_wunsch, compute_smith_waterman):
+                    matrix, traceback = compute(2, -1, -2, seq1, seq2, al, 'vectorized')
+                    for engine in engines:
+                        matrix2, traceback2 = compute(2, -1, -2, seq1, seq2, al, engine, threads=4)
+                        np.testing.assert_array_equal(matrix, matrix2)
+                        np.testing.assert_array_equal(traceback, traceback2)
+        for engine in ('vectorized', 'loop'):
+            with self.assertRaises(ValueError):
+                compute_needleman_wunsch(1, -1, -2, "AATCG", "AACG", 0, engine, threads=2)
+            matrix, traceback = compute_needleman_wunsch(1, -1, -2, "AATCG", "AACG", 0, engine, threads=None)
+            np.testing.assert_array_equal(compute_needleman_wunsch(1, -1, -2, "AATCG", "AACG", 0, engine)[0], matrix)
+
+    def test_fill_wavefront_tiles(self):
+        seq1, seq2 = generate_pair('random', 50)
+        expected, expected_traceback = compute_smith_waterman(1, -1, -2, seq1, seq2, 1, 'vectorized')
+        codes = [np.array(['ACGT'.index(character) for character in sequence]) for sequence in (seq1, seq2)]
+        table = np.full((5, 5), -1)
+        np.fill_diagonal(table, 1)
+        for tile in (1, 7, 50, 64):
+            matrix = np.zeros_like(expected)
+            traceback = np.zeros_like(expected_traceback)
+            fill_wavefront(matrix, traceback, table, -2, codes[0], codes[1], 1, True, fill_vectorized, 3, tile)
+            np.testing.assert_array_equal(expected, matrix)
+            np.testing.assert_array_equal(expected_traceback, traceback)
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            compute_needleman_wunsch(1, -1, -2, "AATCG", "AACG", 0, 'gpu')
+
+    def test_score_needleman_wunsch(self):
+        for seq1, seq2 in SEQUENCES:
+            for m, s, g in SCORES:
+                matrix, _ = compute_needleman_wunsch(m, s, g, seq1, seq2, 0)
+                self.assertEqual(matrix[len(seq1), len(seq2)], score_needleman_wunsch(m, s, g, seq1, seq2))
+
+    def test_hirschberg_1(self):
+        self.assertEqual(str(hirschberg(3, -1, -1, "ACACACC", "ACA")), "Alignment with score 5:\nACACACC\n--ACA--")
+
+    def test_hirschberg_2(self):
+        self.assertEqual(str(hirschberg(1, -1, -2, "AATCG", "AACG")), "Alignment with score 2:\nAATCG\nAA-CG")
+
+    @patch('sequence_alignment.HIRSCHBERG_BLOCK_CELLS', 1)
+    def test_hirschberg_3(self):
+        for seq1, seq2 in SEQUENCES:
+            for m, s, g in SCORES:
+                matrix, traceback = compute_needleman_wunsch(m, s, g, seq1, seq2, 0)
+                alignments = path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)])
+                self.assertEqual(render(alignments), render([hirschberg(m, s, g, seq1, seq2)]))
+
+    def test_score_dtype(self):
+        self.assertEqual(np.int16, score_dtype(1, -1, -2, 100, 100))
+        self.assertEqual(np.int32, score_dtype(1, -1, -2, 10000, 10000))
+        self.assertEqual(np.int64, score_dtype(10 ** 6, -1, -2, 10000, 10000))
+
+    def test_compact_matrices(self):
+        matrix, traceback = compute_needleman_wunsch(1000, -1000, -2000, "ACACACC" * 3, "ACA" * 3, 1)
+        loop_matrix, loop_traceback = compute_needleman_wunsch(1000, -1000, -2000, "ACACACC" * 3, "ACA" * 3, 1, 'loop')
+        self.assertEqual(np.int32, matrix.dtype)
+        self.assertEqual(np.uint8, traceback.dtype)
+        np.testing.assert_array_equal(matrix, loop_matrix)
+        np.testing.assert_array_equal(traceback, loop_traceback)
+
+    def test_path_is_lazy(self):
+        seq1 = "ACACACC"
+        seq2 = "ACA"
+        matrix, traceback = compute_needleman_wunsch(3, -1, -1, seq1, seq2, 1)
+        alignments = path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)])
+        first = next(alignments)
+        self.assertEqual(("ACACACC", "--ACA--"), (first.aligned1, first.aligned2))
+        self.assertEqual(3, len(list(alignments)))
+
+    def test_path_limit(self):
+        seq1 = "ACACACC"
+        seq2 = "ACA"
+        matrix, traceback = compute_needleman_wunsch(3, -1, -1, seq1, seq2, 1)
+        alignments = path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)], limit=2)
+        self.assertEqual(render(alignments), "Alignment with score 5:\nACACACC\n--ACA--\n"
+                                             "Alignment with score 5:\nACACACC\nACA----\n")
+        matrix, traceback = compute_smith_waterman(1, -1, -2, "AATCG", "AACG", 1)
+        alignments = traceback_smith_waterman("AATCG", "AACG", matrix, traceback, 1, limit=1)
+        self.assertEqual(render(alignments), "Alignment with score 2:\nAA\nAA\n")
+
+    def test_count_alignments(self):
+        for seq1, seq2 in SEQUENCES:
+            for m, s, g in SCORES:
+                for al in (0, 1):
+                    matrix, traceback = compute_needleman_wunsch(m, s, g, seq1, seq2, al)
+                    alignments = path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)])
+                    self.assertEqual(len(list(alignments)), count_alignments(traceback, len(seq1), len(seq2)))
+                    matrix, traceback = compute_smith_waterman(m, s, g, seq1, seq2, al)
+                    alignments = traceback_smith_waterman(seq1, seq2, matrix, traceback, al)
+                    self.assertEqual(len(list(alignments)), count_smith_waterman(matrix, traceback, al))
+
+    def test_count_alignments_large(self):
+        seq1 = "A" * 200
+        seq2 = "A" * 100
+        matrix, traceback = compute_needleman_wunsch(0, 0, 0, seq1, seq2, 1)
+        # Paths with diagonal, up and left steps from (200, 100) to (0, 0): Delannoy number D(200, 100)
+        delannoy = sum(comb(100, k) * comb(200, k) * 2 ** k for k in range(101))
+        self.assertEqual(delannoy, count_alignments(traceback, len(seq1), len(seq2)))
+
+    def test_align(self):
+        self.assertEqual(render(align(3, -1, -1, "ACACACC", "ACA", 'global', 1, limit=2)),
+                         "Alignment with score 5:\nACACACC\n--ACA--\nAlignment with score 5:\nACACACC\nACA----\n")
+        self.assertEqual(render(align(1, -1, -2, "AATCG", "AACG", 'local', 1)),
+                         "Alignment with score 2:\nAA\nAA\nAlignment with score 2:\nCG\nCG\n")
+        with self.assertRaises(ValueError):
+            align(1, -1, -2, "AATCG", "AACG", 'semiglobal')
+
+    def test_align_statistics(self):
+        calls = []
+        statistics = AlignmentStatistics(callback=lambda recorded: calls.append(recorded.as_dict()))
+        alignments = align(1, -1, -2, "AATCG", "AACG", 'local', 1, statistics=statistics)
+        self.assertEqual(render(align(1, -1, -2, "AATCG", "AACG", 'local', 1)), render(alignments))
+        self.assertEqual({'fill', 'maximum', 'traceback'}, set(statistics.seconds))
+        self.assertEqual((1, 30, 2), (statistics.calls, statistics.cells, statistics.alignments))
+        matrix, traceback = compute_smith_waterman(1, -1, -2, "AATCG", "AACG", 1)
+        self.assertEqual(matrix.nbytes + traceback.nbytes, statistics.peak_bytes)
+        align(3, -1, -1, "ACACACC", "ACA", 'global', 1, statistics=statistics)
+        self.assertEqual((2, 62, 6), (statistics.calls, statistics.cells, statistics.alignments))
+        self.assertEqual([1, 2], [call['calls'] for call in calls])
+        align(3, -1, -1, "ACACACC", "ACA", 'global', band=1, statistics=statistics)
+        align(3, -1, -1, "ACACACC", "ACA", 'local', gap_open=-2, statistics=statistics)
+        align(3, -1, -1, "ACACACC", "ACA", 'global', linear=True, statistics=statistics)
+        self.assertIn('linear', statistics.seconds)
+        self.assertEqual(5, len(calls))
+        cache = AlignmentCache()
+        for _ in range(2):
+            align(1, -1, -2, "AATCG", "AACG", cache=cache, statistics=statistics)
+        self.assertIn('cache', statistics.seconds)
+        self.assertEqual(7, statistics.calls)
+
+    def test_align_many(self):
+        for algorithm in ('global', 'local'):
+            expected = [render(align(3, -1, -1, seq1, seq2, algorithm, 1)) for seq1, seq2 in SEQUENCES]
+            for workers in (1, 2):
+                results = align_many(SEQUENCES, 3, -1, -1, algorithm, 1, workers=workers, chunksize=2)
+                self.assertEqual(expected, [render(alignments) for alignments in results])
+
+    def test_affine_linear(self):
+        for seq1, seq2 in SEQUENCES:
+            for m, s, g in SCORES:
+                matrix, traceback = compute_needleman_wunsch(m, s, g, seq1, seq2, 1)
+                affine_matrix, affine_traceback = compute_needleman_wunsch_affine(m, s, 0, g, seq1, seq2, 1)
+                np.testing.assert_array_equal(matrix, affine_matrix)
+                score = matrix[len(seq1), len(seq2)]
+                self.assertEqual(sorted(map(repr, path(seq1, seq2, traceback, len(seq1), len(seq2), score))),
+                                 sorted(map(repr, path_affine(seq1, seq2, affine_traceback, len(seq1), len(seq2),
+                                                              score))))
+                if g <= 0:  # With a positive gap score a local alignment can start with a linear gap only
+                    matrix, traceback = compute_smith_waterman(m, s, g, seq1, seq2, 1)
+                    affine_matrix, affine_traceback = compute_smith_waterman_affine(m, s, 0, g, seq1, seq2, 1)
+                    np.testing.assert_array_equal(matrix, affine_matrix)
+                    self.assertEqual(
+                        sorted(map(repr, traceback_smith_waterman(seq1, seq2, matrix, traceback, 1))),
+                        sorted(map(repr, traceback_smith_waterman(seq1, seq2, affine_matrix, affine_traceback, 1,
+                                                                  trace=path_affine))))
+
+    def test_affine(self):
+        matrix, traceback = compute_needleman_wunsch_affine(1, -1, -3, -1, "ACGTTTTACGT", "ACGTACGT", 1)
+        self.assertEqual(2, matrix[11, 8])
+        self.assertEqual(render(path_affine("ACGTTTTACGT", "ACGTACGT", traceback, 11, 8, matrix[11, 8])),
+                         "Alignment with score 2:\nACGTTTTACGT\nACG---TACGT\n"
+                         "Alignment with score 2:\nACGTTTTACGT\nACGT---ACGT\n")
+        # The linear gap score splits the gaps, the affine one keeps them together
+        self.assertEqual(render(align(1, -1, -1, "TCGAACTCG", "TGTTGT", 'global', 0)),
+                         "Alignment with score -2:\nTCGAACTCG-\nT-G---TTGT\n")
+        self.assertEqual(render(align(1, -1, -1, "TCGAACTCG", "TGTTGT", 'global', 0, gap_open=-3)),
+                         "Alignment with score -8:\nTCGAACTCG\nT---GTTGT\n")
+        matrix, traceback = compute_needleman_wunsch_affine(1, -1, -3, -1, "ACGTTTTACGT", "ACGTACGT", 0)
+        self.assertEqual(1, len(list(path_affine("ACGTTTTACGT", "ACGTACGT", traceback, 11, 8, matrix[11, 8]))))
+        self.assertEqual(render(align(3, -1, -1, "TTACGTTTTACGTGG", "CCACGTACGTCC", 'local', 0, gap_open=-3)),
+                         "Alignment with score 18:\nACGTTTTACGT\nACG---TACGT\n")
+        self.assertEqual(render(align(3, -1, -1, "TTACGTTTTACGTGG", "CCACGTACGTCC", 'local', 0, gap_open=-10)),
+                         "Alignment with score 15:\nTACGT\nTACGT\n")
+        results = align_many([("ACGTTTTACGT", "ACGTACGT")] * 3, 1, -1, -1, 'global', 0, workers=1, gap_open=-3)
+        self.assertEqual(["Alignment with score 2:\nACGTTTTACGT\nACG---TACGT\n"] * 3, list(map(render, results)))
+
+    def test_compute_batch(self):
+        for m, s, g in SCORES:
+            for al in (0, 1):
+                for compute, compute_batch in ((compute_needleman_wunsch, compute_needleman_wunsch_batch),
+                                               (compute_smith_waterman, compute_smith_waterman_batch)):
+                    matrices = compute_batch(m, s, g, SEQUENCES, al)
+                    self.assertEqual(len(SEQUENCES), len(matrices))
+                    for (seq1, seq2), (matrix, traceback) in zip(SEQUENCES, matrices):
+                        expected_matrix, expected_traceback = compute(m, s, g, seq1, seq2, al)
+                        np.testing.assert_array_equal(expected_matrix, matrix)
+                        np.testing.assert_array_equal(expected_traceback, traceback)
+
+    @patch('sequence_alignment.BATCH_CELLS', 64)
+    def test_align_batch(self):
+        for algorithm in ('global', 'local'):
+            expected = [render(align(2, -1, -2, seq1, seq2, algorithm, 1)) for seq1, seq2 in SEQUENCES]
+            results = align_batch(2, -1, -2, SEQUENCES, algorithm, 1)
+            self.assertEqual(expected, [render(alignments) for alignments in results])
+
+    @patch('sequence_alignment.fill_numba', fill_scalar)
+    def test_align_batch_engine(self):
+        expected = [render(align(2, -1, -2, seq1, seq2, 'local')) for seq1, seq2 in SEQUENCES]
+        # 'auto' fills the pairs together only when it resolves to the 'vectorized' engine
+        for numba, engine, batched in ((False, 'auto', True), (True, 'auto', False), (True, 'vectorized', True),
+                                       (True, 'numba', False)):
+            with patch('sequence_alignment.NUMBA', numba), \
+                    patch('sequence_alignment.compute_batch', wraps=sequence_alignment.compute_batch) as compute_batch:
+                results = align_batch(2, -1, -2, SEQUENCES, 'local', engine=engine)
+            self.assertEqual(batched, compute_batch.called)
+            self.assertEqual(expected, [render(alignments) for alignments in results])
+
+    def test_cigar(self):
+        alignment = align(3, -1, -1, "ACACACC", "ACA", 'global', 1)[2]
+        self.assertEqual("ACACACC\nAC--A--", f"{alignment.aligned1}\n{alignment.aligned2}")
+        self.assertEqual("2M2I1M2I", alignment.cigar)
+        alignment = align(1, -1, -2, "AATCG", "AACG", 'local', 1)[1]
+        self.assertEqual((3, 5, 2, 4, "2M"),
+                         (alignment.r, alignment.end1, alignment.c, alignment.end2, alignment.cigar))
+
+    def test_alignment_record(self):
+        alignment = align(1, -1, -2, "GATTACAGATTACA", "GATCACAGTTAC", 'local')[0]
+        self.assertEqual({'score': 8, 'start1': 0, 'end1': 13, 'start2': 0, 'end2': 12, 'cigar': '8M1I4M',
+                          'matches': 11, 'mismatches': 1, 'gaps': 1, 'gap_opens': 1}, alignment.as_dict())
+        self.assertAlmostEqual(11 / 13, alignment.identity)
+        self.assertEqual("Alignment with score 8: 0-13 0-12 8M1I4M identity 84.6%", alignment.summary())
+        with self.assertRaises(AttributeError):
+            alignment.aligned = alignment.aligned1
+        for seq1, seq2 in SEQUENCES:
+            for alignment in align(2, -1, -2, seq1, seq2, 'global', 1):
+                columns = list(zip(alignment.aligned1, alignment.aligned2))
+                self.assertEqual(sum(a == b for a, b in columns), alignment.matches)
+                self.assertEqual(sum('-' in column for column in columns), alignment.gaps)
+                self.assertEqual(len(columns), alignment.matches + alignment.mismatches + alignment.gaps)
+        self.assertEqual(0.0, align(1, -1, -2, "AAAA", "CC", 'local')[0].identity)
+
+    def test_banded_wide(self):
+        for seq1, seq2 in SEQUENCES:
+            for m, s, g in SCORES:
+                for al in (0, 1):
+                    matrix, traceback = compute_needleman_wunsch(m, s, g, seq1, seq2, al)
+                    banded_matrix, banded_traceback = compute_needleman_wunsch_banded(m, s, g, seq1, seq2, al, 10)
+                    for i in range(len(seq1) + 1):
+                        np.testing.assert_array_equal(matrix[i], banded_matrix[i, :])
+                        np.testing.assert_array_equal(traceback[i], banded_traceback[i, :])
+                    matrix, traceback = compute_smith_waterman(m, s, g, seq1, seq2, al)
+                    banded_matrix, banded_traceback = compute_smith_waterman_banded(m, s, g, seq1, seq2, al, 10)
+                    self.assertEqual(render(traceback_smith_waterman(seq1, seq2, matrix, traceback, al)),
+                                     render(traceback_smith_waterman(seq1, seq2, banded_matrix, banded_traceback, al)))
+
+    @patch('sequence_alignment.BAND_WIDTH', 1)
+    def test_banded_auto(self):
+        for seq1, seq2 in SEQUENCES + [("ACGTTTTTTACGT", "ACGTACGT"), ("TTTTTGATTACA", "GATTACATTTTT")]:
+            for m, s, g in SCORES:
+                matrix, _ = compute_needleman_wunsch(m, s, g, seq1, seq2, 0)
+                banded_matrix, banded_traceback = compute_needleman_wunsch_banded(m, s, g, seq1, seq2, 1)
+                self.assertEqual(matrix[len(seq1), len(seq2)], banded_matrix[len(seq1), len(seq2)])
+                matrix, _ = compute_smith_waterman(m, s, g, seq1, seq2, 0)
+                banded_matrix, banded_traceback = compute_smith_waterman_banded(m, s, g, seq1, seq2, 1)
+                self.assertEqual(np.max(matrix), max_cells(banded_matrix)[0])
+
+    def test_banded_auto_negative_substitutions(self):
+        seq1, seq2 = "GACGAGCCCCGGGGGGGGCCGACGCGGACGAAGAAGGACGAGAGACAAACG", "ACCAAGAAAAAAGACCAAGAGG"
+        self.assertEqual(72, align(-2, -2, 1, seq1, seq2, 'local', band='auto')[0].score)
+        self.assertEqual(72, align(-2, -2, 1, seq1, seq2, 'local')[0].score)
+
+    def test_banded_whole(self):
+        seq1, seq2 = generate_pair('random', 200)
+        matrix, traceback = compute_smith_waterman_banded(1, -1, -2, seq1, seq2, 0)
+        self.assertIsInstance(matrix, np.ndarray)
+        self.assertEqual((len(seq1) + 1, len(seq2) + 1), matrix.shape)
+        self.assertEqual(np.max(compute_smith_waterman(1, -1, -2, seq1, seq2, 0)[0]), np.max(matrix))
+        matrix, traceback = compute_needleman_wunsch_banded(1, -1, -2, "ACGTTTTTTACGT", "ACGTACGT", 0, 20)
+        self.assertEqual((14, 9), matrix.shape)
+
+    def test_banded_narrow(self):
+        seq1 = "ACGTTTTTTACGT"
+        seq2 = "ACGTACGT"
+        matrix, traceback = compute_needleman_wunsch_banded(1, -1, -2, seq1, seq2, 1, 0)
+        self.assertEqual((len(seq1) + 1, 6), matrix.data.shape)
+        self.assertLess(matrix.nbytes, (len(seq1) + 1) * (len(seq2) + 1) * matrix.dtype.itemsize)
+        self.assertEqual(-2, matrix[len(seq1), len(seq2)])
+        alignments = list(path(seq1, seq2, traceback, len(seq1), len(seq2), matrix[len(seq1), len(seq2)]))
+        self.assertEqual(6, len(alignments))
+        self.assertIn("Alignment with score -2:\nACGTTTTTTACGT\nACGT-----ACGT", map(str, alignments))
+        self.assertEqual(6, count_alignments(traceback, len(seq1), len(seq2)))
+        matrix, traceback = compute_smith_waterman_banded(1, -1, -2, "TTTTTGATTACA", "GATTACATTTTT", 0, 2)
+        self.assertEqual(render(traceback_smith_waterman("TTTTTGATTACA", "GATTACATTTTT", matrix, traceback, 0)),
+                         "Alignment with score 3:\nATT\nATT\n")
+
+    def test_score_smith_waterman(self):
+        for seq1, seq2 in SEQUENCES:
+            for m, s, g in SCORES:
+                matrix, _ = compute_smith_waterman(m, s, g, seq1, seq2, 0)
+                score, rows, columns = score_smith_waterman(m, s, g, seq1, seq2, None)
+                expected = np.where(matrix == np.max(matrix))
+                self.assertEqual(np.max(matrix), score)
+                np.testing.assert_array_equal(expected[0], rows)
+                np.testing.assert_array_equal(expected[1], columns)
+                self.assertEqual((rows[0], columns[0]), tuple(score_smith_waterman(m, s, g, seq1, seq2)[1:]))
+
+    def test_smith_waterman_linear(self):
+        # A positive gap score gives too many optimal alignments of the longer sequences to enumerate them all
+        cases = [(pair, scores) for pair in SEQUENCES for scores in SCORES + [(2, -3, -5)]] + \
+                [(pair, scores) for pair in [("TTTTTGATTACA", "GATTACATTTTT"), ("ACGTTTTTTACGTCCCC", "GGACGTACGTAA")]
+                 for scores in SCORES + [(2, -3, -5)] if scores[2] <= 0]
+        for (seq1, seq2), (m, s, g) in cases:
+            for al in (0, 1):
+                matrix, traceback = compute_smith_waterman(m, s, g, seq1, seq2, al)
+                for limit in (None, 1, 2):
+                    self.assertEqual(
+                        [(a.r, a.c, a.steps) for a in traceback_smith_waterman(seq1, seq2, matrix, traceback, al,
+                                                                               limit)],
+                        [(a.r, a.c, a.steps) for a in smith_waterman_linear(m, s, g, seq1, seq2, al, limit)])
+        self.assertEqual(render(align(1, -1, -2, "AATCG", "AACG", 'local', 1, linear=True)),
+                         "Alignment with score 2:\nAA\nAA\nAlignment with score 2:\nCG\nCG\n")
+        self.assertEqual(render(align(3, -1, -1, "ACACACC", "ACA", 'global', 1, linear=True)),
+                         "Alignment with score 5:\nACACACC\n--ACA--\n")
+
+    @patch('sequence_alignment.compute_smith_waterman', wraps=compute_smith_waterman)
+    def test_smith_waterman_linear_rectangle(self, compute):
+        reference = ''.join(np.random.default_rng(0).choice(list("ACGT"), 2000))
+        query = reference[1003:1023]
+        alignment, = smith_waterman_linear(1, -1, -2, query, reference)
+        self.assertEqual((20, 0, 1003, "20M"), (alignment.score, alignment.r, alignment.c, alignment.cigar))
+        # Only the rectangle ending at the maximum is filled with the whole matrices
+        _, _, _, sequence1, sequence2, _ = compute.call_args.args
+        self.assertEqual((query, query), (sequence1, sequence2))
+
+    def test_incremental_aligner(self):
+        rng = np.random.default_rng(0)
+        for algorithm, compute in (('global', compute_needleman_wunsch), ('local', compute_smith_waterman)):
+            for m, s, g in SCORES:
+                for al in (0, 1):
+                    aligner = IncrementalAligner(m, s, g, algorithm, al)
+                    for _ in range(20):
+                        characters = ''.join(rng.choice(list("ACGT"), rng.integers(0, 4)))
+                        (aligner.extend1 if rng.random() < 0.5 else aligner.extend2)(characters)
+                        matrix, traceback = compute(m, s, g, aligner.sequence1, aligner.sequence2, al)
+                        np.testing.assert_array_equal(matrix, aligner.matrices[0])
+                        np.testing.assert_array_equal(traceback, aligner.matrices[1])
+                        self.assertEqual(np.max(matrix) if algorithm == 'local' else matrix[-1, -1], aligner.score)
+                    self.assertEqual(render(align(m, s, g, aligner.sequence1, aligner.sequence2, algorithm, al, 2)),
+                                     render(aligner.alignments(2)))
+        blosum = substitution_matrix('BLOSUM62')
+        aligner = IncrementalAligner(1, -1, -2, 'local', 0, "HEAGAWGHEE", "PAW", substitution=blosum)
+        aligner.extend2("HEAE")
+        self.assertEqual(render(align(1, -1, -2, "HEAGAWGHEE", "PAWHEAE", 'local', substitution=blosum)),
+                         render(aligner.alignments()))
+
+    def test_xdrop_without_pruning(self):
+        for seq1, seq2 in SEQUENCES:
+            for m, s, g in SCORES:
+                for al in (0, 1):
+                    matrix, traceback = compute_smith_waterman(m, s, g, seq1, seq2, al)
+                    for xdrop in (None, 1000):
+                        procedure, steps, stopped, filled = compute_smith_waterman_xdrop(m, s, g, seq1, seq2, al,
+                                                                                         xdrop)
+                        for i in range(len(seq1) + 1):
+                            np.testing.assert_array_equal(matrix[i], procedure[i, :])
+                            np.testing.assert_array_equal(traceback[i], steps[i, :])
+                        self.assertEqual((False, matrix.size), (stopped, filled))
+                    matrix, traceback = compute_needleman_wunsch(m, s, g, seq1, seq2, al)
+                    procedure, steps, _, _ = compute_extension_xdrop(m, s, g, seq1, seq2, al, 1000)
+                    for i in range(len(seq1) + 1):
+                        np.testing.assert_array_equal(matrix[i], procedure[i, :])
+                        np.testing.assert_array_equal(traceback[i], steps[i, :])
+
+    def test_xdrop(self):
+        rng = np.random.default_rng(0)
+        seq1 = ''.join(rng.choice(list("ACGT"), 1000))
+        seq2 = seq1[:150] + seq1[152:300] + ''.join(rng.choice(list("ACGT"), 700))
+        expected = render(align(1, -1, -2, seq1, seq2, 'local'))
+        for compute in (compute_smith_waterman_xdrop, compute_extension_xdrop):
+            matrix, traceback, stopped, filled = compute(1, -1, -2, seq1, seq2, 0, 20)
+            self.assertEqual(expected, render(traceback_smith_waterman(seq1, seq2, matrix, traceback, 0)))
+            self.assertTrue(stopped)
+            self.assertLess(filled, matrix.size / 20)
+            self.assertLess(matrix.nbytes + traceback.nbytes, matrix.size / 4)
+        matrix, traceback, stopped, filled = compute_extension_xdrop(1, -1, -2, seq1, seq2, 0, None, 30)
+        self.assertEqual(expected, render(traceback_smith_waterman(seq1, seq2, matrix, traceback, 0)))
+        self.assertTrue(stopped)
+        self.assertLess(filled, matrix.size)
+        matrix, traceback, stopped, _ = compute_extension_xdrop(1, -1, -2, "TTTGATTACA", "GATTACA", 0, 2)
+        self.assertEqual("Alignment with score 0:\n\n\n", render(traceback_smith_waterman(
+            "TTTGATTACA", "GATTACA", matrix, traceback, 0)))
+        self.assertTrue(stopped)
+        with self.assertRaises(ValueError):
+            compute_smith_waterman_xdrop(1, -1, -2, "ACGT", "ACGT", 0, -1)
+        with self.assertRaises(ValueError):
+            compute_extension_xdrop(1, -1, -2, "ACGT", "ACGT", 0, 5, -1)
+
+    def test_out_of_core(self):
+        for seq1, seq2 in SEQUENCES + [generate_pair('repetitive', 60)]:
+            for al in (0, 1):
+                for local, compute in ((False, compute_needleman_wunsch), (True, compute_smith_waterman)):
+                    matrix, traceback = compute(2, -1, -2, seq1, seq2, al)
+                    expected = render(traceback_alignments(seq1, seq2, matrix, traceback,
+                                                           'local' if local else 'global', al, None))
+                    with tempfile.TemporaryDirectory() as directory:
+                        score, rows, columns, traceback_file = compute_out_of_core(2, -1, -2, seq1, seq2, al,
+                                                                                   directory, local, checkpoint=7)
+                        np.testing.assert_array_equal(traceback, traceback_file[:, :])
+                        self.assertEqual(expected, render(traceback_cells(seq1, seq2, traceback_file, score, rows,
+                                                                          columns, al)))
+
+    @patch('sequence_alignment.BATCH_CELLS', 100)
+    def test_out_of_core_resume(self):
+        seq1, seq2 = generate_pair('random', 60)
+        matrix, traceback = compute_smith_waterman(1, -1, -2, seq1, seq2, 1)
+        calls = []
+
+        def interrupted(*args):
+            calls.append(args)
+            if len(calls) == 5:
+                raise KeyboardInterrupt
+            fill_engine(*args)
+
+        with tempfile.TemporaryDirectory() as directory:
+            with patch('sequence_alignment.fill_engine', side_effect=interrupted):
+                with self.assertRaises(KeyboardInterrupt):
+                    compute_out_of_core(1, -1, -2, seq1, seq2, 1, directory, True, checkpoint=2)
+            with patch('sequence_alignment.fill_engine', wraps=fill_engine) as fill:
+                score, rows, columns, traceback_file = compute_out_of_core(1, -1, -2, seq1, seq2, 1, directory, True,
+                                                                           checkpoint=2)
+            # Blocks of one row, with a checkpoint every two rows: the fill resumes after the fourth row
+            self.assertEqual(len(seq1) - 4, fill.call_count)
+            np.testing.assert_array_equal(traceback, traceback_file[:, :])
+            self.assertEqual(np.max(matrix), score)
+            compute_out_of_core(1, -1, -3, seq1, seq2, 1, directory, True, checkpoint=2)  # Other scores start over
+            self.assertFalse(np.array_equal(traceback, np.load(os.path.join(directory, 'traceback.npy'))))
+
+    def test_kmer_index(self):
+        sequence = "ACGTACGTTTACGAACG"
+        index = build_kmer_index(sequence, 3)
+        rows, columns = index.lookup(kmer_hashes("TACGA", 3))
+        expected = [(i, j) for i in range(3) for j in range(len(sequence) - 2) if "TACGA"[i:i + 3] == sequence[j:j + 3]]
+        self.assertEqual(expected, sorted(zip(rows.tolist(), columns.tolist())))
+        rows, _ = index.lookup(kmer_hashes("TACGA", 3), max_occurrences=1)
+        self.assertEqual([2], rows.tolist())
+        self.assertEqual(0, len(kmer_hashes("AC", 3)))
+        with tempfile.TemporaryDirectory() as directory:
+            index.save(os.path.join(directory, "index.npz"))
+            loaded = load_kmer_index(os.path.join(directory, "index.npz"))
+        self.assertEqual((3, len(sequence)), (loaded.k, loaded.length))
+        np.testing.assert_array_equal(index.positions, loaded.positions)
+
+    def test_seed_and_extend(self):
+        rng = np.random.default_rng(0)
+        reference = ''.join(rng.choice(list("ACGT"), 5000))
+        query = reference[3000:3080] + reference[3083:3200]
+        alignments, skipped = seed_and_extend(1, -1, -2, query, reference)
+        expected = list(smith_waterman_linear(1, -1, -2, query, reference))
+        self.assertEqual([(a.score, a.r, a.c, a.steps) for a in expected],
+                         [(a.score, a.r, a.c, a.steps) for a in alignments])
+        self.assertGreater(skipped, 0.9)
+        query = reference[:2000] + reference[2010:4000] + "A" + reference[4000:]
+        alignments, skipped = seed_and_extend(1, -1, -2, query, reference, 'global', index=build_kmer_index(reference))
+        self.assertEqual(hirschberg(1, -1, -2, query, reference).score, alignments[0].score)
+        self.assertGreater(skipped, 0.9)
+        self.assertEqual(([], 1.0), seed_and_extend(1, -1, -2, "ACGTACGTACGTT", "GGGGGGGGGGGGGG"))
+        with self.assertRaises(ValueError):
+            seed_and_extend(1, -1, -2, query, reference[1:], index=build_kmer_index(reference))
+
+    def test_substitution_identity(self):
+        alphabet = "ACGTIO"
+        for m, s, g in SCORES:
+            identity = SubstitutionMatrix(alphabet, np.where(np.eye(len(alphabet), dtype=bool), m, s))
+            for seq1, seq2 in SEQUENCES:
+                for compute in (compute_needleman_wunsch, compute_smith_waterman):
+                    for engine in ('vectorized', 'loop'):
+                        matrix, traceback = compute(m, s, g, seq1, seq2, 1, engine)
+                        matrix2, traceback2 = compute(0, 0, g, seq1, seq2, 1, engine, identity)
+                        np.testing.assert_array_equal(matrix, matrix2)
+                        np.testing.assert_array_equal(traceback, traceback2)
+                self.assertEqual(score_needleman_wunsch(m, s, g, seq1, seq2),
+                                 score_needleman_wunsch(0, 0, g, seq1, seq2, identity))
+                self.assertEqual(repr(hirschberg(m, s, g, seq1, seq2)), repr(hirschberg(0, 0, g, seq1, seq2, identity)))
+                for algorithm in ('global', 'local'):
+                    expected = render(align(m, s, g, seq1, seq2, algorithm, 1))
+                    self.assertEqual(expected, render(align(0, 0, g, seq1, seq2, algorithm, 1, substitution=identity)))
+                    self.assertEqual(expected, render(align(0, 0, g, seq1, seq2, algorithm, 1, band=10,
+                                                            substitution=identity)))
+                    self.assertEqual(render(align(m, s, g, seq1, seq2, algorithm, 1, gap_open=-1)),
+                                     render(align(0, 0, g, seq1, seq2, algorithm, 1, gap_open=-1,
+                                                  substitution=identity)))
+            results = align_batch(0, 0, g, SEQUENCES, 'global', 1, substitution=identity)
+            self.assertEqual([render(align(m, s, g, seq1, seq2, 'global', 1)) for seq1, seq2 in SEQUENCES],
+                             [render(alignments) for alignments in results])
+
+    def test_blosum62(self):
+        blosum62 = substitution_matrix('blosum62')
+        np.testing.assert_array_equal(blosum62.scores, blosum62.scores.T)
+        self.assertEqual(11, blosum62.scores[blosum62.alphabet.index('W'), blosum62.alphabet.index('W')])
+        matrix, traceback = compute_smith_waterman(0, 0, -4, "HEAGAWGHEE", "PAWHEAE", 1, 'loop', blosum62)
+        matrix2, traceback2 = compute_smith_waterman(0, 0, -4, "HEAGAWGHEE", "PAWHEAE", 1, 'vectorized', blosum62)
+        np.testing.assert_array_equal(matrix, matrix2)
+        np.testing.assert_array_equal(traceback, traceback2)
+        self.assertEqual(render(align(0, 0, -4, "heagawghee", "PAWHEAE", 'local', 0, substitution=blosum62)),
+                         "Alignment with score 25:\nawghe-e\nAW-HEAE\n")
+
+    def test_dna_matrix(self):
+        matrix = dna_matrix(2, -3, -1)
+        scores = {(code1, code2): matrix.scores[i, j] for i, code1 in enumerate(matrix.alphabet)
+                  for j, code2 in enumerate(matrix.alphabet)}
+        self.assertEqual((2, -1, -3, 2), (scores['A', 'A'], scores['A', 'G'], scores['A', 'T'], scores['T', 'U']))
+        self.assertEqual((1, 1, -1), (scores['A', 'R'], scores['Y', 'Y'], scores['N', 'N']))
+        self.assertEqual(render(align(1, -1, -2, "ACGTR", "acgua", 'global', 0, substitution=dna_matrix(2, -2))),
+                         "Alignment with score 8:\nACGTR\nacgua\n")
+        with self.assertRaises(ValueError):
+            align(1, -1, -2, "ACGTX", "ACGT", substitution=matrix)
+
+    def test_parse_substitution_matrix(self):
+        matrix = parse_substitution_matrix(["# Transitions", "   A  C  G  T", "A  1 -2 -1 -2", "C -2  1 -2 -1",
+                                            "G -1 -2  1 -2", "T -2 -1 -2  1"])
+        self.assertEqual("ACGT", matrix.alphabet)
+        np.testing.assert_array_equal(dna_matrix(1, -2, -1).scores[:4, :4], matrix.scores)
+        with self.assertRaises(ValueError):
+            parse_substitution_matrix(["   A  C", "A  1 -1"])
+
+
+class Cache(unittest.TestCase):
+
+    def test_cache_key(self):
+        key = cache_key(1, -1, -2, "AATCG", "AACG", algorithm='local', al=0)
+        self.assertEqual(key, cache_key(1, -1, -2, "AATCG", "AACG", al=0, algorithm='local'))
+        self.assertNotEqual(key, cache_key(1, -1, -3, "AATCG", "AACG", algorithm='local', al=0))
+        self.assertNotEqual(key, cache_key(1, -1, -2, "AATC", "GAACG", algorithm='local', al=0))
+        self.assertNotEqual(key, cache_key(1, -1, -2, "AATCG", "AACG", dna_matrix(1, -1), algorithm='local', al=0))
+
+    @patch('sequence_alignment.compute_smith_waterman', wraps=compute_smith_waterman)
+    def test_align_cache(self, compute):
+        cache = AlignmentCache(maxsize=2)
+        expected = render(align(1, -1, -2, "AATCG", "AACG", 'local', 1))
+        for _ in range(3):
+            self.assertEqual(expected, render(align(1, -1, -2, "AATCG", "AACG", 'local', 1, cache=cache)))
+        self.assertEqual(2, compute.call_count)
+        align(1, -1, -2, "CIAO", "CIAOCI", 'local', cache=cache)
+        align(1, -1, -2, "ACACACC", "ACA", 'local', cache=cache)
+        self.assertEqual({'hits': 2, 'disk_hits': 0, 'misses': 3, 'entries': 2}, cache.statistics())
+        align(1, -1, -2, "AATCG", "AACG", 'local', 1, cache=cache)  # Removed from memory
+        self.assertEqual(4, cache.misses)
+
+    def test_align_many_cache(self):
+        cache = AlignmentCache()
+        expected = [render(alignments) for alignments in align_many(SEQUENCES, 2, -1, -2, 'global', 1, workers=1)]
+        align_many(SEQUENCES[:3], 2, -1, -2, 'global', 1, workers=1, cache=cache)
+        results = align_many(SEQUENCES, 2, -1, -2, 'global', 1, workers=1, cache=cache)
+        self.assertEqual(expected, [render(alignments) for alignments in results])
+        self.assertEqual((3, len(SEQUENCES)), (cache.hits, cache.misses))
+
+    def test_disk_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = AlignmentCache(directory=directory)
+            expected = render(align(3, -1, -1, "ACACACC", "ACA", 'local', 1, cache=cache))
+            cache = AlignmentCache(directory=directory)
+            self.assertEqual(expected, render(align(3, -1, -1, "ACACACC", "ACA", 'local', 1, cache=cache)))
+            self.assertEqual((0, 1, 0), (cache.hits, cache.disk_hits, cache.misses))
+            size = os.path.getsize(os.path.join(directory, os.listdir(directory)[0]))
+            cache = AlignmentCache(maxsize=0, directory=directory, max_bytes=2 * size)
+            for seq1, seq2 in SEQUENCES[:4]:
+                align(3, -1, -1, seq1, seq2, 'local', cache=cache)
+            files = os.listdir(directory)
+            self.assertLess(len(files), 4)
+            self.assertLessEqual(sum(os.path.getsize(os.path.join(directory, name)) for name in files), 2 * size)
+            cache.clear()
+            self.assertEqual([], os.listdir(directory))
+
+
+class SequenceFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.fasta = os.path.join(self.directory.name, "queries.fa")
+        self.fastq = os.path.join(self.directory.name, "references.fq.gz")
+        with open(self.fasta, 'w') as file:
+            file.write(">q1 first query\nACACA\nCC\n\n>q2\nAATCG\n")
+        with gzip.open(self.fastq, 'wt') as file:
+            file.write("@r1\nACA\n+\nIII\n@r2\nCG\n+r2\n@I\n")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_read_sequences(self):
+        self.assertEqual([("q1", "ACACACC", None), ("q2", "AATCG", None)], list(read_sequences(self.fasta)))
+        self.assertEqual([("r1", "ACA", "III"), ("r2", "CG", "@I")], list(read_sequences(self.fastq)))
+
+    def test_pair_sequences(self):
+        names = [(record1[0], record2[0]) for record1, record2 in pair_sequences(self.fasta, self.fastq, 'query')]
+        self.assertEqual([("q1", "r1"), ("q1", "r2"), ("q2", "r1"), ("q2", "r2")], names)
+        names = [(record1[0], record2[0]) for record1, record2 in pair_sequences(self.fasta, self.fastq, 'paired')]
+        self.assertEqual([("q1", "r1"), ("q2", "r2")], names)
+        names = [(record1[0], record2[0]) for record1, record2 in pair_sequences(self.fasta, None, 'all')]
+        self.assertEqual([("q1", "q2")], names)
+
+    def test_align_files_tsv(self):
+        output = io.StringIO()
+        align_files(self.fasta, self.fastq, output, 3, -1, -1, 'local', 0, chunksize=3)
+        self.assertEqual("query\treference\tscore\tquery_start\tquery_end\treference_start\treference_end\tcigar\n"
+                         "q1\tr1\t9\t0\t3\t0\t3\t3M\n"
+                         "q1\tr2\t3\t1\t2\t0\t1\t1M\n"
+                         "q2\tr1\t5\t0\t2\t0\t3\t1M1D1M\n"
+                         "q2\tr2\t6\t3\t5\t0\t2\t2M\n", output.getvalue())
+
+    def test_align_files_sam(self):
+        output = io.StringIO()
+        align_files(self.fasta, self.fastq, output, 3, -1, -1, 'local', 0, pairing='paired', output_format='sam')
+        self.assertEqual("@HD\tVN:1.6\n@SQ\tSN:r1\tLN:3\n@SQ\tSN:r2\tLN:2\n"
+                         "q1\t0\tr1\t1\t255\t3M4S\t*\t0\t0\tACACACC\t*\tAS:i:9\n"
+                         "q2\t0\tr2\t1\t255\t3S2M\t*\t0\t0\tAATCG\t*\tAS:i:6\n", output.getvalue())
+
+    def test_build_database(self):
+        database = build_database(self.fastq, os.path.join(self.directory.name, "database"))
+        database = SequenceDatabase(database.directory)
+        self.assertEqual((["r1", "r2"], "ACG", 2), (database.names, database.alphabet, len(database)))
+        self.assertEqual(["ACA", "CG"], [database.sequence(k) for k in range(len(database))])
+        self.assertIsInstance(database.sequences, np.memmap)
+
+    def test_score_database(self):
+        references = os.path.join(self.directory.name, "references.fa")
+        sequences = ["GATTACA", "", "TTTTTGATTACA", "CIAOCI", "ACG", "GCATGCTAATCG"]
+        with open(references, 'w') as file:
+            file.write(''.join(f">r{k}\n{sequence}\n" for k, sequence in enumerate(sequences)))
+        database = build_database(references, os.path.join(self.directory.name, "database"))
+        for m, s, g in SCORES:
+            for query in ("AATCG", "CIAO", "GATTACA", ""):
+                expected = [np.max(compute_smith_waterman(m, s, g, query, sequence, 0)[0]) for sequence in sequences]
+                np.testing.assert_array_equal(expected, score_database(m, s, g, query, database))
+                with patch('sequence_alignment.BATCH_CELLS', 8):
+                    np.testing.assert_array_equal(expected, score_database(m, s, g, query, database))
+
+    def test_search_database(self):
+        references = os.path.join(self.directory.name, "references.fa")
+        with open(references, 'w') as file:
+            file.write(">a\nGGGG\n>b\nTTGATTACATT\n>c\nGATTA\n>d\nGATTACA\n")
+        database = build_database(references, os.path.join(self.directory.name, "database"))
+        hits = search_database(1, -1, -2, "GATTACA", database, top=2)
+        self.assertEqual([(1, 7, "7M"), (3, 7, "7M")],
+                         [(k, alignments[0].score, alignments[0].cigar) for k, alignments in hits])
+        hits = search_database(1, -1, -2, "GATTACA", database, top=None, threshold=2)
+        self.assertEqual([1, 3, 2], [k for k, _ in hits])
+        output = io.StringIO()
+        search_files(self.fasta, database, output, 3, -1, -1, top=1)
+        self.assertEqual("query\treference\tscore\tquery_start\tquery_end\treference_start\treference_end\tcigar\n"
+                         "q1\tb\t10\t0\t5\t3\t9\t1M1D4M\n"
+                         "q2\tb\t8\t0\t3\t6\t10\t1M1D2M\n", output.getvalue())
+
+
+class CommandLine(unittest.TestCase):
+
+    def test_import_without_numpy(self):
+        code = "import sys, sequence_alignment; print('numpy' in sys.modules, 'numba' in sys.modules)"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual("False False", result.stdout.strip())
+
+    def test_align_python(self):
+        for seq1, seq2 in SEQUENCES:
+            for m, s, g in SCORES:
+                for algorithm in ('global', 'local'):
+                    for al in (0, 1):
+                        self.assertEqual(render(align(m, s, g, seq1, seq2, algorithm, al, limit=20)),
+                                         render(align_python(m, s, g, seq1, seq2, algorithm, al, limit=20)))
+        matrix = compute_smith_waterman(1, -1, -2, "ACACACC", "ACA", 1)[0]
+        python_matrix = ListMatrix(*matrix.shape)
+        python_matrix.rows = matrix.tolist()
+        score, x, y = max_cells(matrix)
+        self.assertEqual((score, x.tolist(), y.tolist()), python_matrix.max_cells())
+
+    def test_main(self):
+        arguments = ["-m", "1", "-s", "-1", "-i", "-2", "-b", "GATTACA", "-c", "GCATGCT", "-t", "1"]
+        for algorithm in ('global', 'local'):
+            outputs = []
+            for engine in ('auto', 'vectorized'):
+                with patch('sys.stdout', new_callable=io.StringIO) as output:
+                    main(arguments + ["-a", algorithm, "--engine", engine])
+                outputs.append(output.getvalue())
+            self.assertEqual(render(align(1, -1, -2, "GATTACA", "GCATGCT", algorithm, 1)), outputs[0])
+            self.assertEqual(outputs[0], outputs[1])
+        with patch('sys.stdout', new_callable=io.StringIO) as output:
+            main(arguments + ["-a", "local", "--cigar", "--limit", "1"])
+        self.assertEqual("Alignment with score 2: 1-3 2-4 2M identity 100.0%\n", output.getvalue())
+        with patch('sys.stdout', new_callable=io.StringIO) as output:
+            main(arguments + ["-a", "local", "--threads", "0"])
+        self.assertEqual(render(align(1, -1, -2, "GATTACA", "GCATGCT", 'local', 1)), output.getvalue())
+        for options in (["--xdrop", "5", "-w", "2"], ["--xdrop", "5", "--threads", "2"], ["--seed", "3", "--count"],
+                        ["--mode", "score", "-w", "2"], ["-o", "-3", "-e", "-1", "--count"],
+                        ["--band", "2", "--engine", "loop"], ["--engine", "vectorized", "--threads", "2"]):
+            with patch('sys.stderr', new_callable=io.StringIO), self.assertRaises(SystemExit):
+                main(arguments + ["-a", "local"] + options)
+
+    def test_serve(self):
+        requests = io.StringIO('{"m": 1, "s": -1, "g": -2, "sequence1": "AATCG", "sequence2": "AACG", '
+                               '"algorithm": "local", "al": 1, "gapped": true}\n\n'
+                               '{"m": 3, "s": -1, "g": -1, "sequence1": "ACACACC", "sequence2": "ACA", "limit": 1}\n'
+                               'AATCG AACG\n{"m": 1, "s": -1, "g": -2, "sequence1": "A", "sequence2": "A", '
+                               '"algorithm": "semiglobal"}\n'
+                               '{"m": 1e400, "s": -1, "g": -2, "sequence1": "AC", "sequence2": "A"}\n'
+                               '{"m": 1, "s": -1, "g": -2, "sequence1": "A", "sequence2": "A"}\n')
+        output = io.StringIO()
+        serve(requests, output)
+        answers = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(6, len(answers))
+        self.assertEqual([("AA", "AA"), ("CG", "CG")],
+                         [(record['aligned1'], record['aligned2']) for record in answers[0]['alignments']])
+        self.assertEqual([align(3, -1, -1, "ACACACC", "ACA")[0].as_dict()], answers[1]['alignments'])
+        self.assertIn('error', answers[2])
+        self.assertIn('semiglobal', answers[3]['error'])
+        self.assertIn('error', answers[4])
+        self.assertEqual(1, answers[5]['alignments'][0]['score'])
+
+
+class Benchmark(unittest.TestCase):
+
+    def test_generate_pair(self):
+        self.assertEqual(generate_pair('repetitive', 200), generate_pair('repetitive', 200))
+        self.assertNotEqual(generate_pair('random', 200), generate_pair('random', 200, seed=1))
+        self.assertEqual(200, len(generate_pair('random', 200)[0]))
+
+    def test_run_case(self):
+        for mode in ('global-vectorized', 'local-loop', 'global-score', 'global-banded', 'local-banded', 'local-affine',
+                     'local-xdrop', 'local-seed', 'global-out-of-core', 'global-threads', 'local-threads'):
+            result = run_case(mode, 'repetitive', 50)
+            self.assertEqual((mode, 50), (result['mode'], result['length1']))
+            self.assertGreater(result['cells'], 0)
+        self.assertIsNone(run_case('global-score', 'random', 50)['traceback_seconds'])
+        with self.assertRaises(ValueError):
+            run_case('global-gpu', 'random', 50)
+
+    def test_compare_results(self):
+        baseline = [{'mode': 'global-score', 'kind': 'random', 'length1': 100, 'cells_per_second': 1000.0}]
+        slower = [dict(baseline[0], cells_per_second=700.0)]
+        self.assertEqual([(slower[0], baseline[0])], compare_results(slower, baseline, 0.2))
+        self.assertEqual([], compare_results(slower, baseline, 0.5))
+        self.assertEqual([], compare_results([dict(slower[0], kind='repetitive')], baseline))
+
 
 if __name__ == '__main__':
     unittest.main()